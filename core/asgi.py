@@ -9,8 +9,20 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+if settings.AQUECER_WORKERS:
+    from usuarios.aquecimento import aquecer
+
+    aquecer()
+
+# Descarga dos contadores e recálculo da faixa "Em alta" numa thread de cada worker
+from usuarios import tendencias  # noqa: E402
+
+tendencias.habilitar_tarefa()
+
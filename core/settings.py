@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,12 +31,17 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'usuarios.middleware.EstaticosMiddleware',
+    'usuarios.middleware.ControleCargaMiddleware',
+    'usuarios.middleware.InstrumentacaoSQLMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'usuarios.middleware.PerfilamentoMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'usuarios.middleware.PrazoDaViewMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -67,7 +73,10 @@ WSGI_APPLICATION = 'core.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('FACMED_DB', BASE_DIR / 'db.sqlite3'),
+        # Cada transaction.atomic() pega a trava de escrita no BEGIN: duas escritas simultâneas
+        # esperam uma pela outra (timeout) em vez de a segunda falhar com "database is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
     }
 }
 
@@ -111,6 +120,13 @@ STATIC_URL = "static/"
 
 STATIC_ROOT = BASE_DIR / "static"
 
+# collectstatic grava nomes com hash, CSS minificado e variantes .gz; o EstaticosMiddleware
+# serve STATIC_ROOT com cache imutável (usuarios/estaticos.py)
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "usuarios.estaticos.ArmazenamentoEstatico"},
+}
+
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media/"
@@ -121,3 +137,142 @@ MEDIA_ROOT = BASE_DIR / "media/"
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'usuarios.Usuario'
+
+
+# Grade de horários usada na busca de disponibilidade (usuarios/disponibilidade.py)
+AGENDA_HORA_INICIO = 8
+AGENDA_HORA_FIM = 18
+AGENDA_DURACAO_SLOT = 30  # minutos
+AGENDA_HORIZONTE_DIAS = 90
+AGENDA_DIAS_SEMANA = (0, 1, 2, 3, 4)  # segunda a sexta
+
+
+# E-mail: as views só gravam na outbox (NotificacaoEmail); o envio é feito pelo
+# comando `enviar_notificacoes`, que reutiliza uma conexão SMTP por execução.
+EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+DEFAULT_FROM_EMAIL = 'FacMed <nao-responda@facmed.com.br>'
+NOTIFICACOES_LOTE = 100
+NOTIFICACOES_MAX_TENTATIVAS = 5
+NOTIFICACOES_ESPERA_BASE = 30  # segundos; dobra a cada tentativa
+NOTIFICACOES_ESPERA_MAXIMA = 300  # segundos entre tentativas de reabrir o SMTP fora do ar (--continuo)
+
+# Stream SSE de avaliações (usuarios/eventos.py)
+EVENTOS_FILA_MAXIMA = 100  # eventos pendentes por conexão antes de desconectar o cliente lento
+EVENTOS_HEARTBEAT = 15  # segundos
+
+# Instrumentação de SQL por requisição (usuarios/middleware.py): acima destes
+# limites a view é registrada no logger "usuarios.sql".
+SQL_ORCAMENTO_CONSULTAS = 50
+SQL_ORCAMENTO_TEMPO_MS = 250
+SQL_LIMITE_REPETICOES = 10  # mesma consulta repetida N vezes = provável N+1
+SQL_ORCAMENTOS_POR_VIEW = {
+    # 'profissional_detalhes': {'consultas': 20, 'tempo_ms': 100},
+}
+
+# Painel "profissionais parecidos" (usuarios/similares.py, comando calcular_similares)
+SIMILARES_TOP_K = 6
+SIMILARES_PESOS = {'coavaliacao': 0.5, 'especialidade': 0.3, 'cidade': 0.1, 'preco': 0.1}
+SIMILARES_JANELA_PRECO = 10  # vizinhos de preço considerados como candidatos sem coavaliação
+SIMILARES_MAX_AVALIACOES_CLIENTE = 200
+SIMILARES_ENCOLHIMENTO = 3  # reduz o peso de pares com poucos clientes em comum
+
+# Ordenação "mais bem avaliados" (usuarios/ranking.py, comando calcular_ranking)
+RANKING_PRIOR_NOTA = 4.0  # nota assumida para quem tem poucas avaliações
+RANKING_PRIOR_RECOMENDA = 0.8
+RANKING_PESO_PRIOR = 10  # o prior vale como 10 avaliações
+RANKING_MEIA_VIDA_DIAS = 365  # uma avaliação perde metade do peso por ano
+RANKING_PESO_RECOMENDA = 0.3
+
+# Rollups de avaliações do painel do profissional (usuarios/resumos.py, comando reconstruir_resumos)
+RESUMOS_DIAS_DIARIO = 90  # linhas diárias mais antigas são podadas; as mensais ficam
+
+# Índice de CEPs gerado por `manage.py compilar_ceps` (usuarios/ceps.py)
+CEP_INDICE = os.environ.get('FACMED_CEP_INDICE', BASE_DIR / 'cep.idx')
+
+# Exportações em streaming (usuarios/exportacao.py, comando exportar_dados)
+EXPORTACAO_TAMANHO_LOTE = 2000  # linhas por fetchmany do cursor
+
+# Arquivamento frio (usuarios/arquivo.py, comando arquivar)
+ARQUIVO_DIAS = 365  # serviços encerrados e respostas mais antigos que isto vão para as tabelas arquivadas
+ARQUIVO_LOTE = 500  # linhas movidas por transação
+
+# Moderação em massa (usuarios/moderacao.py, comando moderar e ações do admin)
+MODERACAO_LOTE = 1000  # linhas apagadas por transação
+
+# Threads de respostas (usuarios/respostas.py)
+RESPOSTAS_PREVIA = 3  # respostas mostradas por avaliação; o resto vem pelo cursor
+
+# Faixa "Em alta" da página inicial (usuarios/tendencias.py, comando calcular_tendencias)
+TENDENCIAS_BALDE = 3600  # segundos por balde de contadores
+TENDENCIAS_JANELA = 7 * 24  # baldes considerados (7 dias); os mais antigos são podados
+TENDENCIAS_MEIA_VIDA = 24 * 3600  # segundos para uma avaliação ou agendamento valer metade
+TENDENCIAS_PESOS = {'avaliacao': 1.0, 'agendamento': 1.0}
+TENDENCIAS_TOP_K = 6
+TENDENCIAS_DESCARGA = 10  # segundos entre gravações dos contadores em memória de cada worker
+TENDENCIAS_DESCARGA_MAXIMO = 1000  # ou antes, com este número de contadores pendentes
+TENDENCIAS_INTERVALO = 60  # segundos entre recálculos do top-K e entre leituras dele por worker
+
+# Cache compartilhado entre os workers: arquivo SQLite em WAL (usuarios/cache_sqlite.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'usuarios.cache_sqlite.CacheSQLite',
+        'LOCATION': os.environ.get('FACMED_CACHE', BASE_DIR / 'cache.sqlite3'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'CULL_FREQUENCY': 10,  # acima do limite, apaga 1/10 das entradas menos usadas
+        },
+    },
+}
+
+# Os testes usam um cache.sqlite3 temporário e estáticos sem manifesto (core/testes.py)
+TEST_RUNNER = 'core.testes.ExecutorDeTestes'
+
+# Idempotency-Key nas views de escrita (usuarios/idempotencia.py)
+IDEMPOTENCIA_VALIDADE = 24 * 3600  # segundos que a resposta original fica guardada
+IDEMPOTENCIA_TRAVA = 60  # segundos que uma tentativa em andamento bloqueia as repetições
+
+# Dados de referência em memória (usuarios/referencia.py): atraso máximo para os outros workers verem
+# uma alteração em estados, cidades ou especialidades
+REFERENCIA_INTERVALO = 5  # segundos
+
+# core/wsgi.py e core/asgi.py aquecem o worker antes da primeira requisição (usuarios/aquecimento.py)
+AQUECER_WORKERS = os.environ.get('FACMED_AQUECER', '1') != '0'
+
+# Admin (usuarios/admin.py): acima disto, listagens sem filtro mostram o total estimado pelo maior pk
+ADMIN_LIMITE_CONTAGEM_EXATA = 10000
+
+# Controle de carga por rota (usuarios/admissao.py, ControleCargaMiddleware). Valores por worker:
+# concorrencia = requisições atendidas ao mesmo tempo; fila = quantas podem esperar uma vaga, por
+# até `espera` segundos; orcamento = segundos da chegada ao fim da view (a espera conta). Sob WSGI
+# cada requisição na fila segura uma thread: mantenha concorrencia + fila das escritas abaixo de
+# --threads para sempre sobrar thread para as leituras.
+CARGA_ATIVA = os.environ.get('FACMED_CONTROLE_CARGA', '1') != '0'
+CARGA_POOLS = {
+    'leitura': {'concorrencia': 32, 'fila': 64, 'espera': 2, 'orcamento': 10},
+    'escrita': {'concorrencia': 2, 'fila': 2, 'espera': 1, 'orcamento': 3},
+    'exportacao': {'concorrencia': 2, 'fila': 0},
+    # Sem orçamento: a moderação em massa roda na requisição e não pode parar no meio dos lotes
+    'admin': {'concorrencia': 2, 'fila': 2, 'espera': 5},
+}
+CARGA_ROTAS = {
+    # Login e logout só gravam a sessão: ficam com as leituras para entrar mesmo com as escritas lotadas
+    'login': {'pool': 'leitura'},
+    'logout': {'pool': 'leitura'},
+    'exportar_dados': {'pool': 'exportacao'},
+    'exportar_profissional': {'pool': 'exportacao'},
+    'admin:*': {'pool': 'admin'},
+    # Conexões longas (SSE) e as próprias métricas ficam fora do controle
+    'eventos_profissional': {'pool': None},
+    'metricas_carga': {'pool': None},
+}
+CARGA_RETRY_AFTER_MAXIMO = 30  # segundos
+CARGA_INTERVALO_LOG = 10  # segundos entre avisos de recusas no logger "usuarios.carga"
+CARGA_METRICAS_IPS = ['127.0.0.1', '::1']  # além do staff, quem pode ler /carga/metricas/
+
+# Perfilamento sob demanda (usuarios/middleware.py): staff com ?_perfil=1 ou cabeçalho
+# X-Perfil com token de `manage.py token_perfil`. Capturas ficam em MEDIA_ROOT/perfis.
+PERFIL_VALIDADE_TOKEN = 3600  # segundos
+PERFIL_INTERVALO_AMOSTRAGEM = 0.001  # segundos entre amostras de pilha
+PERFIL_MAXIMO_CAPTURAS = 200  # a cada captura nova as mais antigas além deste número são apagadas
+PERFIL_DIAS_CAPTURAS = 7  # assim como as com mais dias que isto
@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class ExecutorDeTestes(DiscoverRunner):
+    """
+    Roda os testes com o cache SQLite num diretório temporário, para que nenhum teste leia ou
+    apague as entradas do cache.sqlite3 de quem está desenvolvendo, e com os estáticos sem
+    manifesto (sem collectstatic o ArmazenamentoEstatico recusa os nomes, como em produção).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._pasta_cache = tempfile.mkdtemp(prefix='facmed-cache-')
+        caches = {nome: dict(config) for nome, config in settings.CACHES.items()}
+        caches['default']['LOCATION'] = os.path.join(self._pasta_cache, 'cache.sqlite3')
+        armazenamentos = {**settings.STORAGES, 'staticfiles': {
+            'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+        }}
+        self._configuracao = override_settings(CACHES=caches, STORAGES=armazenamentos)
+        self._configuracao.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._configuracao.disable()
+        shutil.rmtree(self._pasta_cache, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
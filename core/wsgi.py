@@ -9,8 +9,20 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+if settings.AQUECER_WORKERS:
+    from usuarios.aquecimento import aquecer
+
+    aquecer()
+
+# Descarga dos contadores e recálculo da faixa "Em alta" numa thread de cada worker
+from usuarios import tendencias  # noqa: E402
+
+tendencias.habilitar_tarefa()
+
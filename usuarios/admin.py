@@ -1,12 +1,310 @@
-from django.contrib import admin
-
-from . import models
-
-admin.site.register(models.Estado)
-admin.site.register(models.Cidade)
-admin.site.register(models.Endereco)
-admin.site.register(models.Usuario)
-admin.site.register(models.Especialidade)
-admin.site.register(models.Profissional)
-admin.site.register(models.Servico) 
-admin.site.register(models.Avaliacao)
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth.models import Permission
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Max, Min, Q
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from . import models, moderacao, perfilamento
+
+
+class ContagemEstimadaPaginator(Paginator):
+    """
+    Sem filtro nem busca, tabelas com mais de ADMIN_LIMITE_CONTAGEM_EXATA linhas usam o total de
+    linhas que o ANALYZE gravou em sqlite_stat1 em vez de um COUNT(*) completo. O valor é limitado
+    pela faixa de pks atual; sem estatística (ou abaixo do limite) a contagem é exata.
+    """
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where and connection.vendor == 'sqlite':
+            limite = getattr(settings, 'ADMIN_LIMITE_CONTAGEM_EXATA', 10000)
+            modelo = self.object_list.model
+            estimativa = 0
+            with connection.cursor() as cursor:
+                # sqlite_stat1 só existe depois do primeiro ANALYZE
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+                if cursor.fetchone():
+                    # O primeiro número de cada linha é o total de linhas da tabela no último ANALYZE
+                    cursor.execute(
+                        'SELECT max(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s',
+                        [modelo._meta.db_table],
+                    )
+                    estimativa = cursor.fetchone()[0] or 0
+            if estimativa > limite:
+                # Estatística velha não passa da faixa de pks (MIN/MAX são buscas no índice)
+                faixa = modelo._default_manager.aggregate(menor=Min('pk'), maior=Max('pk'))
+                if faixa['maior'] is not None:
+                    estimativa = min(estimativa, faixa['maior'] - faixa['menor'] + 1)
+                if estimativa > limite:
+                    return estimativa
+        return super().count
+
+
+class TabelaGrandeAdmin(admin.ModelAdmin):
+    """
+    Base das tabelas que crescem com o uso: sem COUNT(*) completo a cada listagem e com busca
+    exata por colunas indexadas. Um search_field terminado em "username" acha o usuário pelo
+    índice do username e segue as chaves estrangeiras por subconsultas, em vez de um JOIN com
+    LIKE sobre todas as linhas.
+    """
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    # Hierarquia de datas montada a partir de MIN/MAX (templatetags/admin_tabelas.py)
+    change_list_template = 'admin/change_list_tabela_grande.html'
+
+    def _filtro_usuario(self, caminho, usuarios):
+        partes = caminho.split('__')[:-1]
+        if not partes:
+            return Q(pk__in=usuarios)
+        modelos = [self.model]
+        for parte in partes[:-1]:
+            modelos.append(modelos[-1]._meta.get_field(parte).related_model)
+        # profissional__usuario__username -> profissional__in=Profissional.filter(usuario__in=...)
+        for modelo, parte in reversed(list(zip(modelos[1:], partes[1:]))):
+            usuarios = modelo._default_manager.filter(**{f'{parte}__in': usuarios}).values('pk')
+        return Q(**{f'{partes[0]}__in': usuarios})
+
+    def get_search_results(self, request, queryset, search_term):
+        termo = search_term.strip()
+        if not termo:
+            return queryset, False
+        usuarios = models.Usuario.objects.filter(username=termo).values('pk')
+        filtro = Q(pk__in=[])
+        for campo in self.get_search_fields(request):
+            if campo.endswith('username'):
+                filtro |= self._filtro_usuario(campo, usuarios)
+                continue
+            try:
+                filtro |= Q(**{campo: self.model._meta.get_field(campo).to_python(termo)})
+            except ValidationError:
+                pass  # texto numa coluna numérica: não casa nada
+        return queryset.filter(filtro), False
+
+
+class ModeracaoMixin:
+    """
+    Ações de moderação em massa (usuarios/moderacao.py): lotes com DELETE direto e agregados
+    corrigidos uma vez no fim, em vez do "apagar selecionados" do admin, que apaga e dispara os
+    sinais linha a linha. Combine com os filtros, a busca e a hierarquia de datas da listagem e
+    "selecionar todos" para moderar por período ou por autor.
+    """
+    campo_autor = 'autor'
+
+    def _consultas(self, queryset):
+        """Argumentos de moderacao.executar() para apagar as linhas selecionadas."""
+        raise NotImplementedError
+
+    def _confirmar(self, request, queryset, autores=None):
+        return TemplateResponse(request, 'admin/moderacao_confirmar.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Moderação em massa',
+            'total': queryset.count(),
+            'autores': autores,
+            'selecionadas': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'acao': request.POST['action'],
+        })
+
+    def _executar(self, request, **consultas):
+        relatorio = moderacao.executar(**consultas)
+        self.message_user(
+            request,
+            f'{relatorio["avaliacoes"]} avaliações e {relatorio["comentarios"]} respostas apagadas '
+            f'({relatorio["linhas_por_segundo"]:.0f} linhas/s); {relatorio["profissionais"]} profissionais recalculados.',
+            messages.SUCCESS,
+        )
+
+    @admin.action(description='Moderar: apagar selecionados em lote', permissions=['delete'])
+    def moderar_selecionados(self, request, queryset):
+        if request.POST.get('confirmar') != 'sim':
+            return self._confirmar(request, queryset)
+        self._executar(request, **self._consultas(queryset))
+
+    @admin.action(description='Moderar: apagar tudo dos autores selecionados', permissions=['delete'])
+    def moderar_autores(self, request, queryset):
+        autores = sorted(set(queryset.values_list(self.campo_autor, flat=True)))
+        if request.POST.get('confirmar') != 'sim':
+            nomes = models.Usuario.objects.filter(pk__in=autores).values_list('username', flat=True)
+            return self._confirmar(request, queryset, autores=list(nomes))
+        self._executar(request, avaliacoes=models.Avaliacao.objects.filter(cliente__in=autores), comentarios=[
+            modelo.objects.filter(autor__in=autores) for modelo in (models.Comentario, models.ComentarioArquivado)
+        ])
+
+
+class NotaFilter(admin.SimpleListFilter):
+    # O filtro padrão de um IntegerField faz SELECT DISTINCT na tabela inteira para listar as opções
+    title = 'nota'
+    parameter_name = 'nota'
+
+    def lookups(self, request, model_admin):
+        return [(str(nota), '★' * nota) for nota in range(5, 0, -1)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(nota=self.value())
+        return queryset
+
+
+@admin.register(models.Estado)
+class EstadoAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'sigla']
+    search_fields = ['nome', '=sigla']
+
+
+@admin.register(models.Cidade)
+class CidadeAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'estado']
+    list_select_related = ['estado']
+    list_filter = ['estado']
+    search_fields = ['^nome']
+    autocomplete_fields = ['estado']
+
+
+@admin.register(models.Especialidade)
+class EspecialidadeAdmin(admin.ModelAdmin):
+    list_display = ['nome']
+    search_fields = ['^nome']
+
+
+@admin.register(models.Endereco)
+class EnderecoAdmin(TabelaGrandeAdmin):
+    list_display = ['id', 'cidade', 'rua', 'numero', 'bairro', 'cep']
+    list_select_related = ['cidade__estado']
+    search_fields = ['cep']
+    autocomplete_fields = ['cidade']
+
+
+@admin.register(models.Usuario)
+class UsuarioAdmin(TabelaGrandeAdmin):
+    list_display = ['username', 'email', 'first_name', 'last_name', 'is_staff', 'date_joined']
+    list_filter = ['is_staff', 'is_active']
+    search_fields = ['username', 'email']
+    date_hierarchy = 'date_joined'
+    raw_id_fields = ['endereco']
+    filter_horizontal = ['groups', 'user_permissions']
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        # O rótulo de cada permissão cita o content type: sem isto é uma consulta por permissão
+        if db_field.name == 'user_permissions':
+            kwargs['queryset'] = Permission.objects.select_related('content_type')
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
+
+@admin.register(models.Profissional)
+class ProfissionalAdmin(TabelaGrandeAdmin):
+    list_display = ['id', 'usuario', 'especialidade', 'CRM', 'preco_servico', 'atualizado_em']
+    list_select_related = ['usuario', 'especialidade']
+    list_filter = ['especialidade']
+    search_fields = ['usuario__username', 'CRM']
+    raw_id_fields = ['usuario']
+    autocomplete_fields = ['especialidade']
+    readonly_fields = ['versao', 'atualizado_em']
+
+
+@admin.register(models.Servico)
+class ServicoAdmin(TabelaGrandeAdmin):
+    list_display = ['id', 'profissional', 'cliente', 'status', 'data_agendamento']
+    list_select_related = ['profissional__usuario', 'profissional__especialidade', 'cliente']
+    list_filter = ['status']
+    search_fields = ['cliente__username', 'profissional__usuario__username']
+    date_hierarchy = 'data_agendamento'
+    raw_id_fields = ['profissional', 'cliente']
+
+
+@admin.register(models.Avaliacao)
+class AvaliacaoAdmin(ModeracaoMixin, TabelaGrandeAdmin):
+    list_display = ['id', 'profissional', 'cliente', 'nota', 'recomenda', 'data_avaliacao']
+    list_select_related = ['profissional__usuario', 'profissional__especialidade', 'cliente']
+    list_filter = [NotaFilter, 'recomenda']
+    search_fields = ['cliente__username', 'profissional__usuario__username']
+    date_hierarchy = 'data_avaliacao'
+    raw_id_fields = ['profissional', 'cliente', 'servico']
+    actions = ['moderar_selecionados', 'moderar_autores']
+    campo_autor = 'cliente'
+
+    def _consultas(self, queryset):
+        return {'avaliacoes': queryset}
+
+
+@admin.register(models.Comentario)
+class ComentarioAdmin(ModeracaoMixin, TabelaGrandeAdmin):
+    list_display = ['id', 'avaliacao_id', 'autor', 'data_comentario']
+    list_select_related = ['autor']
+    search_fields = ['autor__username']
+    date_hierarchy = 'data_comentario'
+    raw_id_fields = ['avaliacao', 'autor']
+    actions = ['moderar_selecionados', 'moderar_autores']
+
+    def _consultas(self, queryset):
+        return {'comentarios': [queryset]}
+
+
+class ArquivoAdmin(TabelaGrandeAdmin):
+    # Linhas movidas pelo comando arquivar: só leitura. Os ids vêm espalhados da tabela quente,
+    # então a listagem conta exato
+    paginator = Paginator
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(models.ServicoArquivado)
+class ServicoArquivadoAdmin(ArquivoAdmin):
+    list_display = ['id', 'profissional', 'cliente', 'status', 'data_agendamento']
+    list_select_related = ['profissional__usuario', 'profissional__especialidade', 'cliente']
+    search_fields = ['cliente__username', 'profissional__usuario__username']
+    raw_id_fields = ['profissional', 'cliente']
+
+
+@admin.register(models.ComentarioArquivado)
+class ComentarioArquivadoAdmin(ModeracaoMixin, ArquivoAdmin):
+    list_display = ['id', 'avaliacao_id', 'autor', 'data_comentario']
+    list_select_related = ['autor']
+    search_fields = ['autor__username']
+    raw_id_fields = ['avaliacao', 'autor']
+    actions = ['moderar_selecionados', 'moderar_autores']
+
+    def _consultas(self, queryset):
+        return {'comentarios': [queryset]}
+
+
+@admin.register(models.NotificacaoEmail)
+class NotificacaoEmailAdmin(TabelaGrandeAdmin):
+    list_display = ['assunto', 'destinatario', 'status', 'tentativas', 'criado_em', 'enviado_em']
+    list_filter = ['status']
+    search_fields = ['destinatario']
+
+
+@admin.register(models.CapturaPerfil)
+class CapturaPerfilAdmin(admin.ModelAdmin):
+    # Escopo "loop": captura sob ASGI, que inclui tudo o que rodou no event loop no período
+    list_display = ['rota', 'metodo', 'status_code', 'duracao_ms', 'amostras', 'escopo', 'usuario', 'criado_em']
+    list_filter = ['rota', 'metodo', 'escopo']
+    search_fields = ['caminho']
+    list_select_related = ['usuario']
+    readonly_fields = ['rota', 'caminho', 'metodo', 'status_code', 'usuario', 'duracao_ms', 'amostras', 'escopo',
+                       'arquivo_pstats', 'arquivo_pilhas', 'criado_em', 'funcoes_mais_custosas']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Funções mais custosas (tempo acumulado)')
+    def funcoes_mais_custosas(self, obj):
+        try:
+            return format_html('<pre>{}</pre>', perfilamento.resumo(obj.arquivo_pstats.path))
+        except (OSError, ValueError, EOFError):
+            return 'Arquivo de perfil indisponível.'
@@ -0,0 +1,288 @@
+"""
+Controle de admissão por rota: limite de concorrência, fila curta e orçamento de tempo.
+
+Quando as escritas se acumulam atrás da trava de escrita do SQLite, cada uma segura uma thread
+(ou, no ASGI, a thread única das views síncronas) enquanto espera. Sem limite elas tomam o worker
+inteiro, e páginas baratas como login e carregar_cidades também passam a esperar. Aqui cada rota
+pertence a um pool (CARGA_POOLS) com `concorrencia` vagas e uma fila de até `fila` requisições,
+que esperam no máximo `espera` segundos. As escritas ficam num pool separado das leituras. Rota
+sem configuração em CARGA_ROTAS (pelo nome, ou 'namespace:*' para todo um namespace) vai para
+'leitura' (GET/HEAD/OPTIONS) ou 'escrita' (o resto).
+Com a fila cheia, ou depois de esperar demais, a resposta é 503 com Retry-After, sem ler a
+sessão nem tocar no banco. O Retry-After vem da fila atual e do tempo médio de atendimento.
+
+O `orcamento` (segundos) vale da chegada ao fim da view. A espera na fila conta nele, e o
+wrapper de SQL recusa consultas depois do prazo. No SQLite, o busy_timeout das escritas passa a
+ser o que resta do orçamento, em vez dos 5s padrão: uma escrita presa atrás da trava desiste a
+tempo e também vira 503. Os pools e as métricas são por processo (metricas(), exposto em
+/carga/metricas/).
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.signals import connection_created
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger('usuarios.carga')
+
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+INSTRUCOES_ESCRITA = ('BEGIN', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+BUSY_TIMEOUT_PADRAO = 5.0  # o do módulo sqlite3 quando OPTIONS não define 'timeout'
+
+_prazo = ContextVar('prazo_requisicao', default=None)
+
+
+class OrcamentoEsgotado(Exception):
+    """A requisição passou do orçamento de tempo da rota."""
+
+
+class Pool:
+    """Semáforo com fila FIFO limitada, usável por threads e por corrotinas."""
+
+    def __init__(self, nome, concorrencia, fila=0, espera=0, orcamento=None):
+        self.nome = nome
+        self.concorrencia = concorrencia
+        self.fila = fila
+        self.espera = espera
+        self.orcamento = orcamento
+        self._trava = threading.Lock()
+        self._esperando = deque()
+        self.ativos = 0
+        self.maior_fila = 0
+        self.aceitas = 0
+        self.recusadas = {'fila_cheia': 0, 'espera': 0, 'orcamento': 0}
+        self.espera_total = 0.0
+        self.atendimento_medio = 0.0  # média móvel exponencial, em segundos
+
+    def _tentar(self, ficha):
+        # Chamado com a trava: entra, recusa ou põe a ficha no fim da fila
+        if self.ativos < self.concorrencia and not self._esperando:
+            self.ativos += 1
+            self.aceitas += 1
+            return True
+        if len(self._esperando) >= self.fila:
+            self.recusadas['fila_cheia'] += 1
+            return False
+        self._esperando.append(ficha)
+        self.maior_fila = max(self.maior_fila, len(self._esperando))
+        return None
+
+    def _desistir(self, ficha, esperou):
+        # Depois do timeout: se a ficha ainda está na fila, sai recusada; se não, a vaga chegou no meio
+        with self._trava:
+            self.espera_total += esperou
+            try:
+                self._esperando.remove(ficha)
+            except ValueError:
+                self.aceitas += 1
+                return True
+            self.recusadas['espera'] += 1
+            return False
+
+    def entrar(self, espera):
+        """Ocupa uma vaga esperando até `espera` segundos; False se foi recusada."""
+        ficha = threading.Event()
+        with self._trava:
+            resultado = self._tentar(ficha)
+        if resultado is not None:
+            return resultado
+        inicio = time.monotonic()
+        ficha.wait(espera)
+        return self._desistir(ficha, time.monotonic() - inicio)
+
+    async def aentrar(self, espera):
+        """entrar() para o event loop: a espera é uma corrotina, não uma thread parada."""
+        loop = asyncio.get_running_loop()
+        ficha = (loop, loop.create_future())
+        with self._trava:
+            resultado = self._tentar(ficha)
+        if resultado is not None:
+            return resultado
+        inicio = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(ficha[1]), espera)
+        except asyncio.TimeoutError:
+            pass
+        return self._desistir(ficha, time.monotonic() - inicio)
+
+    def sair(self, duracao):
+        """Libera a vaga; se há fila, ela passa direto para a primeira ficha."""
+        with self._trava:
+            self.atendimento_medio = duracao if not self.atendimento_medio else (
+                0.8 * self.atendimento_medio + 0.2 * duracao
+            )
+            ficha = self._esperando.popleft() if self._esperando else None
+            if ficha is None:
+                self.ativos -= 1
+        if isinstance(ficha, threading.Event):
+            ficha.set()
+        elif ficha is not None:
+            loop, futuro = ficha
+            loop.call_soon_threadsafe(_conceder, futuro)
+
+    def retry_after(self):
+        """Segundos estimados até a fila atual andar (pelo menos 1)."""
+        estimativa = self.atendimento_medio * (len(self._esperando) + 1) / max(self.concorrencia, 1)
+        return min(max(1, math.ceil(estimativa)), getattr(settings, 'CARGA_RETRY_AFTER_MAXIMO', 30))
+
+    def metricas(self):
+        with self._trava:
+            return {
+                'concorrencia': self.concorrencia,
+                'ativos': self.ativos,
+                'fila': len(self._esperando),
+                'fila_maxima': self.fila,
+                'maior_fila': self.maior_fila,
+                'aceitas': self.aceitas,
+                'recusadas': dict(self.recusadas),
+                'espera_total_s': round(self.espera_total, 3),
+                'atendimento_medio_ms': round(self.atendimento_medio * 1000, 2),
+            }
+
+
+def _conceder(futuro):
+    if not futuro.done():
+        futuro.set_result(True)
+
+
+_trava_pools = threading.Lock()
+_pools = {}
+
+
+def ativo():
+    return getattr(settings, 'CARGA_ATIVA', True)
+
+
+def pool(nome):
+    """Pool do processo pelo nome, criado na primeira vez a partir de CARGA_POOLS."""
+    atual = _pools.get(nome)
+    if atual is not None:
+        return atual
+    with _trava_pools:
+        if nome not in _pools:
+            _pools[nome] = Pool(nome, **getattr(settings, 'CARGA_POOLS', {})[nome])
+        return _pools[nome]
+
+
+def reiniciar():
+    """Descarta pools e métricas (depois de mudar CARGA_POOLS, e nos testes)."""
+    with _trava_pools:
+        _pools.clear()
+
+
+def para(request):
+    """(pool, orçamento em segundos) da requisição; pool None fica fora do controle."""
+    try:
+        rota = resolve(request.path_info)
+    except Resolver404:
+        rota = None
+    rotas = getattr(settings, 'CARGA_ROTAS', {})
+    configuracao = {}
+    if rota is not None:
+        # Sem entrada para o nome da rota, vale a do namespace ('admin:*')
+        configuracao = rotas.get(rota.view_name, rotas.get(f'{rota.namespace}:*', {}))
+    nome = configuracao.get('pool', 'leitura' if request.method in METODOS_SEGUROS else 'escrita')
+    if nome is None:
+        return None, None
+    escolhido = pool(nome)
+    return escolhido, configuracao.get('orcamento', escolhido.orcamento)
+
+
+def recusar(escolhido, motivo=None):
+    """503 com Retry-After; `motivo` conta a recusa que não passou pela fila (orçamento)."""
+    if motivo:
+        with escolhido._trava:
+            escolhido.recusadas[motivo] += 1
+    _registrar_recusa()
+    resposta = JsonResponse(
+        {'status': 'error', 'message': 'Servidor ocupado, tente novamente em instantes'}, status=503,
+    )
+    resposta['Retry-After'] = str(escolhido.retry_after())
+    resposta['X-Carga-Pool'] = escolhido.nome
+    return resposta
+
+
+_recusas_no_intervalo = 0
+_registrado_em = time.monotonic()
+
+
+def _registrar_recusa():
+    # Um aviso por CARGA_INTERVALO_LOG segundos com as recusas acumuladas, não um por requisição
+    global _recusas_no_intervalo, _registrado_em
+    with _trava_pools:
+        _recusas_no_intervalo += 1
+        decorrido = time.monotonic() - _registrado_em
+        if decorrido < getattr(settings, 'CARGA_INTERVALO_LOG', 10):
+            return
+        recusas, _recusas_no_intervalo, _registrado_em = _recusas_no_intervalo, 0, time.monotonic()
+    logger.warning(
+        'Carga: %d requisições recusadas nos últimos %.0fs; pools: %s', recusas, decorrido,
+        {nome: (p.ativos, len(p._esperando)) for nome, p in list(_pools.items())},
+    )
+
+
+def metricas():
+    return {'pid': os.getpid(), 'pools': {nome: p.metricas() for nome, p in list(_pools.items())}}
+
+
+# Prazo da requisição atual, lido pelo wrapper de SQL (também nas threads do sync_to_async)
+
+def definir_prazo(prazo):
+    return _prazo.set(prazo)
+
+
+def limpar_prazo(token):
+    _prazo.reset(token)
+
+
+def esgotou(excecao):
+    """Exceção da view que significa orçamento estourado (inclusive a trava do SQLite)."""
+    if isinstance(excecao, OrcamentoEsgotado):
+        return True
+    return (
+        isinstance(excecao, OperationalError) and _prazo.get() is not None
+        and 'database is locked' in str(excecao)
+    )
+
+
+def _busy_timeout_padrao(conexao):
+    return conexao.settings_dict.get('OPTIONS', {}).get('timeout', BUSY_TIMEOUT_PADRAO)
+
+
+def _ajustar_busy_timeout(conexao, segundos):
+    conexao.connection.execute(f'PRAGMA busy_timeout = {max(int(segundos * 1000), 1)}')
+
+
+def _wrapper_prazo(execute, sql, params, many, context):
+    prazo = _prazo.get()
+    conexao = context['connection']
+    if prazo is None:
+        if getattr(conexao, '_busy_timeout_do_prazo', False):
+            _ajustar_busy_timeout(conexao, _busy_timeout_padrao(conexao))
+            conexao._busy_timeout_do_prazo = False
+        return execute(sql, params, many, context)
+    restante = prazo - time.monotonic()
+    if restante <= 0:
+        raise OrcamentoEsgotado(f'orçamento esgotado antes de: {sql[:80]}')
+    if conexao.vendor == 'sqlite' and sql.lstrip()[:7].upper().startswith(INSTRUCOES_ESCRITA):
+        # A espera pela trava de escrita não passa do que sobra do orçamento
+        _ajustar_busy_timeout(conexao, min(restante, _busy_timeout_padrao(conexao)))
+        conexao._busy_timeout_do_prazo = True
+    return execute(sql, params, many, context)
+
+
+def instalar_wrapper(connection, **kwargs):
+    if _wrapper_prazo not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_wrapper_prazo)
+
+
+connection_created.connect(instalar_wrapper)
@@ -0,0 +1,75 @@
+"""
+Aquecimento do worker: o que a primeira requisição de um processo novo pagaria sozinha.
+
+Chamado por core/wsgi.py e core/asgi.py logo depois de montar a aplicação, quando
+AQUECER_WORKERS está ligado. Cada etapa é independente: uma falha (banco ainda sem migrate, por
+exemplo) só vai para o log e o worker sobe do mesmo jeito. Com `gunicorn --preload` o aquecimento
+roda uma vez no processo mestre e os workers herdam tudo no fork; por isso as conexões abertas
+aqui são fechadas no final.
+"""
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver, reverse
+from django.utils import translation
+
+from . import ceps, referencia, tendencias
+
+logger = logging.getLogger('usuarios.aquecimento')
+
+
+def _urls():
+    get_resolver().url_patterns  # importa usuarios.urls, as views e os formulários
+    reverse('index')  # monta os dicionários de reverse
+
+
+def _templates():
+    # Só os templates do projeto: os do admin ficam para a primeira visita do staff
+    pasta = os.path.join(apps.get_app_config('usuarios').path, 'templates')
+    motor = engines['django']
+    total = 0
+    for raiz, _, arquivos in os.walk(pasta):
+        for arquivo in arquivos:
+            if arquivo.endswith('.html'):
+                motor.get_template(os.path.relpath(os.path.join(raiz, arquivo), pasta))
+                total += 1
+    return total
+
+
+def _estaticos():
+    staticfiles_storage.url('css/styles.css')  # lê o manifesto do collectstatic
+
+
+ETAPAS = [
+    ('urls', _urls),
+    ('traducoes', lambda: translation.activate(settings.LANGUAGE_CODE)),
+    ('referencia', referencia.dados),
+    ('tendencias', tendencias.em_alta),
+    ('ceps', ceps.indice),
+    ('templates', _templates),
+    ('estaticos', _estaticos),
+]
+
+
+def aquecer():
+    """Roda as etapas e devolve {etapa: milissegundos}; as que falharam ficam com None."""
+    tempos = {}
+    for nome, etapa in ETAPAS:
+        inicio = time.perf_counter()
+        try:
+            etapa()
+        except Exception:
+            logger.warning('Aquecimento: etapa %s falhou', nome, exc_info=True)
+            tempos[nome] = None
+        else:
+            tempos[nome] = round((time.perf_counter() - inicio) * 1000, 1)
+    translation.deactivate()
+    connections.close_all()
+    logger.info('Worker aquecido: %s', tempos)
+    return tempos
@@ -0,0 +1,117 @@
+"""
+Arquivamento frio de serviços encerrados e respostas antigas.
+
+As consultas quentes (agenda, avaliações recentes, respostas novas) só tocam dados recentes, mas
+as tabelas de serviços e comentários crescem para sempre. O comando arquivar move, em lotes
+curtos (uma transação por lote, então a trava de escrita do SQLite dura pouco), os serviços
+REALIZADO/CANCELADO agendados antes do corte e as respostas anteriores ao corte em avaliações
+também anteriores a ele para ServicoArquivado e ComentarioArquivado, que mantêm os ids originais
+e só o índice das chaves estrangeiras. As leituras das páginas, da exportação e dos rollups
+juntam as duas tabelas.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Comentario, ComentarioArquivado, Servico, ServicoArquivado
+
+STATUS_ARQUIVAVEIS = ('REALIZADO', 'CANCELADO')
+
+
+def corte(dias=None):
+    if dias is None:
+        dias = getattr(settings, 'ARQUIVO_DIAS', 365)
+    return timezone.now() - timedelta(days=dias)
+
+
+def _mover(quente, frio, ids):
+    colunas = ', '.join(f'"{campo.column}"' for campo in frio._meta.concrete_fields)
+    marcadores = ', '.join(['%s'] * len(ids))
+    # SQL direto: sem instanciar modelos e sem os sinais de exclusão (arquivar não é apagar)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {frio._meta.db_table} ({colunas}) '
+            f'SELECT {colunas} FROM {quente._meta.db_table} WHERE id IN ({marcadores})',
+            ids,
+        )
+        cursor.execute(f'DELETE FROM {quente._meta.db_table} WHERE id IN ({marcadores})', ids)
+
+
+def _arquivar(consulta, quente, frio, lote, limite, pausa):
+    lote = lote or getattr(settings, 'ARQUIVO_LOTE', 500)
+    total = ultimo = 0
+    while limite is None or total < limite:
+        tamanho = lote if limite is None else min(lote, limite - total)
+        ids = list(consulta.filter(pk__gt=ultimo).order_by('pk').values_list('pk', flat=True)[:tamanho])
+        if not ids:
+            break
+        _mover(quente, frio, ids)
+        total += len(ids)
+        ultimo = ids[-1]
+        if pausa:
+            time.sleep(pausa)  # deixa as escritas das views passarem entre os lotes
+    return total
+
+
+def arquivar_servicos(data_corte, lote=None, limite=None, pausa=0):
+    consulta = Servico.objects.filter(status__in=STATUS_ARQUIVAVEIS, data_agendamento__lt=data_corte)
+    return _arquivar(consulta, Servico, ServicoArquivado, lote, limite, pausa)
+
+
+def arquivar_comentarios(data_corte, lote=None, limite=None, pausa=0):
+    consulta = Comentario.objects.filter(data_comentario__lt=data_corte, avaliacao__data_avaliacao__lt=data_corte)
+    return _arquivar(consulta, Comentario, ComentarioArquivado, lote, limite, pausa)
+
+
+def compactar():
+    """
+    VACUUM: reconstrói o arquivo do banco. Sem isso as páginas liberadas ficam na freelist e
+    as tabelas quentes continuam com as folhas meio vazias quando as linhas movidas estavam
+    espalhadas. Trava o banco inteiro enquanto roda: usar numa janela de manutenção.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM')
+
+
+def analisar():
+    """
+    ANALYZE: grava em sqlite_stat1 o total de linhas de cada tabela e índice, que o planejador
+    de consultas e a contagem estimada do admin usam. Rodar depois de cargas e arquivamentos.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def excluir_servico(servico_id):
+    """Apaga o serviço de uma avaliação esteja ele na tabela quente ou na arquivada."""
+    Servico.objects.filter(pk=servico_id).delete()
+    ServicoArquivado.objects.filter(pk=servico_id).delete()
+
+
+def estatisticas(modelos=(Servico, ServicoArquivado, Comentario, ComentarioArquivado)):
+    """
+    Linhas, páginas e profundidade de cada tabela e índice (tabela virtual dbstat do SQLite):
+    {tabela: {'linhas': n, 'indices': {nome: {'paginas': p, 'profundidade': d}}}}.
+    """
+    resultado = {}
+    with connection.cursor() as cursor:
+        for modelo in modelos:
+            tabela = modelo._meta.db_table
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE tbl_name = %s AND type IN ('table', 'index')", [tabela],
+            )
+            nomes = [linha[0] for linha in cursor.fetchall()]
+            indices = {}
+            for nome in nomes:
+                # path tem um '/' por nível abaixo da raiz: '/', '/000/', '/000/01a/'...
+                cursor.execute(
+                    "SELECT count(*), max(length(path) - length(replace(path, '/', ''))) FROM dbstat WHERE name = %s",
+                    [nome],
+                )
+                paginas, barras = cursor.fetchone()
+                indices[nome] = {'paginas': paginas, 'profundidade': barras or 0}
+            resultado[tabela] = {'linhas': modelo.objects.count(), 'indices': indices}
+    return resultado
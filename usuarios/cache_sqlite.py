@@ -0,0 +1,246 @@
+"""
+Backend de cache compartilhado entre os workers: um arquivo SQLite próprio em modo WAL.
+
+O locmem é um dicionário por processo: com vários workers, invalidar no processo que gravou deixa
+os outros servindo dados velhos, e não há Redis nestas máquinas. Aqui todos os processos abrem o
+mesmo arquivo (LOCATION). Leitores não bloqueiam o escritor nem uns aos outros (WAL), e as
+páginas ficam mapeadas em memória (mmap_size), então um get é uma busca na chave primária sem
+cópia extra.
+
+- TTL: cada linha guarda a hora de expiração; linhas vencidas contam como ausentes e saem na poda.
+- LRU: cada linha guarda o último acesso. Para que um get não vire uma escrita, o acesso só é
+  regravado quando está mais velho que RESOLUCAO_LRU segundos. A cada VERIFICAR_A_CADA sets o
+  processo conta as linhas e, acima de MAX_ENTRIES, apaga as vencidas e depois 1/CULL_FREQUENCY
+  das menos usadas.
+- incr/decr são uma única instrução UPDATE ... RETURNING, atômica entre processos.
+- Namespaces: um contador por nome, numa tabela à parte (não expira nem é podado).
+  invalidar_namespace() incrementa o contador, e as chaves montadas com chave_namespace() mudam
+  de nome em todos os processos ao mesmo tempo. As entradas antigas só saem pelo LRU.
+"""
+import itertools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    chave TEXT PRIMARY KEY,
+    valor BLOB NOT NULL,
+    expira REAL,
+    acesso REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_acesso ON cache (acesso);
+CREATE TABLE IF NOT EXISTS namespaces (
+    nome TEXT PRIMARY KEY,
+    versao INTEGER NOT NULL
+) WITHOUT ROWID;
+'''
+VIVA = '(expira IS NULL OR expira > ?)'
+
+
+class CacheSQLite(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        opcoes = params.get('OPTIONS', {})
+        self._caminho = str(location)
+        self._resolucao_lru = opcoes.get('RESOLUCAO_LRU', 30)
+        self._verificar_a_cada = opcoes.get('VERIFICAR_A_CADA', 100)
+        self._espera = opcoes.get('ESPERA', 5)  # segundos esperando a trava de escrita
+        self._mmap = opcoes.get('MMAP', 64 * 1024 * 1024)
+        self._local = threading.local()
+        self._sets = itertools.count(1)
+
+    # Conexões: uma por thread e por processo (uma conexão herdada no fork não pode ser usada)
+
+    def _conexao(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            pasta = os.path.dirname(self._caminho)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            conexao = sqlite3.connect(
+                self._caminho, timeout=self._espera, isolation_level=None, check_same_thread=False,
+            )
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')  # um cache pode perder o último commit numa queda
+            conexao.execute(f'PRAGMA mmap_size={int(self._mmap)}')
+            conexao.executescript(ESQUEMA)
+            local.conexao, local.pid = conexao, os.getpid()
+        return local.conexao
+
+    @contextmanager
+    def _transacao(self):
+        # IMMEDIATE: pega a trava de escrita já no começo, sem risco de SQLITE_BUSY no meio
+        conexao = self._conexao()
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            yield conexao
+        except BaseException:
+            conexao.execute('ROLLBACK')
+            raise
+        conexao.execute('COMMIT')
+
+    def _expira(self, timeout):
+        return self.get_backend_timeout(timeout)  # hora absoluta ou None
+
+    @staticmethod
+    def _serializar(valor):
+        # Inteiros ficam nativos para o incr atômico; o resto vai em pickle
+        if type(valor) is int and -(2 ** 63) <= valor < 2 ** 63:
+            return valor
+        return pickle.dumps(valor, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _carregar(valor):
+        return valor if isinstance(valor, int) else pickle.loads(valor)
+
+    def _tocar(self, conexao, chaves, agora):
+        try:
+            conexao.executemany('UPDATE cache SET acesso = ? WHERE chave = ?', [(agora, c) for c in chaves])
+        except sqlite3.OperationalError:
+            pass  # só a ordem do LRU: não vale esperar pela trava
+
+    def _podar(self, conexao, agora):
+        if next(self._sets) % self._verificar_a_cada:
+            return
+        total = conexao.execute('SELECT count(*) FROM cache').fetchone()[0]
+        if total <= self._max_entries:
+            return
+        total -= conexao.execute('DELETE FROM cache WHERE expira <= ?', (agora,)).rowcount
+        if total > self._max_entries:
+            remover = total // self._cull_frequency if self._cull_frequency else total
+            conexao.execute(
+                'DELETE FROM cache WHERE chave IN (SELECT chave FROM cache ORDER BY acesso LIMIT ?)', (remover,),
+            )
+
+    # API do Django
+
+    def get(self, key, default=None, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        agora = time.time()
+        conexao = self._conexao()
+        linha = conexao.execute(
+            f'SELECT valor, acesso FROM cache WHERE chave = ? AND {VIVA}', (chave, agora),
+        ).fetchone()
+        if linha is None:
+            return default
+        if agora - linha[1] > self._resolucao_lru:
+            self._tocar(conexao, [chave], agora)
+        return self._carregar(linha[0])
+
+    def get_many(self, keys, version=None):
+        chaves = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not chaves:
+            return {}
+        agora = time.time()
+        conexao = self._conexao()
+        marcadores = ', '.join('?' * len(chaves))
+        linhas = conexao.execute(
+            f'SELECT chave, valor, acesso FROM cache WHERE chave IN ({marcadores}) AND {VIVA}', [*chaves, agora],
+        ).fetchall()
+        velhas = [chave for chave, _, acesso in linhas if agora - acesso > self._resolucao_lru]
+        if velhas:
+            self._tocar(conexao, velhas, agora)
+        return {chaves[chave]: self._carregar(valor) for chave, valor, _ in linhas}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        agora, expira = time.time(), self._expira(timeout)
+        linhas = [
+            (self.make_and_validate_key(key, version=version), self._serializar(value), expira, agora)
+            for key, value in data.items()
+        ]
+        if expira is not None and expira <= agora:  # timeout 0 ou negativo: nada fica
+            self.delete_many(data, version)
+            return []
+        with self._transacao() as conexao:  # uma transação para o lote
+            conexao.executemany(
+                'INSERT INTO cache (chave, valor, expira, acesso) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (chave) DO UPDATE SET valor = excluded.valor, expira = excluded.expira, '
+                'acesso = excluded.acesso',
+                linhas,
+            )
+            self._podar(conexao, agora)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        agora, expira = time.time(), self._expira(timeout)
+        # Só substitui uma linha existente se ela já venceu
+        cursor = self._conexao().execute(
+            'INSERT INTO cache (chave, valor, expira, acesso) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (chave) DO UPDATE SET valor = excluded.valor, expira = excluded.expira, '
+            'acesso = excluded.acesso WHERE cache.expira IS NOT NULL AND cache.expira <= excluded.acesso',
+            (chave, self._serializar(value), expira, agora),
+        )
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        agora = time.time()
+        cursor = self._conexao().execute(
+            f'UPDATE cache SET expira = ?, acesso = ? WHERE chave = ? AND {VIVA}',
+            (self._expira(timeout), agora, chave, agora),
+        )
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        return self._conexao().execute(
+            f'SELECT 1 FROM cache WHERE chave = ? AND {VIVA}', (chave, time.time()),
+        ).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        linha = self._conexao().execute(
+            f"UPDATE cache SET valor = valor + ? WHERE chave = ? AND typeof(valor) = 'integer' AND {VIVA} "
+            'RETURNING valor',
+            (delta, chave, time.time()),
+        ).fetchone()
+        if linha is not None:
+            return linha[0]
+        if not self.has_key(key, version):
+            raise ValueError("Key '%s' not found." % key)
+        return super().incr(key, delta, version)  # valor não inteiro: o mesmo erro do get + soma
+
+    def delete(self, key, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        return self._conexao().execute('DELETE FROM cache WHERE chave = ?', (chave,)).rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        chaves = [(self.make_and_validate_key(key, version=version),) for key in keys]
+        with self._transacao() as conexao:
+            conexao.executemany('DELETE FROM cache WHERE chave = ?', chaves)
+
+    def clear(self):
+        with self._transacao() as conexao:
+            conexao.execute('DELETE FROM cache')
+            conexao.execute('DELETE FROM namespaces')
+
+    def close(self, **kwargs):
+        # Chamado ao fim de cada requisição: a conexão fica aberta para a próxima
+        pass
+
+    # Namespaces
+
+    def versao_namespace(self, nome):
+        linha = self._conexao().execute('SELECT versao FROM namespaces WHERE nome = ?', (nome,)).fetchone()
+        return linha[0] if linha else 1
+
+    def invalidar_namespace(self, nome):
+        """Incrementa a versão do namespace para todos os processos e devolve a nova."""
+        return self._conexao().execute(
+            'INSERT INTO namespaces (nome, versao) VALUES (?, 2) '
+            'ON CONFLICT (nome) DO UPDATE SET versao = versao + 1 RETURNING versao',
+            (nome,),
+        ).fetchone()[0]
+
+    def chave_namespace(self, nome, chave):
+        return f'{nome}:{self.versao_namespace(nome)}:{chave}'
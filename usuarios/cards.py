@@ -0,0 +1,101 @@
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Avg, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from PIL import Image, UnidentifiedImageError
+
+from . import ranking
+from .models import Avaliacao, Profissional, ProfissionalCard
+
+# Campos recalculados no upsert (todos menos a chave)
+CAMPOS = [
+    'nome', 'busca', 'crm', 'especialidade', 'especialidade_nome', 'cidade', 'cidade_nome', 'estado_sigla',
+    'preco_servico', 'nota_media', 'total_avaliacoes', 'imagem_url', 'atualizado_em',
+]
+# Dobro do tamanho exibido no card (130px), para telas de alta densidade
+TAMANHO_MINIATURA = 260
+
+
+def miniatura_url(imagem):
+    """Gera (uma vez) a miniatura quadrada da foto do profissional e devolve a URL."""
+    if not imagem:
+        return ''
+    base, _ = os.path.splitext(os.path.basename(imagem.name))
+    nome = f'miniaturas/{base}-{TAMANHO_MINIATURA}.jpg'
+    if not default_storage.exists(nome):
+        try:
+            with default_storage.open(imagem.name) as arquivo, Image.open(arquivo) as original:
+                lado = min(original.size)
+                esquerda, topo = (original.width - lado) // 2, (original.height - lado) // 2
+                quadrada = original.crop((esquerda, topo, esquerda + lado, topo + lado)).convert('RGB')
+                quadrada.thumbnail((TAMANHO_MINIATURA, TAMANHO_MINIATURA))
+                conteudo = io.BytesIO()
+                quadrada.save(conteudo, 'JPEG', quality=85, optimize=True)
+        except (OSError, UnidentifiedImageError):
+            return imagem.url
+        nome = default_storage.save(nome, ContentFile(conteudo.getvalue()))
+    return default_storage.url(nome)
+
+
+def _montar(profissional):
+    usuario = profissional.usuario
+    cidade = usuario.endereco.cidade if usuario.endereco_id else None
+    nome = usuario.get_full_name() or usuario.username
+    return ProfissionalCard(
+        profissional_id=profissional.pk,
+        nome=nome,
+        busca=f'{usuario.username} {nome}',
+        crm=profissional.CRM,
+        especialidade_id=profissional.especialidade_id,
+        especialidade_nome=profissional.especialidade.nome if profissional.especialidade_id else '',
+        cidade_id=cidade.pk if cidade else None,
+        cidade_nome=cidade.nome if cidade else '',
+        estado_sigla=cidade.estado.sigla if cidade and cidade.estado_id else '',
+        preco_servico=profissional.preco_servico,
+        nota_media=profissional.media,
+        total_avaliacoes=profissional.total,
+        imagem_url=miniatura_url(profissional.imagem),
+        # Só vale para cards novos: o upsert não sobrescreve o ranking (fica com ranking.py)
+        ranking=ranking.pontuacao_inicial(),
+    )
+
+
+def _fonte():
+    return Profissional.objects.select_related('usuario__endereco__cidade__estado', 'especialidade').annotate(
+        media=Avg('avaliacoes__nota'), total=Count('avaliacoes'),
+    )
+
+
+def atualizar(profissional_ids):
+    """Recalcula os cards dos profissionais indicados (upsert)."""
+    cards = [_montar(p) for p in _fonte().filter(pk__in=profissional_ids)]
+    ProfissionalCard.objects.bulk_create(
+        cards, update_conflicts=True, unique_fields=['profissional'], update_fields=CAMPOS,
+    )
+    return len(cards)
+
+
+def atualizar_notas(profissional_ids):
+    """Só a média e o total de avaliações, num único UPDATE (caminho quente: cada avaliação)."""
+    avaliacoes = Avaliacao.objects.filter(profissional=OuterRef('pk')).order_by().values('profissional')
+    return ProfissionalCard.objects.filter(pk__in=profissional_ids).update(
+        nota_media=Subquery(avaliacoes.annotate(media=Avg('nota')).values('media')),
+        total_avaliacoes=Coalesce(Subquery(avaliacoes.annotate(total=Count('pk')).values('total')), 0),
+    )
+
+
+def reconstruir(lote=1000):
+    """Reconstrói todos os cards a partir das tabelas de origem, em lotes por pk."""
+    total = 0
+    ultimo = 0
+    while True:
+        ids = list(Profissional.objects.filter(pk__gt=ultimo).order_by('pk').values_list('pk', flat=True)[:lote])
+        if not ids:
+            break
+        total += atualizar(ids)
+        ultimo = ids[-1]
+    ProfissionalCard.objects.exclude(profissional__in=Profissional.objects.values('pk')).delete()
+    return total
@@ -0,0 +1,184 @@
+import asyncio
+import secrets
+import sqlite3
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.test import Client
+
+from . import tendencias
+from .models import Avaliacao, Cidade, Estado, Profissional, Servico, Usuario
+
+
+# Gerador de carga HTTP/1.1 mínimo (sem dependências), usado pelos comandos de teste de carga.
+async def _requisicao(host, port, metodo, caminho, cabecalhos, corpo):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        linhas = [f'{metodo} {caminho} HTTP/1.1', f'Host: {host}:{port}', 'Connection: close']
+        linhas += [f'{nome}: {valor}' for nome, valor in cabecalhos.items()]
+        if corpo:
+            linhas.append(f'Content-Length: {len(corpo)}')
+        writer.write(('\r\n'.join(linhas) + '\r\n\r\n').encode() + (corpo or b''))
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        cabecalhos_resposta = (await reader.read()).partition(b'\r\n\r\n')[0].lower()
+        retry_after = 0
+        for linha in cabecalhos_resposta.split(b'\r\n'):
+            if linha.startswith(b'retry-after:'):
+                retry_after = int(linha.split(b':', 1)[1])
+        return status, retry_after
+    finally:
+        writer.close()
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+async def _clientes(partes, requisicoes, concorrencia, fim, timeout, respeitar_retry_after=False):
+    latencias, erros, status = [], 0, {}
+
+    async def cliente(indice):
+        nonlocal erros
+        i = indice
+        while time.perf_counter() < fim:
+            metodo, caminho, cabecalhos, corpo = requisicoes[i % len(requisicoes)]
+            i += concorrencia
+            inicio = time.perf_counter()
+            try:
+                codigo, retry_after = await asyncio.wait_for(
+                    _requisicao(partes.hostname, partes.port, metodo, caminho, cabecalhos, corpo), timeout,
+                )
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                erros += 1
+                continue
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            status[codigo] = status.get(codigo, 0) + 1
+            if respeitar_retry_after and codigo == 503 and retry_after:
+                # Como um cliente bem-comportado: espera o que o servidor pediu antes de tentar de novo
+                await asyncio.sleep(min(retry_after, max(fim - time.perf_counter(), 0)))
+
+    await asyncio.gather(*(cliente(i) for i in range(concorrencia)))
+    return latencias, erros, status
+
+
+def _resumo(concorrencia, latencias, erros, status, decorrido):
+    latencias.sort()
+    return {
+        'concorrencia': concorrencia,
+        'requisicoes': len(latencias),
+        'erros': erros,
+        'status': {str(k): v for k, v in sorted(status.items())},
+        'req_s': round(len(latencias) / decorrido, 1),
+        'p50_ms': round(statistics.median(latencias), 2) if latencias else 0.0,
+        'p95_ms': round(_percentil(latencias, 0.95), 2),
+        'p99_ms': round(_percentil(latencias, 0.99), 2),
+    }
+
+
+async def _executar(url_base, grupos, duracao, timeout, respeitar_retry_after=False):
+    partes = urlsplit(url_base)
+    fim = time.perf_counter() + duracao
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*(
+        _clientes(partes, requisicoes, concorrencia, fim, timeout, respeitar_retry_after)
+        for requisicoes, concorrencia in grupos.values()
+    ))
+    decorrido = time.perf_counter() - inicio
+    return {
+        nome: _resumo(concorrencia, *resultado, decorrido)
+        for (nome, (_, concorrencia)), resultado in zip(grupos.items(), resultados)
+    }
+
+
+def disparar(url_base, requisicoes, concorrencia=50, duracao=10, timeout=30):
+    """
+    Dispara `concorrencia` clientes simultâneos por `duracao` segundos.
+
+    `requisicoes` é uma lista de tuplas (metodo, caminho, cabecalhos, corpo) usada em rodízio.
+    """
+    grupos = {'todas': (requisicoes, concorrencia)}
+    return asyncio.run(_executar(url_base, grupos, duracao, timeout))['todas']
+
+
+def disparar_grupos(url_base, grupos, duracao=10, timeout=30, respeitar_retry_after=False):
+    """
+    disparar() com vários grupos ao mesmo tempo, medidos em separado.
+
+    `grupos` é {nome: (requisicoes, concorrencia)}; devolve {nome: resultado}. Com
+    respeitar_retry_after, cada cliente que recebe 503 espera o Retry-After antes da próxima.
+    """
+    return asyncio.run(_executar(url_base, grupos, duracao, timeout, respeitar_retry_after))
+
+
+def aguardar_servidor(url_base, limite=30):
+    partes = urlsplit(url_base)
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        try:
+            asyncio.run(_requisicao(partes.hostname, partes.port, 'GET', '/login/', {}, None))
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def preparar_dados():
+    """
+    Cria (se preciso) um cliente, um profissional e uma avaliação de carga e devolve
+    {'leitura': [...], 'escrita': [...]} com as requisições no formato de disparar().
+    """
+    estado, _ = Estado.objects.get_or_create(sigla='CG', defaults={'nome': 'Carga'})
+    Cidade.objects.get_or_create(nome='Cidade de carga', defaults={'estado': estado})
+    cliente, _ = Usuario.objects.get_or_create(username='carga_cliente')
+    medico, _ = Usuario.objects.get_or_create(username='carga_medico')
+    profissional, _ = Profissional.objects.get_or_create(usuario=medico, defaults={'CRM': 999999001})
+    avaliacao = Avaliacao.objects.filter(profissional=profissional, cliente=cliente).first()
+    if avaliacao is None:
+        servico = Servico.objects.create(
+            profissional=profissional, cliente=cliente, data_agendamento='2024-01-01T10:00Z', status='REALIZADO',
+        )
+        avaliacao = Avaliacao.objects.create(profissional=profissional, cliente=cliente, servico=servico, nota=5)
+        # Grava já o contador de "Em alta" dessa avaliação: na saída do processo a cópia do banco não existe mais
+        tendencias.descarregar()
+
+    client = Client()
+    client.force_login(cliente)
+    csrf = secrets.token_hex(16)
+    cabecalhos = {
+        'Cookie': f'sessionid={client.cookies["sessionid"].value}; csrftoken={csrf}',
+        'X-CSRFToken': csrf,
+        'Content-Type': 'application/x-www-form-urlencoded',
+    }
+    return {
+        'leitura': [('GET', f'/carregar-cidades/?estado={estado.id}', {}, None)],
+        'escrita': [
+            ('POST', f'/avaliacao/{avaliacao.id}/comentar/', cabecalhos, b'texto=carga'),
+            ('POST', f'/profissional/{profissional.id}/avaliar/', cabecalhos, b'nota=5'),
+        ],
+    }
+
+
+def segurar_trava_escrita(banco, segurar, intervalo, parar):
+    """
+    Simula um lote que disputa a trava de escrita do SQLite: segura a trava por `segurar`
+    segundos, solta por `intervalo` e repete até o threading.Event `parar`. Devolve a thread.
+    """
+    def executar():
+        conexao = sqlite3.connect(banco, timeout=30, isolation_level=None)
+        try:
+            while not parar.is_set():
+                conexao.execute('BEGIN IMMEDIATE')
+                parar.wait(segurar)
+                conexao.execute('COMMIT')
+                parar.wait(intervalo)
+        finally:
+            conexao.close()
+
+    thread = threading.Thread(target=executar, daemon=True)
+    thread.start()
+    return thread
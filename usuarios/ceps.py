@@ -0,0 +1,237 @@
+"""
+Consulta de CEP offline: um arquivo binário ordenado, aberto com mmap e buscado por bisseção.
+
+O comando compilar_ceps lê um CSV de CEPs (um CEP por linha ou faixas cep_inicial/cep_final) e
+grava as faixas sem sobreposição; quando faixas se sobrepõem vale a mais estreita (o CEP de uma
+rua ganha da faixa geral da cidade). Formato, em inteiros de 32 bits sem sinal:
+
+    cabeçalho   MAGICO, marca de ordem dos bytes, n faixas, m registros
+    inicios[n]  ordenado: é nele que a bisseção corre
+    fins[n]
+    registro[n] índice do registro de cada faixa
+    registros[m][6]  cidade_id, estado_id e os deslocamentos de cidade, uf, bairro e rua
+    textos      UTF-8, cada um precedido do tamanho em 2 bytes
+
+Cada processo só mapeia o arquivo: as páginas ficam no cache do sistema operacional e são
+compartilhadas entre os workers, sem cópia em memória por processo e sem tocar no banco.
+"""
+import bisect
+import csv
+import heapq
+import logging
+import mmap
+import os
+import struct
+import unicodedata
+from array import array
+
+from django.conf import settings
+
+from .models import Cidade
+
+logger = logging.getLogger('usuarios.ceps')
+
+MAGICO = b'FACMCEP1'
+MARCA = 0x01020304  # lida ao contrário se o arquivo veio de uma máquina com outra ordem de bytes
+CABECALHO = struct.Struct('=8sIII')  # 20 bytes
+INICIO_DADOS = 32
+CAMPOS_REGISTRO = 6
+
+
+class IndiceCepInvalido(Exception):
+    pass
+
+
+def caminho_padrao():
+    return str(getattr(settings, 'CEP_INDICE', os.path.join(settings.BASE_DIR, 'cep.idx')))
+
+
+def normalizar_cep(valor):
+    """'13010-000' -> 13010000; None se não tiver 8 dígitos."""
+    digitos = ''.join(c for c in str(valor) if c.isdigit())
+    return int(digitos) if len(digitos) == 8 else None
+
+
+class IndiceCep:
+    def __init__(self, caminho):
+        with open(caminho, 'rb') as arquivo:
+            self._mmap = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < INICIO_DADOS:
+            raise IndiceCepInvalido('Arquivo de CEPs truncado.')
+        magico, marca, n, m = CABECALHO.unpack_from(self._mmap, 0)
+        if magico != MAGICO:
+            raise IndiceCepInvalido('Arquivo de CEPs em formato desconhecido.')
+        if marca != MARCA:
+            raise IndiceCepInvalido('Arquivo de CEPs gerado numa máquina com outra ordem de bytes.')
+        self.textos = INICIO_DADOS + 4 * (3 * n + CAMPOS_REGISTRO * m)
+        if len(self._mmap) < self.textos:
+            raise IndiceCepInvalido('Arquivo de CEPs truncado.')
+        inteiros = memoryview(self._mmap)[INICIO_DADOS:self.textos].cast('I')
+        self.inicios = inteiros[:n]
+        self.fins = inteiros[n:2 * n]
+        self.registro = inteiros[2 * n:3 * n]
+        self.registros = inteiros[3 * n:]
+
+    def __len__(self):
+        return len(self.inicios)
+
+    def _texto(self, deslocamento):
+        posicao = self.textos + deslocamento
+        tamanho = int.from_bytes(self._mmap[posicao:posicao + 2], 'little')
+        return self._mmap[posicao + 2:posicao + 2 + tamanho].decode()
+
+    def buscar(self, cep):
+        """Dados do endereço de um CEP (inteiro) ou None."""
+        i = bisect.bisect_right(self.inicios, cep) - 1
+        if i < 0 or cep > self.fins[i]:
+            return None
+        r = self.registro[i] * CAMPOS_REGISTRO
+        cidade_id, estado_id, cidade, uf, bairro, rua = self.registros[r:r + CAMPOS_REGISTRO]
+        return {
+            'cep': f'{cep:08d}',
+            'cidade_id': cidade_id,
+            'estado_id': estado_id or None,
+            'cidade': self._texto(cidade),
+            'uf': self._texto(uf),
+            'bairro': self._texto(bairro),
+            'rua': self._texto(rua),
+        }
+
+
+# Um índice aberto por processo; reaberto quando o compilar_ceps troca o arquivo
+_aberto = None
+_assinatura = None
+_falha = None  # (assinatura, mensagem) do arquivo que não abriu: não relê nem registra de novo
+
+
+def indice():
+    """Índice do arquivo atual; None sem arquivo, IndiceCepInvalido se ele não abre."""
+    global _aberto, _assinatura, _falha
+    caminho = caminho_padrao()
+    try:
+        estado = os.stat(caminho)
+    except OSError:
+        _aberto = _assinatura = None
+        return None
+    assinatura = (caminho, estado.st_ino, estado.st_mtime_ns, estado.st_size)
+    if assinatura != _assinatura:
+        if _falha and _falha[0] == assinatura:
+            raise IndiceCepInvalido(_falha[1])
+        try:
+            aberto = IndiceCep(caminho)
+        except (IndiceCepInvalido, OSError, ValueError) as e:
+            # ValueError: mmap de arquivo vazio
+            _aberto = _assinatura = None
+            _falha = (assinatura, f'{caminho}: {e}')
+            logger.error('Índice de CEPs indisponível: %s', _falha[1])
+            raise IndiceCepInvalido(_falha[1]) from e
+        _aberto, _assinatura, _falha = aberto, assinatura, None
+    return _aberto
+
+
+def buscar(cep):
+    numero = normalizar_cep(cep)
+    aberto = indice()
+    if numero is None or aberto is None:
+        return None
+    return aberto.buscar(numero)
+
+
+def _chave(texto):
+    sem_acento = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return ' '.join(sem_acento.lower().split())
+
+
+def ler_csv(arquivo, cidades):
+    """
+    Lê as linhas do CSV (colunas uf, cidade, bairro, logradouro ou rua, e cep ou
+    cep_inicial/cep_final). `cidades` mapeia (uf, nome normalizado) -> (cidade_id, estado_id, nome).
+    Devolve as faixas (inicio, fim, registro) e os registros; linhas com CEP inválido ou
+    cidade desconhecida são contadas em `ignoradas`.
+    """
+    amostra = arquivo.read(4096)
+    arquivo.seek(0)
+    delimitador = ';' if amostra.count(';') > amostra.count(',') else ','
+    leitor = csv.DictReader(arquivo, delimiter=delimitador)
+    leitor.fieldnames = [_chave(c) for c in leitor.fieldnames or []]
+
+    registros, por_registro, faixas, ignoradas = [], {}, [], 0
+    for linha in leitor:
+        inicio = normalizar_cep(linha.get('cep_inicial') or linha.get('cep') or '')
+        fim = normalizar_cep(linha.get('cep_final') or '') or inicio
+        uf = (linha.get('uf') or '').strip().upper()
+        cidade = cidades.get((uf, _chave(linha.get('cidade'))))
+        if inicio is None or fim < inicio or cidade is None:
+            ignoradas += 1
+            continue
+        registro = (*cidade, uf, (linha.get('bairro') or '').strip(),
+                    (linha.get('logradouro') or linha.get('rua') or '').strip())
+        if registro not in por_registro:
+            por_registro[registro] = len(registros)
+            registros.append(registro)
+        faixas.append((inicio, fim, por_registro[registro]))
+    return faixas, registros, ignoradas
+
+
+def achatar(faixas):
+    """Faixas possivelmente sobrepostas -> faixas disjuntas e ordenadas; a mais estreita vence."""
+    faixas = sorted(faixas)
+    limites = sorted({f[0] for f in faixas} | {f[1] + 1 for f in faixas})
+    ativas, j, saida = [], 0, []
+    for k in range(len(limites) - 1):
+        ponto = limites[k]
+        while j < len(faixas) and faixas[j][0] == ponto:
+            inicio, fim, registro = faixas[j]
+            heapq.heappush(ativas, (fim - inicio, j, fim, registro))
+            j += 1
+        while ativas and ativas[0][2] < ponto:
+            heapq.heappop(ativas)
+        if not ativas:
+            continue
+        registro, fim = ativas[0][3], limites[k + 1] - 1
+        if saida and saida[-1][2] == registro and saida[-1][1] + 1 == ponto:
+            saida[-1] = (saida[-1][0], fim, registro)
+        else:
+            saida.append((ponto, fim, registro))
+    return saida
+
+
+def gravar(caminho, faixas, registros):
+    """Grava o índice num arquivo temporário e troca de uma vez (quem já mapeou o antigo continua lendo)."""
+    textos, deslocamentos = bytearray(), {}
+
+    def texto(valor):
+        if valor not in deslocamentos:
+            dados = valor.encode()[:0xFFFF]
+            deslocamentos[valor] = len(textos)
+            textos.extend(len(dados).to_bytes(2, 'little') + dados)
+        return deslocamentos[valor]
+
+    tabela = array('I')
+    for cidade_id, estado_id, cidade, uf, bairro, rua in registros:
+        tabela.extend([cidade_id, estado_id or 0, texto(cidade), texto(uf), texto(bairro), texto(rua)])
+
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'wb') as arquivo:
+        cabecalho = CABECALHO.pack(MAGICO, MARCA, len(faixas), len(registros))
+        arquivo.write(cabecalho.ljust(INICIO_DADOS, b'\0'))
+        for coluna in range(3):
+            array('I', (f[coluna] for f in faixas)).tofile(arquivo)
+        tabela.tofile(arquivo)
+        arquivo.write(textos)
+    os.replace(temporario, caminho)
+    return os.path.getsize(caminho)
+
+
+def compilar(arquivo_csv, caminho=None):
+    """CSV -> arquivo de índice. Devolve (faixas gravadas, linhas ignoradas, bytes)."""
+    cidades = {
+        ((sigla or '').upper(), _chave(nome)): (pk, estado_id, nome)
+        for pk, estado_id, nome, sigla in Cidade.objects.values_list('pk', 'estado_id', 'nome', 'estado__sigla')
+    }
+    with open(arquivo_csv, newline='', encoding='utf-8-sig') as arquivo:
+        faixas, registros, ignoradas = ler_csv(arquivo, cidades)
+    faixas = achatar(faixas)
+    tamanho = gravar(caminho or caminho_padrao(), faixas, registros)
+    return len(faixas), ignoradas, tamanho
+
@@ -0,0 +1,206 @@
+import heapq
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .models import Disponibilidade, Profissional, Servico
+
+
+# Grade de atendimento padrão (pode ser sobrescrita no settings.py)
+def _config():
+    return {
+        'inicio': getattr(settings, 'AGENDA_HORA_INICIO', 8),
+        'fim': getattr(settings, 'AGENDA_HORA_FIM', 18),
+        'duracao': getattr(settings, 'AGENDA_DURACAO_SLOT', 30),
+        'horizonte': getattr(settings, 'AGENDA_HORIZONTE_DIAS', 90),
+        'dias_semana': getattr(settings, 'AGENDA_DIAS_SEMANA', (0, 1, 2, 3, 4)),
+    }
+
+
+def slots_por_dia():
+    config = _config()
+    return (config['fim'] - config['inicio']) * 60 // config['duracao']
+
+
+def grade_completa():
+    return (1 << slots_por_dia()) - 1
+
+
+def horario_do_slot(dia, indice):
+    config = _config()
+    minutos = config['inicio'] * 60 + indice * config['duracao']
+    inicio = datetime.combine(dia, time(minutos // 60, minutos % 60))
+    return timezone.make_aware(inicio)
+
+
+def slot_do_horario(horario):
+    """Converte um datetime no par (dia, índice do slot); None se estiver fora da grade."""
+    config = _config()
+    if timezone.is_aware(horario):
+        horario = timezone.localtime(horario)
+    minutos = horario.hour * 60 + horario.minute - config['inicio'] * 60
+    if minutos < 0 or minutos % config['duracao'] or horario.second or horario.microsecond:
+        return None
+    indice = minutos // config['duracao']
+    if indice >= slots_por_dia():
+        return None
+    return horario.date(), indice
+
+
+def dias_do_horizonte(hoje=None):
+    config = _config()
+    hoje = hoje or timezone.localdate()
+    for delta in range(config['horizonte']):
+        dia = hoje + timedelta(days=delta)
+        if dia.weekday() in config['dias_semana']:
+            yield dia
+
+
+def _mascara_futura(agora):
+    # Apenas os slots de hoje que ainda não começaram
+    mascara = 0
+    for indice in range(slots_por_dia()):
+        if horario_do_slot(agora.date(), indice) > agora:
+            mascara |= 1 << indice
+    return mascara
+
+
+def _menor_bit(livres):
+    return livres & -livres
+
+
+def _dados_profissionais(profissional_ids=None):
+    profissionais = Profissional.objects.values_list('id', 'especialidade_id', 'usuario__endereco__cidade_id')
+    if profissional_ids is not None:
+        profissionais = profissionais.filter(id__in=profissional_ids)
+    return list(profissionais)
+
+
+def preencher(profissional_ids=None, recriar=False, lote=500):
+    """
+    Materializa as linhas de disponibilidade do horizonte.
+
+    Sem `recriar`, apenas cria os dias que ainda não existem (mantendo as linhas atuais);
+    com `recriar`, reconstrói tudo a partir dos serviços AGENDADO. Apaga os dias passados só
+    dos `profissional_ids` indicados, ou de todos quando não há lista (preencher_disponibilidade).
+    """
+    hoje = timezone.localdate()
+    dias = list(dias_do_horizonte(hoje))
+    if not dias:
+        return 0
+    completa = grade_completa()
+    criados = 0
+
+    passados = Disponibilidade.objects.filter(dia__lt=hoje)
+    if profissional_ids is not None:
+        # Cadastro de um profissional: só as linhas dele; a poda geral fica com o comando diário
+        passados = passados.filter(profissional_id__in=profissional_ids)
+    passados.delete()
+    profissionais = _dados_profissionais(profissional_ids)
+
+    for i in range(0, len(profissionais), lote):
+        bloco = profissionais[i:i + lote]
+        ids = [p[0] for p in bloco]
+
+        ocupados = {}
+        agendados = Servico.objects.filter(
+            profissional_id__in=ids,
+            status='AGENDADO',
+            data_agendamento__gte=horario_do_slot(dias[0], 0),
+        ).values_list('profissional_id', 'data_agendamento')
+        for profissional_id, data in agendados:
+            slot = slot_do_horario(data)
+            if slot:
+                chave = (profissional_id, slot[0])
+                ocupados[chave] = ocupados.get(chave, 0) | (1 << slot[1])
+
+        if recriar:
+            Disponibilidade.objects.filter(profissional_id__in=ids).delete()
+
+        linhas = []
+        for profissional_id, especialidade_id, cidade_id in bloco:
+            for dia in dias:
+                livres = completa & ~ocupados.get((profissional_id, dia), 0)
+                linhas.append(Disponibilidade(
+                    profissional_id=profissional_id,
+                    dia=dia,
+                    livres=livres,
+                    menor_bit=_menor_bit(livres),
+                    especialidade_id=especialidade_id,
+                    cidade_id=cidade_id,
+                ))
+        Disponibilidade.objects.bulk_create(linhas, batch_size=1000, ignore_conflicts=True)
+        criados += len(linhas)
+
+    return criados
+
+
+def _atualizar_bit(profissional_id, horario, ocupar):
+    slot = slot_do_horario(horario)
+    if slot is None:
+        return False
+    dia, indice = slot
+    bit = 1 << indice
+    if ocupar:
+        novo = models.F('livres').bitand(~bit)
+        filtro = {'livres__gt': 0}
+    else:
+        novo = models.F('livres').bitor(bit)
+        filtro = {}
+    # UPDATE condicional: só altera se o bit estiver no estado oposto, então duas
+    # reservas concorrentes do mesmo horário não podem ambas ter sucesso.
+    qs = Disponibilidade.objects.filter(profissional_id=profissional_id, dia=dia, **filtro)
+    qs = qs.alias(bit_atual=models.F('livres').bitand(bit))
+    qs = qs.filter(bit_atual=bit if ocupar else 0)
+    return bool(qs.update(livres=novo, menor_bit=novo.bitand(novo * -1)))
+
+
+def ocupar(profissional_id, horario):
+    return _atualizar_bit(profissional_id, horario, ocupar=True)
+
+
+def liberar(profissional_id, horario):
+    # Outro agendamento ativo no mesmo horário mantém o slot ocupado
+    if Servico.objects.filter(profissional_id=profissional_id, data_agendamento=horario, status='AGENDADO').exists():
+        return False
+    return _atualizar_bit(profissional_id, horario, ocupar=False)
+
+
+def proximos_horarios(especialidade_id, cidade_id=None, quantidade=10, agora=None):
+    """Retorna os `quantidade` horários livres mais cedo como lista de (horario, profissional_id)."""
+    agora = timezone.localtime(agora or timezone.now())
+    hoje = agora.date()
+    mascara_hoje = _mascara_futura(agora)
+
+    linhas = Disponibilidade.objects.filter(especialidade_id=especialidade_id, dia__gte=hoje, livres__gt=0)
+    if cidade_id:
+        linhas = linhas.filter(cidade_id=cidade_id)
+    linhas = linhas.order_by('dia', 'menor_bit').values_list('profissional_id', 'dia', 'livres', 'menor_bit')
+
+    # Max-heap (chaves negadas) com os melhores `quantidade` candidatos
+    melhores = []
+    for profissional_id, dia, livres, menor_bit in linhas.iterator(chunk_size=200):
+        ordem = (dia.toordinal(), menor_bit.bit_length() - 1)
+        if len(melhores) >= quantidade and ordem > (-melhores[0][0], -melhores[0][1]):
+            # As linhas seguintes começam depois do pior candidato já encontrado
+            break
+        if dia == hoje:
+            livres &= mascara_hoje
+        while livres:
+            bit = _menor_bit(livres)
+            livres ^= bit
+            chave = (-dia.toordinal(), -(bit.bit_length() - 1), -profissional_id)
+            if len(melhores) < quantidade:
+                heapq.heappush(melhores, chave)
+            elif chave > melhores[0]:
+                heapq.heapreplace(melhores, chave)
+            else:
+                break
+
+    resultado = sorted((-d, -i, -p) for d, i, p in melhores)
+    return [
+        (horario_do_slot(datetime.fromordinal(d).date(), i), p)
+        for d, i, p in resultado
+    ]
@@ -0,0 +1,164 @@
+"""
+Arquivos estáticos com hash no nome, CSS minificado e variantes pré-comprimidas.
+
+O collectstatic (STORAGES['staticfiles'] = ArmazenamentoEstatico) grava cada arquivo com o hash
+do conteúdo no nome (css/styles.3f2a9c0d1b7e.css), minifica o CSS e, para os tipos de texto,
+grava ao lado um .gz. O EstaticosMiddleware serve STATIC_ROOT direto, antes das sessões e das
+views: manda o .gz a quem aceita gzip e os nomes com hash como imutáveis por um ano (o nome muda
+quando o conteúdo muda, então a visita seguinte não faz nenhuma requisição por eles).
+
+As imagens não passam pelo collectstatic: variantes_webp() (comando gerar_webp) grava de uma
+vez as larguras do srcset em WebP, que entram no repositório como os demais estáticos.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import parse_http_date_safe
+
+EXTENSOES_COMPRIMIVEIS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map', '.ico')
+TAMANHO_MINIMO_COMPRESSAO = 256  # abaixo disto o cabeçalho da compressão come o ganho
+CACHE_COM_HASH = 'public, max-age=31536000, immutable'
+CACHE_SEM_HASH = 'public, max-age=60'
+COM_HASH = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+# Codificação -> extensão da variante, na ordem de preferência
+VARIANTES = (('gzip', '.gz'),)
+
+# Strings ficam intactas; fora delas some comentário, espaço em volta de pontuação e o ";" antes de "}".
+# "+" e "~" ficam de fora: calc(1px + 2px) precisa dos espaços.
+_CSS = re.compile(
+    r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|(\s*;\s*}\s*)|\s*([{};,>])\s*|(:)\s+|(\s+)''',
+    re.S,
+)
+
+
+def _substituir(achado):
+    string, comentario, fecha, pontuacao, dois_pontos, _ = achado.groups()
+    if string:
+        return string
+    if comentario:
+        return comentario if comentario.startswith('/*!') else ''
+    if fecha:
+        return '}'
+    return pontuacao or dois_pontos or ' '
+
+
+def minificar_css(texto):
+    """Minificação conservadora de CSS (comentários /*! ... */ de licença ficam)."""
+    return _CSS.sub(_substituir, texto).strip()
+
+
+def comprimir(caminho):
+    """Grava caminho.gz quando a variante sai menor que o original."""
+    with open(caminho, 'rb') as arquivo:
+        dados = arquivo.read()
+    variantes = {'.gz': lambda: gzip.compress(dados, 9, mtime=0)}
+    gravadas = []
+    for extensao, compressor in variantes.items():
+        comprimido = compressor() if len(dados) >= TAMANHO_MINIMO_COMPRESSAO else None
+        if comprimido is not None and len(comprimido) < len(dados):
+            with open(caminho + extensao, 'wb') as arquivo:
+                arquivo.write(comprimido)
+            gravadas.append(extensao)
+        elif os.path.exists(caminho + extensao):
+            os.remove(caminho + extensao)  # sobra de um collectstatic anterior
+    return gravadas
+
+
+class ArmazenamentoEstatico(ManifestStaticFilesStorage):
+    def _save(self, name, content):
+        # Passa aqui tanto a cópia com o nome original quanto a com hash (já com as url() trocadas)
+        if name.endswith('.css'):
+            content.seek(0)  # o cálculo do hash já leu o arquivo até o fim
+            content = ContentFile(minificar_css(content.read().decode()).encode())
+        return super()._save(name, content)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for nome in set(paths) | set(self.hashed_files.values()):
+            if nome.endswith(EXTENSOES_COMPRIMIVEIS):
+                comprimir(self.path(nome))
+
+
+def _aceita(cabecalho, codificacao):
+    for item in cabecalho.split(','):
+        nome, _, parametros = item.partition(';')
+        if nome.strip() in (codificacao, '*'):
+            return parametros.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def resposta(request):
+    """Resposta para um arquivo de STATIC_ROOT, ou None se o caminho não for de um."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    try:
+        caminho = safe_join(settings.STATIC_ROOT, request.path[len(settings.STATIC_URL):])
+    except (SuspiciousFileOperation, TypeError):
+        return None
+    if not os.path.isfile(caminho):
+        return None
+
+    tipo, _ = mimetypes.guess_type(caminho)
+    tipo = tipo or 'application/octet-stream'
+    if tipo.startswith('text/') or tipo in ('application/javascript', 'application/json', 'image/svg+xml'):
+        tipo += '; charset=utf-8'
+    cabecalhos = {
+        'Cache-Control': CACHE_COM_HASH if COM_HASH.search(caminho) else CACHE_SEM_HASH,
+    }
+    aceitas = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    comprimivel = caminho.endswith(EXTENSOES_COMPRIMIVEIS)
+    if comprimivel:
+        cabecalhos['Vary'] = 'Accept-Encoding'
+        for codificacao, extensao in VARIANTES:
+            if _aceita(aceitas, codificacao) and os.path.isfile(caminho + extensao):
+                caminho += extensao
+                cabecalhos['Content-Encoding'] = codificacao
+                break
+
+    estado = os.stat(caminho)
+    cabecalhos['Last-Modified'] = formatdate(estado.st_mtime, usegmt=True)
+    desde = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if desde is not None and int(estado.st_mtime) <= desde:
+        resposta = HttpResponseNotModified()
+    else:
+        if request.method == 'HEAD':
+            conteudo = b''
+        else:
+            with open(caminho, 'rb') as arquivo:
+                conteudo = arquivo.read()
+        resposta = HttpResponse(conteudo, content_type=tipo)
+        resposta['Content-Length'] = estado.st_size
+    for nome, valor in cabecalhos.items():
+        resposta[nome] = valor
+    return resposta
+
+
+def variantes_webp(origem, destino, larguras, qualidade=80):
+    """
+    Gera destino-<largura>.webp para cada largura menor ou igual à da imagem de origem, para o
+    srcset de uma <img>. Devolve [(caminho, largura, altura, bytes)].
+    """
+    from PIL import Image
+
+    gravadas = []
+    with Image.open(origem) as imagem:
+        imagem = imagem.convert('RGBA' if imagem.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        for largura in sorted(larguras):
+            if largura > imagem.width:
+                continue
+            altura = round(imagem.height * largura / imagem.width)
+            caminho = f'{destino}-{largura}.webp'
+            imagem.resize((largura, altura), Image.LANCZOS).save(caminho, 'WEBP', quality=qualidade, method=6)
+            gravadas.append((caminho, largura, altura, os.path.getsize(caminho)))
+    return gravadas
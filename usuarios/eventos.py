@@ -0,0 +1,125 @@
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+
+
+# Pub/sub em memória para o stream SSE de cada profissional. Cada conexão tem
+# uma fila limitada; quem não consome rápido o bastante é desconectado (o
+# EventSource do navegador reconecta sozinho) em vez de acumular memória.
+class Assinatura:
+    def __init__(self, loop, tamanho_fila):
+        self.loop = loop
+        self.fila = asyncio.Queue(maxsize=tamanho_fila)
+        self.encerrada = False
+
+    def entregar(self, mensagem):
+        try:
+            atual = asyncio.get_running_loop()
+        except RuntimeError:
+            atual = None
+        if atual is self.loop:
+            self._colocar(mensagem)
+        else:
+            # Publicações vêm das threads das views síncronas
+            self.loop.call_soon_threadsafe(self._colocar, mensagem)
+
+    def _colocar(self, mensagem):
+        if self.encerrada:
+            return
+        try:
+            self.fila.put_nowait(mensagem)
+        except asyncio.QueueFull:
+            self.encerrada = True
+            while not self.fila.empty():
+                self.fila.get_nowait()
+            self.fila.put_nowait(None)
+
+
+class CentralEventos:
+    def __init__(self):
+        self._assinantes = {}
+        self._lock = threading.Lock()
+
+    def assinar(self, canal):
+        tamanho = getattr(settings, 'EVENTOS_FILA_MAXIMA', 100)
+        assinatura = Assinatura(asyncio.get_running_loop(), tamanho)
+        with self._lock:
+            self._assinantes.setdefault(canal, set()).add(assinatura)
+        return assinatura
+
+    def cancelar(self, canal, assinatura):
+        with self._lock:
+            assinantes = self._assinantes.get(canal)
+            if assinantes:
+                assinantes.discard(assinatura)
+                if not assinantes:
+                    del self._assinantes[canal]
+
+    def tem_assinantes(self, canal=None):
+        if canal is None:
+            return bool(self._assinantes)
+        return canal in self._assinantes
+
+    def total_conexoes(self):
+        with self._lock:
+            return sum(len(a) for a in self._assinantes.values())
+
+    def publicar(self, canal, tipo, dados):
+        with self._lock:
+            assinantes = list(self._assinantes.get(canal, ()))
+        if not assinantes:
+            return 0
+        # Serializa uma vez só para todas as conexões
+        mensagem = f'event: {tipo}\ndata: {json.dumps(dados)}\n\n'
+        for assinatura in assinantes:
+            assinatura.entregar(mensagem)
+        return len(assinantes)
+
+
+central = CentralEventos()
+
+
+def canal_profissional(profissional_id):
+    return f'profissional:{profissional_id}'
+
+
+async def stream(canal, assinatura):
+    intervalo = getattr(settings, 'EVENTOS_HEARTBEAT', 15)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                mensagem = await asyncio.wait_for(assinatura.fila.get(), intervalo)
+            except asyncio.TimeoutError:
+                # Comentário SSE mantém proxies e o navegador cientes de que a conexão está viva
+                yield ': ping\n\n'
+                continue
+            if mensagem is None:
+                break
+            yield mensagem
+    finally:
+        central.cancelar(canal, assinatura)
+
+
+def dados_avaliacao(avaliacao):
+    return {
+        'id': avaliacao.id,
+        'autor': avaliacao.cliente.get_full_name(),
+        'nota': avaliacao.nota,
+        'titulo': avaliacao.titulo or '',
+        'comentario': avaliacao.comentario or '',
+        'data': avaliacao.data_avaliacao.strftime('%d/%m/%Y'),
+        'recomenda': avaliacao.recomenda,
+    }
+
+
+def dados_comentario(comentario):
+    return {
+        'id': comentario.id,
+        'avaliacao_id': comentario.avaliacao_id,
+        'autor': comentario.autor.get_full_name(),
+        'texto': comentario.texto,
+        'data': comentario.data_comentario.strftime('%d/%m/%Y'),
+    }
@@ -0,0 +1,147 @@
+"""
+Exportação do histórico de avaliações, comentários e serviços em CSV ou JSONL.
+
+As linhas saem de QuerySet.values_list(...).iterator(chunk_size=...): cada lote vem do cursor
+já com os dados relacionados (JOIN), sem instanciar modelos nem guardar o resultado inteiro. A
+saída é acumulada em blocos de TAMANHO_BLOCO bytes (opcionalmente comprimidos com gzip na hora),
+então a memória fica constante qualquer que seja o número de linhas.
+"""
+import csv
+import io
+import itertools
+import json
+import zlib
+from datetime import date
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Avaliacao, Comentario, ComentarioArquivado, Servico, ServicoArquivado
+
+TAMANHO_BLOCO = 64 * 1024
+FORMATOS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# nome da coluna -> caminho no values_list; 'profissional' é o filtro de quem exporta só o seu e
+# 'arquivo' a tabela fria (usuarios/arquivo.py), lida antes da quente por ter as linhas antigas
+TIPOS = {
+    'avaliacoes': {
+        'modelo': Avaliacao,
+        'profissional': 'profissional_id',
+        'colunas': {
+            'id': 'id',
+            'profissional_id': 'profissional_id',
+            'profissional': 'profissional__usuario__username',
+            'cliente': 'cliente__username',
+            'servico_id': 'servico_id',
+            'nota': 'nota',
+            'recomenda': 'recomenda',
+            'titulo': 'titulo',
+            'comentario': 'comentario',
+            'data_avaliacao': 'data_avaliacao',
+        },
+    },
+    'comentarios': {
+        'modelo': Comentario,
+        'arquivo': ComentarioArquivado,
+        'profissional': 'avaliacao__profissional_id',
+        'colunas': {
+            'id': 'id',
+            'avaliacao_id': 'avaliacao_id',
+            'profissional_id': 'avaliacao__profissional_id',
+            'autor': 'autor__username',
+            'texto': 'texto',
+            'data_comentario': 'data_comentario',
+        },
+    },
+    'servicos': {
+        'modelo': Servico,
+        'arquivo': ServicoArquivado,
+        'profissional': 'profissional_id',
+        'colunas': {
+            'id': 'id',
+            'profissional_id': 'profissional_id',
+            'profissional': 'profissional__usuario__username',
+            'cliente': 'cliente__username',
+            'status': 'status',
+            'data_agendamento': 'data_agendamento',
+            'data_realizacao': 'data_realizacao',
+        },
+    },
+}
+
+
+def tamanho_lote():
+    return getattr(settings, 'EXPORTACAO_TAMANHO_LOTE', 2000)
+
+
+def nome_arquivo(tipo, formato, comprimir=False):
+    return f'{tipo}.{formato}' + ('.gz' if comprimir else '')
+
+
+def _valor(valor):
+    if isinstance(valor, date):  # datetime também
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _linhas(tipo, profissional_id=None):
+    definicao = TIPOS[tipo]
+    modelos = [definicao['arquivo'], definicao['modelo']] if 'arquivo' in definicao else [definicao['modelo']]
+    iteradores = []
+    for modelo in modelos:
+        consulta = modelo.objects.order_by('pk')
+        if profissional_id is not None:
+            consulta = consulta.filter(**{definicao['profissional']: profissional_id})
+        iteradores.append(consulta.values_list(*definicao['colunas'].values()).iterator(chunk_size=tamanho_lote()))
+    return itertools.chain(*iteradores)
+
+
+def _texto(tipo, formato, profissional_id):
+    """Gera a saída em pedaços de texto de ~TAMANHO_BLOCO caracteres."""
+    colunas = list(TIPOS[tipo]['colunas'])
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer) if formato == 'csv' else None
+    if escritor:
+        escritor.writerow(colunas)
+    for linha in _linhas(tipo, profissional_id):
+        valores = [_valor(v) for v in linha]
+        if escritor:
+            escritor.writerow(valores)
+        else:
+            buffer.write(json.dumps(dict(zip(colunas, valores)), ensure_ascii=False))
+            buffer.write('\n')
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def blocos(tipo, formato='csv', profissional_id=None, comprimir=False):
+    """Bytes da exportação, bloco a bloco. Com `comprimir`, um fluxo gzip válido."""
+    if tipo not in TIPOS or formato not in FORMATOS:
+        raise ValueError(f'Exportação desconhecida: {tipo}/{formato}')
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None  # wbits 31: cabeçalho gzip
+    for texto in _texto(tipo, formato, profissional_id):
+        dados = texto.encode()
+        if compressor:
+            dados = compressor.compress(dados)
+        if dados:
+            yield dados
+    if compressor:
+        yield compressor.flush()
+
+
+async def blocos_assincronos(iterador):
+    """
+    Sob ASGI, o StreamingHttpResponse transforma um iterador síncrono numa lista antes de
+    enviar; aqui cada bloco é pedido à thread das views síncronas (onde fica o cursor).
+    """
+    iterador = iter(iterador)
+    proximo = sync_to_async(next, thread_sensitive=True)
+    while (bloco := await proximo(iterador, None)) is not None:
+        yield bloco
@@ -2,20 +2,100 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.password_validation import validate_password
 
+from . import referencia
 from .models import Cidade, Endereco, Especialidade, Estado, Profissional, Usuario
 
 
+class IteradorReferencia(forms.models.ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for objeto in getattr(referencia.dados(), self.field.lista):
+            yield self.choice(objeto)
+
+    def __len__(self):
+        return len(getattr(referencia.dados(), self.field.lista)) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(getattr(referencia.dados(), self.field.lista))
+
+
+class ReferenciaChoiceField(forms.ModelChoiceField):
+    """
+    Select de estados ou especialidades servido do cache em memória (usuarios/referencia.py):
+    nem a renderização nem a validação consultam o banco.
+    """
+    iterator = IteradorReferencia
+
+    def __init__(self, modelo, lista, **kwargs):
+        self.lista = lista
+        super().__init__(queryset=modelo.objects.none(), **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            objeto = getattr(referencia.dados(), f'{self.lista}_por_id').get(int(value))
+        except (ValueError, TypeError):
+            objeto = None
+        if objeto is None:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value},
+            )
+        return objeto
+
+
+class CidadeSelect(forms.Select):
+    """
+    Select de cidades preenchido no navegador pela rota carregar_cidades: o HTML traz só a
+    opção vazia e a cidade escolhida, em vez de uma <option> para cada município do país.
+    """
+
+    def optgroups(self, name, value, attrs=None):
+        grupos = super().optgroups(name, value, attrs)
+        escolhida = next((v for v in value if v), None)
+        if escolhida and str(escolhida).isdigit():
+            cidade = referencia.dados().cidades.get(int(escolhida))
+            if cidade:
+                opcao = self.create_option(name, int(escolhida), cidade[0], True, len(grupos))
+                grupos.append((None, [opcao], len(grupos)))
+        return grupos
+
+
+class CidadeField(forms.ModelChoiceField):
+    """Valida o id enviado no cache de cidades, restrito ao estado enviado."""
+    widget = CidadeSelect
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Cidade.objects.none(), **kwargs)
+        self.estado_id = None
+
+    def restringir_ao_estado(self, data):
+        if 'estado' not in data:
+            return
+        try:
+            self.estado_id = int(data.get('estado'))
+        except (ValueError, TypeError):
+            self.estado_id = 0  # estado inválido: nenhuma cidade é aceita
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            cidade = referencia.dados().cidade(int(value))
+        except (ValueError, TypeError):
+            cidade = None
+        if cidade is None or (self.estado_id is not None and cidade.estado_id != self.estado_id):
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value},
+            )
+        return cidade
+
+
 class UsuarioCreationForm(UserCreationForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if 'estado' in self.data:
-            try:
-                estado_id = int(self.data.get('estado'))
-                self.fields['cidade'].queryset = Cidade.objects.filter(estado_id=estado_id)
-            except (ValueError, TypeError):
-                self.fields['cidade'].queryset = Cidade.objects.none()
-        elif self.instance.pk:
-            self.fields['cidade'].queryset = Cidade.objects.filter(estado=self.instance.estado)
+        self.fields['cidade'].restringir_ao_estado(self.data)
 
         # Removendo as mensagens de ajuda de senha
         self.fields['password1'].help_text = ''
@@ -58,14 +138,13 @@ class UsuarioCreationForm(UserCreationForm):
     )
 
     # Campos de endereço
-    estado = forms.ModelChoiceField(
-        queryset=Estado.objects.all(), 
+    estado = ReferenciaChoiceField(
+        Estado, 'estados',
         widget=forms.Select(attrs={'class': 'form-control', 'id': 'id_estado'}),
         required=False
     )
-    cidade = forms.ModelChoiceField(
-        queryset=Cidade.objects.all(), 
-        widget=forms.Select(attrs={'class': 'form-control', 'id': 'id_cidade'}),
+    cidade = CidadeField(
+        widget=CidadeSelect(attrs={'class': 'form-control', 'id': 'id_cidade'}),
         required=False
     )
     rua = forms.CharField(
@@ -160,15 +239,14 @@ class UsuarioUpdateForm(forms.ModelForm):
     numero = forms.CharField(max_length=20, required=False)
     bairro = forms.CharField(max_length=100, required=False)  # adicionado campo bairro
     cep = forms.CharField(max_length=8, required=False)
-    estado = forms.ModelChoiceField(
-        queryset=Estado.objects.all(), 
+    estado = ReferenciaChoiceField(
+        Estado, 'estados',
         required=False,
         widget=forms.Select(attrs={'class': 'form-control'})
     )
-    cidade = forms.ModelChoiceField(
-        queryset=Cidade.objects.none(), 
+    cidade = CidadeField(
         required=False,
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=CidadeSelect(attrs={'class': 'form-control'})
     )
     imagem_perfil = forms.ImageField(
         required=False,
@@ -187,19 +265,19 @@ class UsuarioUpdateForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
-        # Preenche campos iniciais se usuário já tem endereço
-        if self.instance.endereco:
-            self.fields['rua'].initial = self.instance.endereco.rua  # corrigido
-            self.fields['numero'].initial = self.instance.endereco.numero
-            self.fields['bairro'].initial = self.instance.endereco.bairro  # adicionado
-            self.fields['cep'].initial = self.instance.endereco.cep
-            self.fields['estado'].initial = self.instance.endereco.cidade.estado
-            self.fields['cidade'].initial = self.instance.endereco.cidade
-
-            # Atualiza cidades de acordo com o estado
-            self.fields['cidade'].queryset = Cidade.objects.filter(estado=self.instance.endereco.cidade.estado)
-        else:
-            self.fields['cidade'].queryset = Cidade.objects.none()
+        self.fields['cidade'].restringir_ao_estado(self.data)
+
+        # Preenche campos iniciais se usuário já tem endereço (endereço e cidade numa consulta só)
+        endereco = None
+        if self.instance.endereco_id:
+            endereco = Endereco.objects.select_related('cidade').filter(pk=self.instance.endereco_id).first()
+        if endereco:
+            self.fields['rua'].initial = endereco.rua  # corrigido
+            self.fields['numero'].initial = endereco.numero
+            self.fields['bairro'].initial = endereco.bairro  # adicionado
+            self.fields['cep'].initial = endereco.cep
+            self.fields['estado'].initial = endereco.cidade.estado_id
+            self.fields['cidade'].initial = endereco.cidade_id
 
     def save(self, commit=True):
         user = super().save(commit=False)
@@ -241,14 +319,7 @@ class UsuarioUpdateForm(forms.ModelForm):
 class CadastroProfissionalForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if 'estado' in self.data:
-            try:
-                estado_id = int(self.data.get('estado'))
-                self.fields['cidade'].queryset = Cidade.objects.filter(estado_id=estado_id)
-            except (ValueError, TypeError):
-                self.fields['cidade'].queryset = Cidade.objects.none()
-        elif self.instance.pk:
-            self.fields['cidade'].queryset = Cidade.objects.filter(estado=self.instance.estado)
+        self.fields['cidade'].restringir_ao_estado(self.data)
 
         # Removendo as mensagens de ajuda de senha
         self.fields['password1'].help_text = ''
@@ -295,8 +366,8 @@ class CadastroProfissionalForm(forms.ModelForm):
     CRM = forms.IntegerField(
         widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Número do CRM'})
     )
-    especialidade = forms.ModelChoiceField(
-        queryset=Especialidade.objects.all(), 
+    especialidade = ReferenciaChoiceField(
+        Especialidade, 'especialidades',
         required=False,
         widget=forms.Select(attrs={'class': 'form-control'})
     )
@@ -310,14 +381,13 @@ class CadastroProfissionalForm(forms.ModelForm):
         required=False,
         widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'placeholder': 'Valor do serviço'})
     )
-    estado = forms.ModelChoiceField(
-        queryset=Estado.objects.all(), 
+    estado = ReferenciaChoiceField(
+        Estado, 'estados',
         widget=forms.Select(attrs={'class': 'form-control', 'id': 'id_estado'}),
         required=False
     )
-    cidade = forms.ModelChoiceField(
-        queryset=Cidade.objects.all(), 
-        widget=forms.Select(attrs={'class': 'form-control', 'id': 'id_cidade'}),
+    cidade = CidadeField(
+        widget=CidadeSelect(attrs={'class': 'form-control', 'id': 'id_cidade'}),
         required=False
     )
     rua = forms.CharField(
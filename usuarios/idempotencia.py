@@ -0,0 +1,82 @@
+"""
+Cabeçalho Idempotency-Key nas views JSON de escrita.
+
+O navegador (ou um cliente que repete a requisição depois de um timeout) manda a mesma chave em
+todas as tentativas de uma mesma ação. A primeira tentativa roda a view e guarda a resposta no
+cache compartilhado (usuarios/cache_sqlite.py, visto por todos os workers) por
+IDEMPOTENCIA_VALIDADE segundos. As seguintes recebem a resposta guardada, com o cabeçalho
+Idempotent-Replayed, sem tocar no banco. Enquanto a primeira ainda roda, há um marcador (cache.add,
+atômico entre processos) e as repetições recebem 409. A chave vale por usuário e por URL, e o
+corpo tem de ser o mesmo: a mesma chave com outro corpo recebe 422. Respostas 5xx não são
+guardadas, e o cliente pode tentar de novo com a mesma chave.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+CABECALHO = 'HTTP_IDEMPOTENCY_KEY'
+TAMANHO_MAXIMO_CHAVE = 255
+
+
+def _validade():
+    return getattr(settings, 'IDEMPOTENCIA_VALIDADE', 24 * 3600)
+
+
+def _trava():
+    return getattr(settings, 'IDEMPOTENCIA_TRAVA', 60)
+
+
+def _erro(mensagem, status):
+    return JsonResponse({'status': 'error', 'message': mensagem}, status=status)
+
+
+def _repetir(guardada):
+    resposta = HttpResponse(guardada['conteudo'], status=guardada['status'], content_type=guardada['tipo'])
+    resposta['Idempotent-Replayed'] = 'true'
+    return resposta
+
+
+def idempotente(view):
+    """Decorador para views assíncronas: sem o cabeçalho a view roda normalmente."""
+
+    @functools.wraps(view)
+    async def _view(request, *args, **kwargs):
+        chave = request.META.get(CABECALHO)
+        if not chave:
+            return await view(request, *args, **kwargs)
+        if len(chave) > TAMANHO_MAXIMO_CHAVE or not chave.isprintable():
+            return _erro('Idempotency-Key inválida', 400)
+
+        user = await request.auser()
+        chave_cache = 'idempotencia:' + hashlib.sha256(f'{user.pk}\0{request.path}\0{chave}'.encode()).hexdigest()
+        impressao = hashlib.sha256(request.body).hexdigest()
+
+        if not await cache.aadd(chave_cache, {'impressao': impressao}, _trava()):
+            guardada = await cache.aget(chave_cache)
+            # None: a primeira falhou ou o marcador venceu entre o add e o get
+            if guardada is None or 'status' not in guardada:
+                return _erro('Requisição em andamento, tente novamente', 409)
+            if guardada['impressao'] != impressao:
+                return _erro('Idempotency-Key já usada com outro conteúdo', 422)
+            return _repetir(guardada)
+
+        try:
+            resposta = await view(request, *args, **kwargs)
+        except BaseException:
+            await cache.adelete(chave_cache)
+            raise
+        if resposta.status_code >= 500 or getattr(resposta, 'streaming', False):
+            await cache.adelete(chave_cache)
+        else:
+            await cache.aset(chave_cache, {
+                'impressao': impressao,
+                'status': resposta.status_code,
+                'tipo': resposta['Content-Type'],
+                'conteudo': resposta.content,
+            }, _validade())
+        return resposta
+
+    return _view
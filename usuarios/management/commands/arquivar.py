@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from usuarios import arquivo
+
+
+class Command(BaseCommand):
+    help = (
+        'Move serviços REALIZADO/CANCELADO e respostas de avaliações mais antigos que ARQUIVO_DIAS '
+        'para as tabelas arquivadas, em lotes de ARQUIVO_LOTE (uma transação por lote).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Idade mínima em dias (padrão: settings.ARQUIVO_DIAS).')
+        parser.add_argument('--lote', type=int, help='Linhas por transação (padrão: settings.ARQUIVO_LOTE).')
+        parser.add_argument('--limite', type=int, help='Máximo de linhas movidas por tabela nesta execução.')
+        parser.add_argument('--pausa', type=float, default=0, help='Segundos de espera entre lotes.')
+        parser.add_argument('--compactar', action='store_true',
+                            help='Roda VACUUM no fim (trava o banco; usar em janela de manutenção).')
+        parser.add_argument('--estatisticas', action='store_true', help='Mostra páginas e profundidade antes e depois.')
+
+    def _estatisticas(self, titulo):
+        self.stdout.write(titulo)
+        for tabela, dados in arquivo.estatisticas().items():
+            self.stdout.write(f'  {tabela}: {dados["linhas"]} linhas')
+            for nome, indice in dados['indices'].items():
+                self.stdout.write(f'    {nome}: {indice["paginas"]} páginas, profundidade {indice["profundidade"]}')
+
+    def handle(self, *args, **options):
+        if options['estatisticas']:
+            self._estatisticas('Antes:')
+        data_corte = arquivo.corte(options['dias'])
+        parametros = {'lote': options['lote'], 'limite': options['limite'], 'pausa': options['pausa']}
+        for nome, funcao in [('serviços', arquivo.arquivar_servicos), ('comentários', arquivo.arquivar_comentarios)]:
+            inicio = time.perf_counter()
+            total = funcao(data_corte, **parametros)
+            self.stdout.write(self.style.SUCCESS(
+                f'{total} {nome} anteriores a {data_corte:%d/%m/%Y} arquivados em {time.perf_counter() - inicio:.1f}s.'
+            ))
+        # Atualiza o total de linhas que o admin usa como estimativa
+        arquivo.analisar()
+        if options['compactar']:
+            inicio = time.perf_counter()
+            arquivo.compactar()
+            self.stdout.write(self.style.SUCCESS(f'Banco compactado em {time.perf_counter() - inicio:.1f}s.'))
+        if options['estatisticas']:
+            self._estatisticas('Depois:')
@@ -0,0 +1,65 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Roda num processo novo: monta a aplicação WSGI (com ou sem aquecimento) e mede as requisições
+_SCRIPT = r'''
+import io, json, sys, time
+from wsgiref.util import setup_testing_defaults
+inicio = time.perf_counter()
+from core.wsgi import application
+boot = time.perf_counter() - inicio
+
+def pedir(caminho):
+    caminho, _, query = caminho.partition('?')
+    ambiente = {'PATH_INFO': caminho, 'QUERY_STRING': query, 'SERVER_NAME': 'localhost', 'wsgi.errors': io.StringIO()}
+    setup_testing_defaults(ambiente)
+    status = []
+    inicio = time.perf_counter()
+    resposta = application(ambiente, lambda s, h, e=None: status.append(s))
+    b''.join(resposta)
+    resposta.close()
+    return (time.perf_counter() - inicio) * 1000, status[0].split()[0]
+
+primeira, status = pedir(sys.argv[1])
+segunda, _ = pedir(sys.argv[1])
+print(json.dumps({'boot_ms': boot * 1000, 'primeira_ms': primeira, 'segunda_ms': segunda, 'status': status}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o boot e a primeira requisição de processos novos, com e sem o aquecimento de '
+        'core/wsgi.py (FACMED_AQUECER). Cada rota é a primeira requisição dos seus próprios processos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rotas', nargs='+', default=['/', '/cadastro/cliente/', '/cadastro/profissional/'])
+        parser.add_argument('--processos', type=int, default=5, help='Processos novos por modo.')
+
+    def _rodar(self, aquecer, rota):
+        ambiente = dict(os.environ, FACMED_AQUECER='1' if aquecer else '0', DJANGO_SETTINGS_MODULE='core.settings')
+        saida = subprocess.run(
+            [sys.executable, '-c', _SCRIPT, rota],
+            cwd=settings.BASE_DIR, env=ambiente, capture_output=True, text=True, check=True,
+        )
+        return json.loads(saida.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        relatorio = {}
+        for aquecer in (False, True):
+            modo = {}
+            for rota in options['rotas']:
+                execucoes = [self._rodar(aquecer, rota) for _ in range(options['processos'])]
+                modo[rota] = {
+                    chave: round(statistics.median(e[chave] for e in execucoes), 1)
+                    for chave in ('boot_ms', 'primeira_ms', 'segunda_ms')
+                }
+                modo[rota]['status'] = execucoes[0]['status']
+            relatorio['com_aquecimento' if aquecer else 'sem_aquecimento'] = modo
+        self.stdout.write(json.dumps(relatorio, indent=2, ensure_ascii=False))
@@ -0,0 +1,82 @@
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'sqlite': 'usuarios.cache_sqlite.CacheSQLite',
+    'arquivos': 'django.core.cache.backends.filebased.FileBasedCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',  # referência: não é compartilhado
+}
+
+
+def _trabalhar(backend, local, fim, leituras, chaves, valor, fila):
+    cache = import_string(BACKENDS[backend])(local, {'OPTIONS': {'MAX_ENTRIES': chaves * 2}})
+    rnd = random.Random(os.getpid())
+    gets = sets = acertos = 0
+    while time.time() < fim:
+        chave = f'k{rnd.randrange(chaves)}'
+        if rnd.random() < leituras:
+            acertos += cache.get(chave) is not None
+            gets += 1
+        else:
+            cache.set(chave, valor)
+            sets += 1
+    fila.put((gets, sets, acertos))
+
+
+class Command(BaseCommand):
+    help = (
+        'Vazão de get/set do cache com vários processos ao mesmo tempo (fork), comparando o backend '
+        'SQLite compartilhado com o FileBasedCache e com o locmem (por processo). O cache começa com '
+        '--chaves entradas; o FileBasedCache demora a encher porque lista a pasta a cada set.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, nargs='+', default=[1, 2, 4, 8])
+        parser.add_argument('--segundos', type=float, default=3)
+        parser.add_argument('--leituras', type=float, default=0.9, help='Fração de gets.')
+        parser.add_argument('--chaves', type=int, default=10000)
+        parser.add_argument('--bytes', type=int, default=500, help='Tamanho do valor gravado.')
+        parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+
+    def _rodar(self, backend, processos, options):
+        contexto = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as pasta:
+            local = os.path.join(pasta, 'cache.sqlite3') if backend == 'sqlite' else pasta
+            cache = import_string(BACKENDS[backend])(local, {'OPTIONS': {'MAX_ENTRIES': options['chaves'] * 2}})
+            valor = 'x' * options['bytes']
+            cache.set_many({f'k{i}': valor for i in range(options['chaves'])})  # começa cheio
+            fila = contexto.Queue()
+            fim = time.time() + options['segundos']
+            filhos = [
+                contexto.Process(target=_trabalhar, args=(
+                    backend, local, fim, options['leituras'], options['chaves'], valor, fila,
+                ))
+                for _ in range(processos)
+            ]
+            for filho in filhos:
+                filho.start()
+            resultados = [fila.get() for _ in filhos]
+            for filho in filhos:
+                filho.join()
+        gets, sets, acertos = (sum(r[i] for r in resultados) for i in range(3))
+        return {
+            'ops_s': round((gets + sets) / options['segundos']),
+            'gets_s': round(gets / options['segundos']),
+            'sets_s': round(sets / options['segundos']),
+            'acertos': round(acertos / gets, 3) if gets else None,
+        }
+
+    def handle(self, *args, **options):
+        relatorio = {'cpus': os.cpu_count(), 'leituras': options['leituras'], 'resultados': {}}
+        for backend in options['backends']:
+            relatorio['resultados'][backend] = {
+                str(processos): self._rodar(backend, processos, options) for processos in options['processos']
+            }
+        self.stdout.write(json.dumps(relatorio, indent=2))
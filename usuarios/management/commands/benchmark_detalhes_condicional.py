@@ -0,0 +1,78 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from usuarios.models import Avaliacao, Profissional, Servico, Usuario
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Mede bytes e CPU de revisitas à página de detalhes com e sem GET condicional (dados desfeitos ao final).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--avaliacoes', type=int, default=200)
+        parser.add_argument('--repeticoes', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._executar(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _medir(self, client, url, repeticoes, **cabecalhos):
+        tempos, cpu, tamanho, status = [], 0.0, 0, None
+        for _ in range(repeticoes):
+            inicio, inicio_cpu = time.perf_counter(), time.process_time()
+            resposta = client.get(url, **cabecalhos)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            cpu += time.process_time() - inicio_cpu
+            tamanho, status = len(resposta.content), resposta.status_code
+        return {
+            'status': status,
+            'bytes': tamanho,
+            'p50_ms': round(statistics.median(tempos), 3),
+            'cpu_ms': round(cpu * 1000 / repeticoes, 3),
+        }
+
+    def _executar(self, options):
+        medico = Usuario.objects.create(username='bench_medico', first_name='Bench')
+        profissional = Profissional.objects.create(usuario=medico, CRM=999999101)
+        clientes = Usuario.objects.bulk_create([
+            Usuario(username=f'bench_cliente_{i}', password='!', first_name='Cliente', last_name=str(i))
+            for i in range(options['avaliacoes'])
+        ])
+        servicos = Servico.objects.bulk_create([
+            Servico(profissional=profissional, cliente=c, data_agendamento=timezone.now(), status='REALIZADO')
+            for c in clientes
+        ])
+        Avaliacao.objects.bulk_create([
+            Avaliacao(profissional=profissional, cliente=c, servico=s, nota=5, titulo='Ótimo', comentario='x' * 200)
+            for c, s in zip(clientes, servicos)
+        ])
+
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(clientes[0])
+        url = reverse('profissional_detalhes', args=[profissional.id])
+        etag = client.get(url)['ETag']
+        etag = client.get(url)['ETag']  # segunda visita já com o cookie CSRF definido
+
+        completo = self._medir(client, url, options['repeticoes'])
+        condicional = self._medir(client, url, options['repeticoes'], HTTP_IF_NONE_MATCH=etag)
+        self.stdout.write(json.dumps({
+            'avaliacoes': options['avaliacoes'],
+            'sem_validador': completo,
+            'com_if_none_match': condicional,
+            'bytes_economizados_por_visita': completo['bytes'] - condicional['bytes'],
+            'cpu_economizada_pct': round(100 * (1 - condicional['cpu_ms'] / completo['cpu_ms']), 1),
+        }, indent=2))
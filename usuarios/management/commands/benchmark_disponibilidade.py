@@ -0,0 +1,90 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from usuarios import disponibilidade
+from usuarios.models import Cidade, Endereco, Especialidade, Estado, Profissional, Usuario
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Mede a busca de próximos horários com dados sintéticos (tudo é desfeito ao final).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profissionais', type=int, default=10000)
+        parser.add_argument('--especialidades', type=int, default=20)
+        parser.add_argument('--cidades', type=int, default=50)
+        parser.add_argument('--agendamentos', type=int, default=20000)
+        parser.add_argument('--consultas', type=int, default=500)
+        parser.add_argument('--quantidade', type=int, default=10)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._executar(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _executar(self, options):
+        rnd = random.Random(42)
+        estado = Estado.objects.create(nome='Benchmark', sigla='BX')
+        cidades = Cidade.objects.bulk_create([
+            Cidade(nome=f'Cidade benchmark {i}', estado=estado) for i in range(options['cidades'])
+        ])
+        especialidades = Especialidade.objects.bulk_create([
+            Especialidade(nome=f'Especialidade benchmark {i}') for i in range(options['especialidades'])
+        ])
+        enderecos = Endereco.objects.bulk_create([
+            Endereco(cidade=rnd.choice(cidades)) for _ in range(options['profissionais'])
+        ])
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(username=f'bench_{i}', password='!', endereco=endereco)
+            for i, endereco in enumerate(enderecos)
+        ], batch_size=1000)
+        profissionais = Profissional.objects.bulk_create([
+            Profissional(usuario=usuario, CRM=900000000 + i, especialidade=rnd.choice(especialidades))
+            for i, usuario in enumerate(usuarios)
+        ], batch_size=1000)
+
+        inicio = time.perf_counter()
+        linhas = disponibilidade.preencher()
+        tempo_preencher = time.perf_counter() - inicio
+
+        dias = list(disponibilidade.dias_do_horizonte())
+        slots = disponibilidade.slots_por_dia()
+        inicio = time.perf_counter()
+        for _ in range(options['agendamentos']):
+            horario = disponibilidade.horario_do_slot(rnd.choice(dias), rnd.randrange(slots))
+            disponibilidade.ocupar(rnd.choice(profissionais).id, horario)
+        tempo_reservas = time.perf_counter() - inicio
+
+        agora = timezone.now()
+        latencias = []
+        for _ in range(options['consultas']):
+            especialidade = rnd.choice(especialidades)
+            cidade = rnd.choice(cidades) if rnd.random() < 0.8 else None
+            inicio = time.perf_counter()
+            disponibilidade.proximos_horarios(
+                especialidade.id, cidade.id if cidade else None, options['quantidade'], agora=agora,
+            )
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+        latencias.sort()
+        self.stdout.write(json.dumps({
+            'profissionais': options['profissionais'],
+            'linhas_disponibilidade': linhas,
+            'preencher_s': round(tempo_preencher, 2),
+            'reserva_media_ms': round(tempo_reservas * 1000 / max(options['agendamentos'], 1), 3),
+            'busca_p50_ms': round(statistics.median(latencias), 3),
+            'busca_p95_ms': round(latencias[int(len(latencias) * 0.95) - 1], 3),
+            'busca_max_ms': round(latencias[-1], 3),
+        }, indent=2))
@@ -0,0 +1,151 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from usuarios import disponibilidade
+from usuarios.models import Avaliacao, Comentario, Disponibilidade, Profissional, Servico, Usuario
+from usuarios.urls import urlpatterns
+
+# Corpo enviado às rotas que só aceitam POST
+DADOS_POST = {
+    'adicionar_comentario': {'texto': 'Comentário de benchmark'},
+    'adicionar_avaliacao': {'nota': '5', 'titulo': 'Benchmark', 'comentario': 'Texto', 'recomenda': 'true'},
+}
+# Rotas que derrubam a sessão ou apagam a conta são medidas só via GET
+NAO_ENVIAR_POST = {'logout', 'profile_delete', 'profile_edit', 'login', 'register_client', 'register_professional'}
+
+
+def _percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Percorre todas as rotas de usuarios/urls.py com o cliente de teste e reporta latência '
+        'p50/p95/p99 e consultas por requisição em JSON. Escritas são desfeitas a cada requisição.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=30)
+        parser.add_argument('--aquecimento', type=int, default=3)
+        parser.add_argument('--rotas', nargs='*', help='Limita às rotas com estes nomes.')
+        parser.add_argument('--saida', help='Grava o JSON neste arquivo (para comparar execuções).')
+
+    def handle(self, *args, **options):
+        amostra = self._amostra()
+        # Com DEBUG e ALLOWED_HOSTS vazio só localhost é aceito; nos testes, só testserver
+        client = Client(SERVER_NAME='testserver' if 'testserver' in settings.ALLOWED_HOSTS else 'localhost')
+        resultados = {}
+        for padrao in urlpatterns:
+            if not isinstance(padrao, URLPattern) or not padrao.name:
+                continue
+            if options['rotas'] and padrao.name not in options['rotas']:
+                continue
+            kwargs = {nome: amostra[nome] for nome in padrao.pattern.converters}
+            url = reverse(padrao.name, kwargs=kwargs)
+            if padrao.name == 'proximos_horarios':
+                url += f'?especialidade={amostra["especialidade"]}'
+            elif padrao.name == 'carregar_cidades':
+                url += f'?estado={amostra["estado"]}'
+            resultados[padrao.name] = self._medir(client, padrao.name, url, amostra, options)
+
+        saida = {
+            'executado_em': timezone.now().isoformat(),
+            'banco': str(connection.settings_dict['NAME']),
+            'volumes': {
+                'usuarios': Usuario.objects.count(),
+                'profissionais': Profissional.objects.count(),
+                'avaliacoes': Avaliacao.objects.count(),
+                'comentarios': Comentario.objects.count(),
+            },
+            'repeticoes': options['repeticoes'],
+            'rotas': resultados,
+        }
+        texto = json.dumps(saida, indent=2, ensure_ascii=False)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(texto)
+        self.stdout.write(texto)
+
+    def _amostra(self):
+        profissional = Profissional.objects.filter(avaliacoes__isnull=False).select_related('usuario').first()
+        profissional = profissional or Profissional.objects.select_related('usuario').first()
+        if profissional is None:
+            raise CommandError('Banco sem profissionais; rode gerar_dados primeiro.')
+        # Um cliente que ainda não avaliou o profissional, para a rota de avaliação fazer a escrita completa
+        usuario = Usuario.objects.filter(profissional__isnull=True).exclude(avaliacao__profissional=profissional).first()
+        avaliacao = profissional.avaliacoes.first() or Avaliacao.objects.first()
+        comentario = Comentario.objects.filter(autor=usuario).first() or Comentario.objects.first()
+        servico = Servico.objects.filter(cliente=usuario, status='AGENDADO').first() or Servico.objects.first()
+        dia = Disponibilidade.objects.filter(profissional=profissional, livres__gt=0).exclude(
+            dia=timezone.localdate()).order_by('dia').first()
+        horario = None
+        if dia:
+            horario = disponibilidade.horario_do_slot(dia.dia, (dia.menor_bit).bit_length() - 1).isoformat()
+        endereco = profissional.usuario.endereco
+        return {
+            'usuario': usuario,
+            'pk': profissional.id,
+            'profissional_id': profissional.id,
+            'avaliacao_id': avaliacao.id if avaliacao else 0,
+            'comentario_id': comentario.id if comentario else 0,
+            'servico_id': servico.id if servico else 0,
+            'especialidade': profissional.especialidade_id or 0,
+            'estado': endereco.cidade.estado_id if endereco else 0,
+            'horario': horario,
+            'tipo': 'avaliacoes',
+            'cep': (endereco.cep if endereco else None) or '01001000',
+        }
+
+    def _requisitar(self, client, nome, url, amostra, metodo):
+        if metodo == 'GET':
+            return client.get(url)
+        dados = dict(DADOS_POST.get(nome, {}))
+        if nome == 'agendar_horario' and amostra['horario']:
+            dados['horario'] = amostra['horario']
+        # Cada escrita roda numa transação desfeita, então todas as repetições veem o mesmo estado
+        with transaction.atomic():
+            resposta = client.post(url, dados)
+            transaction.set_rollback(True)
+        return resposta
+
+    def _medir(self, client, nome, url, amostra, options):
+        client.force_login(amostra['usuario'])
+        metodo = 'GET'
+        if client.get(url).status_code == 405 and nome not in NAO_ENVIAR_POST:
+            metodo = 'POST'
+
+        latencias, consultas, status = [], [], {}
+        for i in range(options['aquecimento'] + options['repeticoes']):
+            if nome == 'logout':
+                client.force_login(amostra['usuario'])
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                resposta = self._requisitar(client, nome, url, amostra, metodo)
+                decorrido = (time.perf_counter() - inicio) * 1000
+            if i < options['aquecimento']:
+                continue
+            latencias.append(decorrido)
+            # SAVEPOINT/RELEASE do rollback do benchmark não contam
+            consultas.append(sum(1 for q in capturadas.captured_queries if 'SAVEPOINT' not in q['sql']))
+            status[resposta.status_code] = status.get(resposta.status_code, 0) + 1
+
+        latencias.sort()
+        return {
+            'metodo': metodo,
+            'url': url,
+            'status': {str(k): v for k, v in status.items()},
+            'p50_ms': round(statistics.median(latencias), 2),
+            'p95_ms': round(_percentil(latencias, 0.95), 2),
+            'p99_ms': round(_percentil(latencias, 0.99), 2),
+            'consultas': round(statistics.mean(consultas), 1),
+            'consultas_max': max(consultas),
+        }
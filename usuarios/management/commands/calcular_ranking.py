@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg
+
+from usuarios import ranking
+from usuarios.models import Avaliacao
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula a pontuação "mais bem avaliados" de todos os profissionais (rodar diariamente; '
+        'entre execuções cada nova avaliação atualiza a pontuação do profissional na hora).'
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = ranking.recalcular()
+        self.stdout.write(self.style.SUCCESS(f'{total} profissionais pontuados em {time.perf_counter() - inicio:.1f}s.'))
+        # Referência para ajustar RANKING_PRIOR_NOTA / RANKING_PRIOR_RECOMENDA
+        medias = Avaliacao.objects.aggregate(nota=Avg('nota'), recomenda=Avg('recomenda'))
+        if medias['nota'] is not None:
+            self.stdout.write(f'Média geral: nota {medias["nota"]:.2f}, recomenda {medias["recomenda"]:.2f}')
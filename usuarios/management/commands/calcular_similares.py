@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from usuarios import similares
+
+
+class Command(BaseCommand):
+    help = (
+        'Calcula o painel "profissionais parecidos" (coavaliações + especialidade, cidade e preço) '
+        'e grava o top-K de cada profissional. Rodar completo à noite e com --incremental ao longo do dia.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', type=int, metavar='MINUTOS',
+            help='Recalcula só os profissionais afetados por avaliações e alterações dos últimos MINUTOS.',
+        )
+        parser.add_argument('--profissionais', type=int, nargs='*', help='Recalcula só estes profissionais.')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        alvo = options['profissionais']
+        if options['incremental'] is not None:
+            alvo = similares.afetados_desde(timezone.now() - timedelta(minutes=options['incremental']))
+            self.stdout.write(f'{len(alvo)} profissionais afetados')
+        resultado = similares.calcular(alvo)
+        calculo = time.perf_counter() - inicio
+        alterados = similares.gravar(resultado)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(resultado)} listas calculadas em {calculo:.1f}s, {len(alterados)} gravadas '
+            f'(total {time.perf_counter() - inicio:.1f}s).'
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from usuarios import tendencias
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula a faixa "Em alta" a partir dos contadores de atividade e poda os baldes fora da '
+        'janela. A thread de fundo dos workers já faz isso a cada TENDENCIAS_INTERVALO segundos; o '
+        'comando serve para agendar (cron) sem servidor no ar ou para depois de uma carga.'
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = tendencias.recalcular()
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} profissionais em alta, calculados em {time.perf_counter() - inicio:.2f}s.'
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from usuarios import ceps
+
+
+class Command(BaseCommand):
+    help = (
+        'Compila um CSV de CEPs (colunas uf, cidade, bairro, logradouro e cep ou cep_inicial/cep_final) '
+        'no arquivo binário consultado pela rota buscar_cep (CEP_INDICE).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='CSV separado por vírgula ou ponto e vírgula, em UTF-8.')
+        parser.add_argument('--saida', help='Caminho do índice (padrão: settings.CEP_INDICE).')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        faixas, ignoradas, tamanho = ceps.compilar(options['arquivo'], options['saida'])
+        if ignoradas:
+            self.stdout.write(self.style.WARNING(f'{ignoradas} linhas ignoradas (CEP inválido ou cidade desconhecida).'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{faixas} faixas de CEP gravadas ({tamanho / 1024:.0f} KB) em {time.perf_counter() - inicio:.1f}s.'
+        ))
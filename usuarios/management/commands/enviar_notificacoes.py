@@ -0,0 +1,19 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from usuarios import notificacoes
+
+
+class Command(BaseCommand):
+    help = 'Envia as notificações por e-mail pendentes em lotes, reutilizando uma única conexão SMTP.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=None, help='Mensagens por lote.')
+        parser.add_argument('--continuo', action='store_true', help='Continua aguardando novas mensagens.')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos entre verificações da fila vazia.')
+
+    def handle(self, *args, **options):
+        resultado = notificacoes.drenar(options['lote'], options['continuo'], options['intervalo'])
+        resultado.update(notificacoes.estatisticas_fila())
+        self.stdout.write(json.dumps(resultado, indent=2))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from usuarios import exportacao
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta avaliações, comentários ou serviços em CSV ou JSONL, lendo em lotes '
+        '(EXPORTACAO_TAMANHO_LOTE) e gravando em blocos: a memória não cresce com o histórico.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(exportacao.TIPOS))
+        parser.add_argument('saida', help='Arquivo de destino.')
+        parser.add_argument('--formato', choices=sorted(exportacao.FORMATOS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Comprime a saída com gzip.')
+        parser.add_argument('--profissional', type=int, help='Só os dados deste profissional.')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        tamanho = 0
+        with open(options['saida'], 'wb') as arquivo:
+            for bloco in exportacao.blocos(options['tipo'], options['formato'], options['profissional'], options['gzip']):
+                arquivo.write(bloco)
+                tamanho += len(bloco)
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["tipo"]}: {tamanho / 1024 / 1024:.1f} MB gravados em {time.perf_counter() - inicio:.1f}s.'
+        ))
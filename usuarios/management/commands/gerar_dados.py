@@ -0,0 +1,245 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from usuarios import arquivo, cards, disponibilidade, ranking, referencia, respostas, resumos, similares
+from usuarios.models import (
+    Avaliacao,
+    Cidade,
+    Comentario,
+    Endereco,
+    Especialidade,
+    Estado,
+    Profissional,
+    Servico,
+    Usuario,
+)
+
+NOMES = ['Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+         'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sofia', 'Thiago', 'Vanessa', 'William']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima',
+              'Gomes', 'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Almeida', 'Lopes', 'Soares', 'Fernandes']
+ESPECIALIDADES = ['Cardiologia', 'Dermatologia', 'Pediatria', 'Ortopedia', 'Ginecologia', 'Neurologia',
+                  'Psiquiatria', 'Oftalmologia', 'Endocrinologia', 'Urologia', 'Gastroenterologia',
+                  'Otorrinolaringologia', 'Pneumologia', 'Reumatologia', 'Nutrologia', 'Clínica Geral']
+TITULOS = ['Excelente atendimento', 'Muito atencioso', 'Recomendo', 'Consulta rápida', 'Poderia melhorar',
+           'Não gostei', 'Ótimo profissional', 'Pontual e cuidadoso']
+
+
+@contextmanager
+def sem_auto_now(*campos):
+    # bulk_create respeita auto_now_add; desligamos para gravar datas espalhadas no passado
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera um conjunto de dados sintético em escala (usuários, profissionais, avaliações e '
+        'comentários) com bulk_create em lotes. Use com FACMED_DB apontando para um banco descartável.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=100000, help='Total de usuários (inclui profissionais).')
+        parser.add_argument('--profissionais', type=int, default=20000)
+        parser.add_argument('--avaliacoes', type=int, default=1000000)
+        parser.add_argument('--comentarios', type=int, default=2000000)
+        parser.add_argument('--estados', type=int, default=27)
+        parser.add_argument('--cidades', type=int, default=5570)
+        parser.add_argument('--dias', type=int, default=730, help='Janela de datas das avaliações.')
+        parser.add_argument('--lote', type=int, default=5000)
+        parser.add_argument('--senha', default='senha123', help='Senha de todos os usuários gerados.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--sem-disponibilidade', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['profissionais'] >= options['usuarios']:
+            options['usuarios'] = options['profissionais'] + 1
+        self.rnd = random.Random(options['seed'])
+        self.lote = options['lote']
+        self.agora = timezone.now()
+        inicio = time.perf_counter()
+
+        cidades = self._referencias(options)
+        usuarios = self._usuarios(options, cidades)
+        profissionais = self._profissionais(options, usuarios)
+        clientes = usuarios[options['profissionais']:]
+        avaliacoes = self._avaliacoes(options, profissionais, clientes)
+        self._comentarios(options, avaliacoes, usuarios)
+        # bulk_create não dispara sinais: os read models são reconstruídos no fim
+        self._etapa('cards', lambda: cards.reconstruir())
+        self._etapa('ranking', lambda: ranking.recalcular())
+        self._etapa('resumos', lambda: resumos.reconstruir())
+        self._etapa('respostas', lambda: respostas.recontar())
+        self._etapa('similares', lambda: similares.gravar(similares.calcular()))
+        if not options['sem_disponibilidade']:
+            self._etapa('disponibilidade', lambda: disponibilidade.preencher())
+        self._etapa('estatisticas', lambda: arquivo.analisar())
+
+        self.stdout.write(self.style.SUCCESS(f'Dados gerados em {time.perf_counter() - inicio:.1f}s'))
+
+    def _etapa(self, nome, funcao):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        self.stdout.write(f'{nome}: {time.perf_counter() - inicio:.1f}s')
+        return resultado
+
+    def _em_lotes(self, modelo, gerador, total):
+        # Cria e grava em lotes para a memória não crescer com o total; devolve só os ids
+        ids = []
+        lote = []
+        for obj in gerador:
+            lote.append(obj)
+            if len(lote) >= self.lote:
+                ids.extend(self._gravar(modelo, lote))
+                self.stdout.write(f'  {modelo.__name__}: {len(ids)}/{total}', ending='\r')
+                lote = []
+        if lote:
+            ids.extend(self._gravar(modelo, lote))
+        return ids
+
+    def _gravar(self, modelo, lote):
+        with transaction.atomic():
+            return [o.pk for o in modelo.objects.bulk_create(lote)]
+
+    def _referencias(self, options):
+        prefixo = f'{int(self.agora.timestamp())}'
+        Estado.objects.bulk_create([
+            Estado(nome=f'Estado {chr(65 + i // 26)}{chr(65 + i % 26)}', sigla=f'{chr(65 + i // 26)}{chr(65 + i % 26)}')
+            for i in range(min(options['estados'], 26 * 26))
+        ], ignore_conflicts=True)
+        estados = list(Estado.objects.all())
+        Cidade.objects.bulk_create([
+            Cidade(nome=f'Município {prefixo}-{i}', estado=estados[i % len(estados)])
+            for i in range(options['cidades'])
+        ], batch_size=self.lote)
+        Especialidade.objects.bulk_create(
+            [Especialidade(nome=nome) for nome in ESPECIALIDADES], ignore_conflicts=True,
+        )
+        referencia.invalidar()  # bulk_create não dispara os sinais
+        return list(Cidade.objects.values_list('id', flat=True))
+
+    def _usuarios(self, options, cidades):
+        total = options['usuarios']
+        rnd = self.rnd
+        senha = make_password(options['senha'])  # um único hash reaproveitado
+        prefixo = f'u{int(self.agora.timestamp())}'
+
+        def enderecos():
+            for _ in range(total):
+                yield Endereco(
+                    cidade_id=rnd.choice(cidades),
+                    rua=f'Rua {rnd.choice(SOBRENOMES)}',
+                    numero=str(rnd.randint(1, 3000)),
+                    bairro=f'Bairro {rnd.randint(1, 200)}',
+                    cep=f'{rnd.randint(1000000, 99999999):08d}',
+                )
+
+        endereco_ids = self._etapa('enderecos', lambda: self._em_lotes(Endereco, enderecos(), total))
+
+        def usuarios():
+            for i, endereco_id in enumerate(endereco_ids):
+                nome, sobrenome = rnd.choice(NOMES), rnd.choice(SOBRENOMES)
+                yield Usuario(
+                    username=f'{prefixo}_{i}',
+                    email=f'{prefixo}_{i}@exemplo.com',
+                    password=senha,
+                    first_name=nome,
+                    last_name=sobrenome,
+                    telefone=f'(11) 9{rnd.randint(1000, 9999)}-{rnd.randint(1000, 9999)}',
+                    endereco_id=endereco_id,
+                    date_joined=self.agora - timedelta(days=rnd.randint(0, options['dias'])),
+                )
+
+        return self._etapa('usuarios', lambda: self._em_lotes(Usuario, usuarios(), total))
+
+    def _profissionais(self, options, usuarios):
+        rnd = self.rnd
+        especialidades = list(Especialidade.objects.values_list('id', flat=True))
+        crm_base = (Profissional.objects.order_by('-CRM').values_list('CRM', flat=True).first() or 0) + 1
+
+        def profissionais():
+            for i, usuario_id in enumerate(usuarios[:options['profissionais']]):
+                yield Profissional(
+                    usuario_id=usuario_id,
+                    CRM=crm_base + i,
+                    especialidade_id=rnd.choice(especialidades),
+                    biografia='Profissional com experiência em atendimento clínico. ' * rnd.randint(1, 4),
+                    preco_servico=rnd.randrange(8000, 60000) / 100,
+                )
+
+        return self._etapa(
+            'profissionais', lambda: self._em_lotes(Profissional, profissionais(), options['profissionais']),
+        )
+
+    def _avaliacoes(self, options, profissionais, clientes):
+        total = options['avaliacoes']
+        if not total or not clientes:
+            return []
+        rnd = self.rnd
+        n_clientes, n_prof = len(clientes), len(profissionais)
+        max_rodadas = n_prof
+        total = min(total, n_clientes * max_rodadas)
+
+        def par(j):
+            # Cada cliente avalia cada profissional no máximo uma vez: na rodada r o cliente c
+            # avalia (c * 7919 + r * 104729) mod P, distinto para r < P
+            c, r = j % n_clientes, j // n_clientes
+            return clientes[c], profissionais[(c * 7919 + r * 104729) % n_prof]
+
+        datas = [self.agora - timedelta(minutes=rnd.randint(0, options['dias'] * 24 * 60)) for _ in range(total)]
+
+        def servicos():
+            for j in range(total):
+                cliente_id, profissional_id = par(j)
+                yield Servico(
+                    profissional_id=profissional_id, cliente_id=cliente_id,
+                    data_agendamento=datas[j], data_realizacao=datas[j], status='REALIZADO',
+                )
+
+        servico_ids = self._etapa('servicos', lambda: self._em_lotes(Servico, servicos(), total))
+
+        def avaliacoes():
+            for j, servico_id in enumerate(servico_ids):
+                cliente_id, profissional_id = par(j)
+                nota = min(5, max(1, round(rnd.gauss(4.1, 1.0))))
+                yield Avaliacao(
+                    profissional_id=profissional_id, cliente_id=cliente_id, servico_id=servico_id,
+                    nota=nota, titulo=rnd.choice(TITULOS),
+                    comentario='Fui bem atendido e a consulta resolveu meu problema. ' * rnd.randint(0, 3),
+                    data_avaliacao=datas[j], recomenda=nota >= 3,
+                )
+
+        with sem_auto_now(Avaliacao._meta.get_field('data_avaliacao')):
+            ids = self._etapa('avaliacoes', lambda: self._em_lotes(Avaliacao, avaliacoes(), total))
+        return list(zip(ids, datas))
+
+    def _comentarios(self, options, avaliacoes, usuarios):
+        total = options['comentarios']
+        if not total or not avaliacoes:
+            return
+        rnd = self.rnd
+
+        def comentarios():
+            for _ in range(total):
+                avaliacao_id, data = rnd.choice(avaliacoes)
+                yield Comentario(
+                    avaliacao_id=avaliacao_id,
+                    autor_id=rnd.choice(usuarios),
+                    texto='Obrigado pelo retorno! ' * rnd.randint(1, 3),
+                    data_comentario=min(self.agora, data + timedelta(minutes=rnd.randint(1, 60 * 24 * 30))),
+                )
+
+        with sem_auto_now(Comentario._meta.get_field('data_comentario')):
+            self._etapa('comentarios', lambda: self._em_lotes(Comentario, comentarios(), total))
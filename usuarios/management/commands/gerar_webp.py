@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from usuarios import estaticos
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera as variantes WebP de uma imagem em várias larguras (destino-<largura>.webp) para o '
+        'srcset de uma <img>. Requer Pillow.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('origem', help='Imagem original (PNG, JPEG...).')
+        parser.add_argument('destino', help='Prefixo dos arquivos, por exemplo usuarios/static/images/hero.')
+        parser.add_argument('--larguras', type=int, nargs='+', default=[480, 800, 1200])
+        parser.add_argument('--qualidade', type=int, default=80)
+
+    def handle(self, *args, **options):
+        gravadas = estaticos.variantes_webp(
+            options['origem'], options['destino'], options['larguras'], options['qualidade'],
+        )
+        for caminho, largura, altura, tamanho in gravadas:
+            self.stdout.write(f'{caminho}: {largura}x{altura}, {tamanho / 1024:.1f} KB')
+        self.stdout.write(self.style.SUCCESS(f'{len(gravadas)} variantes gravadas.'))
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from usuarios import moderacao
+from usuarios.models import Avaliacao, Comentario, ComentarioArquivado, Usuario
+
+
+def _data(texto):
+    try:
+        data = datetime.fromisoformat(texto)
+    except ValueError:
+        raise CommandError(f'Data inválida: {texto} (use AAAA-MM-DD ou AAAA-MM-DDTHH:MM)')
+    return timezone.make_aware(data) if timezone.is_naive(data) else data
+
+
+class Command(BaseCommand):
+    help = (
+        'Moderação em massa: apaga avaliações e/ou respostas por autor, período ou trecho do texto, '
+        'em lotes de MODERACAO_LOTE (uma transação por lote), e recalcula os agregados dos '
+        'profissionais afetados uma vez no fim.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('alvo', choices=['avaliacoes', 'comentarios', 'tudo'])
+        parser.add_argument('--autor', action='append', default=[], help='Username do autor (pode repetir).')
+        parser.add_argument('--desde', type=_data, help='Data inicial (inclusive).')
+        parser.add_argument('--ate', type=_data, help='Data final (exclusive).')
+        parser.add_argument('--texto', help='Trecho do título/comentário/resposta (sem diferenciar maiúsculas).')
+        parser.add_argument('--regex', action='store_true', help='Trata --texto como expressão regular.')
+        parser.add_argument('--lote', type=int, help='Linhas por transação (padrão: settings.MODERACAO_LOTE).')
+        parser.add_argument('--pausa', type=float, default=0, help='Segundos de espera entre lotes.')
+        parser.add_argument('--simular', action='store_true', help='Só conta o que seria apagado.')
+
+    def handle(self, *args, **options):
+        criterios = {
+            'desde': options['desde'], 'ate': options['ate'], 'texto': options['texto'], 'regex': options['regex'],
+        }
+        if options['autor']:
+            autores = dict(Usuario.objects.filter(username__in=options['autor']).values_list('username', 'pk'))
+            faltando = sorted(set(options['autor']) - set(autores))
+            if faltando:
+                raise CommandError(f'Usuário(s) não encontrado(s): {", ".join(faltando)}')
+            criterios['autores'] = list(autores.values())
+        alvos = ('avaliacoes', 'comentarios') if options['alvo'] == 'tudo' else (options['alvo'],)
+
+        if options['simular']:
+            if not any(criterios.get(nome) for nome in ('autores', 'desde', 'ate', 'texto')):
+                raise CommandError('Informe ao menos um critério (--autor, --desde, --ate ou --texto).')
+            modelos = {'avaliacoes': [Avaliacao], 'comentarios': [Comentario, ComentarioArquivado]}
+            for alvo in alvos:
+                total = sum(modelo.objects.filter(moderacao.filtro(modelo, **criterios)).count()
+                            for modelo in modelos[alvo])
+                self.stdout.write(f'{alvo}: {total} seriam apagad{"a" if alvo == "avaliacoes" else "o"}s')
+            return
+
+        try:
+            relatorio = moderacao.moderar(alvos, lote=options['lote'], pausa=options['pausa'], **criterios)
+        except ValueError as erro:
+            raise CommandError(str(erro))
+        self.stdout.write(self.style.SUCCESS(
+            f'{relatorio["avaliacoes"]} avaliações, {relatorio["comentarios"]} respostas e '
+            f'{relatorio["servicos"]} serviços apagados em {relatorio["segundos_exclusao"]:.1f}s '
+            f'({relatorio["linhas_por_segundo"]:.0f} linhas/s).'
+        ))
+        self.stdout.write(
+            f'Agregados de {relatorio["profissionais"]} profissionais recalculados em '
+            f'{relatorio["segundos_agregados"]:.1f}s.'
+        )
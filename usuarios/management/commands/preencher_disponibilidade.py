@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from usuarios import disponibilidade
+
+
+class Command(BaseCommand):
+    help = 'Materializa a disponibilidade dos profissionais no horizonte de agendamento (rodar diariamente).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recriar', action='store_true', help='Reconstrói todas as linhas a partir dos agendamentos.')
+
+    def handle(self, *args, **options):
+        total = disponibilidade.preencher(recriar=options['recriar'])
+        self.stdout.write(self.style.SUCCESS(f'{total} dias de agenda processados.'))
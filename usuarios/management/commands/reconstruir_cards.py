@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from usuarios import cards, ranking
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói a tabela ProfissionalCard (listagem) a partir das tabelas de origem.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = cards.reconstruir(lote=options['lote'])
+        ranking.recalcular()
+        self.stdout.write(self.style.SUCCESS(f'{total} cards reconstruídos.'))
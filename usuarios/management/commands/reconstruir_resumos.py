@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from usuarios import resumos
+
+
+class Command(BaseCommand):
+    help = (
+        'Recria os rollups de avaliações (linhas mensais de todo o histórico e diárias dos últimos '
+        'RESUMOS_DIAS_DIARIO dias). Com --podar só apaga as linhas diárias fora da janela (rodar diariamente).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profissionais', nargs='+', type=int, help='Reconstrói só estes profissionais.')
+        parser.add_argument('--podar', action='store_true', help='Só apaga as linhas diárias antigas.')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        if options['podar']:
+            apagadas = resumos.podar()
+            self.stdout.write(self.style.SUCCESS(f'{apagadas} linhas diárias apagadas.'))
+            return
+        total = resumos.reconstruir(options['profissionais'])
+        self.stdout.write(self.style.SUCCESS(f'{total} linhas de resumo gravadas em {time.perf_counter() - inicio:.1f}s.'))
@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from usuarios import carga
+
+
+SERVIDORES = {
+    # Mesma quantidade de processos nos dois modos; o WSGI atende no máximo `threads` requisições por vez
+    'wsgi': lambda porta, threads: [
+        sys.executable, '-m', 'gunicorn', 'core.wsgi:application',
+        '--workers', '1', '--threads', str(threads), '--bind', f'127.0.0.1:{porta}', '--log-level', 'warning',
+    ],
+    'asgi': lambda porta, threads: [
+        sys.executable, '-m', 'uvicorn', 'core.asgi:application',
+        '--workers', '1', '--host', '127.0.0.1', '--port', str(porta), '--log-level', 'warning',
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara a capacidade de requisições concorrentes dos endpoints JSON sob WSGI (gunicorn) e '
+        'ASGI (uvicorn). Usa uma cópia temporária do banco.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modos', nargs='+', choices=sorted(SERVIDORES), default=['wsgi', 'asgi'])
+        parser.add_argument('--concorrencia', type=int, nargs='+', default=[10, 50, 200])
+        parser.add_argument('--duracao', type=float, default=10)
+        parser.add_argument('--threads', type=int, default=4, help='Threads do worker WSGI.')
+        parser.add_argument('--porta', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        origem = settings.DATABASES['default']['NAME']
+        pasta = tempfile.mkdtemp(prefix='facmed-carga-')
+        banco = os.path.join(pasta, 'carga.sqlite3')
+        if os.path.exists(origem):
+            shutil.copy(origem, banco)
+
+        # A partir daqui este processo e os servidores usam apenas a cópia
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = banco
+        try:
+            call_command('migrate', verbosity=0)
+            requisicoes = sum(carga.preparar_dados().values(), [])
+            resultados = {}
+            for modo in options['modos']:
+                resultados[modo] = self._medir(modo, banco, requisicoes, options)
+            self.stdout.write(json.dumps(resultados, indent=2))
+        finally:
+            connections['default'].close()
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    def _medir(self, modo, banco, requisicoes, options):
+        porta = options['porta']
+        url = f'http://127.0.0.1:{porta}'
+        ambiente = dict(os.environ, FACMED_DB=banco, DJANGO_SETTINGS_MODULE='core.settings')
+        try:
+            servidor = subprocess.Popen(SERVIDORES[modo](porta, options['threads']), env=ambiente, cwd=settings.BASE_DIR)
+        except FileNotFoundError as e:
+            raise CommandError(f'Servidor {modo} não disponível: {e}')
+        try:
+            if not carga.aguardar_servidor(url):
+                raise CommandError(f'Servidor {modo} não respondeu (instale gunicorn/uvicorn).')
+            return [
+                carga.disparar(url, requisicoes, concorrencia, options['duracao'])
+                for concorrencia in options['concorrencia']
+            ]
+        finally:
+            servidor.terminate()
+            servidor.wait()
@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import urllib.request
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from usuarios import carga
+from usuarios.management.commands.teste_carga_asgi import SERVIDORES
+
+
+class Command(BaseCommand):
+    help = (
+        'Sobrecarrega as escritas (avaliar/comentar) com a trava de escrita do SQLite disputada por '
+        'um lote simulado e mede, em separado, a latência das leituras (carregar_cidades e login), '
+        'sem e com o controle de carga (CARGA_*). Usa uma cópia temporária do banco.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modo', choices=sorted(SERVIDORES), default='wsgi')
+        parser.add_argument('--threads', type=int, default=8, help='Threads do worker WSGI.')
+        parser.add_argument('--leitores', type=int, default=10, help='Clientes simultâneos de leitura.')
+        parser.add_argument('--escritores', type=int, default=50, help='Clientes simultâneos de escrita.')
+        parser.add_argument('--duracao', type=float, default=10)
+        parser.add_argument('--segurar', type=float, default=1.0, help='Segundos com a trava de escrita presa.')
+        parser.add_argument('--intervalo', type=float, default=0.1, help='Segundos com a trava livre.')
+        parser.add_argument(
+            '--ignorar-retry-after', action='store_true',
+            help='Clientes repetem na hora depois de um 503, em vez de esperar o Retry-After.',
+        )
+        parser.add_argument('--porta', type=int, default=8766)
+
+    def handle(self, *args, **options):
+        origem = settings.DATABASES['default']['NAME']
+        pasta = tempfile.mkdtemp(prefix='facmed-sobrecarga-')
+        banco = os.path.join(pasta, 'carga.sqlite3')
+        if os.path.exists(origem):
+            shutil.copy(origem, banco)
+
+        # A partir daqui este processo e os servidores usam apenas a cópia
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = banco
+        try:
+            call_command('migrate', verbosity=0)
+            requisicoes = carga.preparar_dados()
+            requisicoes['leitura'].append(('GET', '/login/', {}, None))
+            connections['default'].close()
+            resultados = {
+                cenario: self._medir(banco, requisicoes, controle, options)
+                for cenario, controle in (('sem_controle', False), ('com_controle', True))
+            }
+            self.stdout.write(json.dumps(resultados, indent=2))
+        finally:
+            connections['default'].close()
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    def _medir(self, banco, requisicoes, controle, options):
+        porta = options['porta']
+        url = f'http://127.0.0.1:{porta}'
+        ambiente = dict(
+            os.environ, FACMED_DB=banco, FACMED_CONTROLE_CARGA='1' if controle else '0',
+            DJANGO_SETTINGS_MODULE='core.settings',
+        )
+        try:
+            servidor = subprocess.Popen(
+                SERVIDORES[options['modo']](porta, options['threads']), env=ambiente, cwd=settings.BASE_DIR,
+                stdout=sys.stderr,  # os prints das views não podem misturar-se ao JSON
+            )
+        except FileNotFoundError as e:
+            raise CommandError(f'Servidor {options["modo"]} não disponível: {e}')
+        parar = threading.Event()
+        try:
+            if not carga.aguardar_servidor(url):
+                raise CommandError(f'Servidor {options["modo"]} não respondeu (instale gunicorn/uvicorn).')
+            trava = carga.segurar_trava_escrita(banco, options['segurar'], options['intervalo'], parar)
+            resultado = carga.disparar_grupos(url, {
+                'leitura': (requisicoes['leitura'], options['leitores']),
+                'escrita': (requisicoes['escrita'], options['escritores']),
+            }, options['duracao'], respeitar_retry_after=not options['ignorar_retry_after'])
+            parar.set()
+            trava.join()
+            if controle:
+                with urllib.request.urlopen(f'{url}/carga/metricas/', timeout=10) as resposta:
+                    resultado['metricas'] = json.load(resposta)
+            return resultado
+        finally:
+            parar.set()
+            servidor.terminate()
+            servidor.wait()
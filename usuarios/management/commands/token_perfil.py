@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from usuarios import perfilamento
+
+
+class Command(BaseCommand):
+    help = 'Gera um token para o cabeçalho X-Perfil, que perfila a requisição (PerfilamentoMiddleware).'
+
+    def handle(self, *args, **options):
+        self.stdout.write(perfilamento.gerar_token())
+        self.stderr.write(f'Válido por {settings.PERFIL_VALIDADE_TOKEN} s. Ex.: curl -H "X-Perfil: <token>" <url>')
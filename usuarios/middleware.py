@@ -0,0 +1,378 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from . import admissao, estaticos, perfilamento
+
+logger = logging.getLogger('usuarios.sql')
+
+_medicao_atual = ContextVar('medicao_sql', default=None)
+_LISTA_PARAMETROS = re.compile(r'%s(?:, %s)+')
+
+
+class MedicaoSQL:
+    __slots__ = ('consultas', 'tempo', 'assinaturas')
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo = 0.0
+        self.assinaturas = Counter()
+
+    def registrar(self, sql, duracao):
+        self.consultas += 1
+        self.tempo += duracao
+        # O SQL do Django já vem com placeholders; só listas IN de tamanho variável precisam normalizar
+        if '%s, %s' in sql:
+            sql = _LISTA_PARAMETROS.sub('%s, ...', sql)
+        self.assinaturas[sql] += 1
+
+    def mais_repetida(self):
+        if not self.assinaturas:
+            return None, 0
+        return self.assinaturas.most_common(1)[0]
+
+
+def _wrapper_sql(execute, sql, params, many, context):
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicao.registrar(sql, time.perf_counter() - inicio)
+
+
+def _instalar_wrapper(connection, **kwargs):
+    # O wrapper fica permanente em cada conexão (inclusive nas threads do sync_to_async das
+    # views assíncronas) e só mede quando há uma requisição ativa no contexto.
+    if _wrapper_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_wrapper_sql)
+
+
+connection_created.connect(_instalar_wrapper)
+
+
+class EstaticosMiddleware:
+    """
+    Serve os arquivos de STATIC_ROOT (gerados pelo collectstatic) antes das sessões, do CSRF e da
+    instrumentação: variante .gz conforme o Accept-Encoding e cache imutável para os nomes com
+    hash (usuarios/estaticos.py). Caminhos que não são de um arquivo coletado seguem adiante.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.path.startswith(settings.STATIC_URL):
+            resposta = estaticos.resposta(request)
+            if resposta is not None:
+                return resposta
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path.startswith(settings.STATIC_URL):
+            # Leitura de arquivo local: numa thread qualquer, sem passar pela thread das views síncronas
+            resposta = await sync_to_async(estaticos.resposta, thread_sensitive=False)(request)
+            if resposta is not None:
+                return resposta
+        return await self.get_response(request)
+
+
+class ControleCargaMiddleware:
+    """
+    Limite de concorrência, fila e orçamento de tempo por rota (usuarios/admissao.py). Fica logo
+    depois dos estáticos: uma requisição recusada volta com 503 e Retry-After sem ler a sessão. A
+    vaga é liberada quando a view termina ou, numa resposta em streaming, quando o corpo acaba.
+    O prazo vale só dentro da view (PrazoDaViewMiddleware, no fim da lista).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            admissao.instalar_wrapper(connection)
+
+    @staticmethod
+    def _espera(pool, orcamento):
+        return min(pool.espera, orcamento) if orcamento else pool.espera
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not admissao.ativo():
+            return self.get_response(request)
+        pool, orcamento = admissao.para(request)
+        if pool is None:
+            return self.get_response(request)
+        chegada = time.monotonic()
+        if not pool.entrar(self._espera(pool, orcamento)):
+            return admissao.recusar(pool)
+        request.pool_carga = pool
+        request.prazo_carga = chegada + orcamento if orcamento else None
+        inicio = time.monotonic()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            pool.sair(time.monotonic() - inicio)
+            raise
+        return self._liberar_no_fim(response, pool, inicio)
+
+    async def __acall__(self, request):
+        if not admissao.ativo():
+            return await self.get_response(request)
+        pool, orcamento = admissao.para(request)
+        if pool is None:
+            return await self.get_response(request)
+        chegada = time.monotonic()
+        if not await pool.aentrar(self._espera(pool, orcamento)):
+            return admissao.recusar(pool)
+        request.pool_carga = pool
+        request.prazo_carga = chegada + orcamento if orcamento else None
+        inicio = time.monotonic()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            pool.sair(time.monotonic() - inicio)
+            raise
+        return self._liberar_no_fim(response, pool, inicio)
+
+    def process_exception(self, request, exception):
+        pool = getattr(request, 'pool_carga', None)
+        if pool is not None and admissao.esgotou(exception):
+            return admissao.recusar(pool, 'orcamento')
+        return None
+
+    @staticmethod
+    def _liberar_no_fim(response, pool, inicio):
+        if not response.streaming:
+            pool.sair(time.monotonic() - inicio)
+            return response
+
+        def liberar():
+            pool.sair(time.monotonic() - inicio)
+
+        # O servidor fecha o iterador ao terminar (ou quando o cliente desconecta): o finally roda
+        if response.is_async:
+            async def conteudo(partes):
+                try:
+                    async for parte in partes:
+                        yield parte
+                finally:
+                    liberar()
+        else:
+            def conteudo(partes):
+                try:
+                    yield from partes
+                finally:
+                    liberar()
+        response.streaming_content = conteudo(response.streaming_content)
+        return response
+
+
+class PrazoDaViewMiddleware:
+    """
+    Aplica às consultas da view o prazo que o ControleCargaMiddleware calculou. Fica por último:
+    a gravação da sessão e o resto da volta dos middlewares rodam sem prazo, porque ali um
+    OrcamentoEsgotado não passaria pelo process_exception e viraria 500.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = admissao.definir_prazo(getattr(request, 'prazo_carga', None))
+        try:
+            return self.get_response(request)
+        finally:
+            admissao.limpar_prazo(token)
+
+    async def __acall__(self, request):
+        token = admissao.definir_prazo(getattr(request, 'prazo_carga', None))
+        try:
+            return await self.get_response(request)
+        finally:
+            admissao.limpar_prazo(token)
+
+
+class InstrumentacaoSQLMiddleware:
+    """
+    Mede consultas SQL por requisição: quantidade, tempo total no banco e consultas repetidas
+    (indício de N+1). Publica os números no cabeçalho Server-Timing e registra um alerta quando
+    a view passa do orçamento configurado em SQL_ORCAMENTO_* / SQL_ORCAMENTOS_POR_VIEW.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            _instalar_wrapper(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        medicao = MedicaoSQL()
+        token = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        return self._finalizar(request, response, medicao, time.perf_counter() - inicio)
+
+    async def __acall__(self, request):
+        medicao = MedicaoSQL()
+        token = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        return self._finalizar(request, response, medicao, time.perf_counter() - inicio)
+
+    def _orcamento(self, nome_view):
+        orcamento = {
+            'consultas': getattr(settings, 'SQL_ORCAMENTO_CONSULTAS', 50),
+            'tempo_ms': getattr(settings, 'SQL_ORCAMENTO_TEMPO_MS', 250),
+            'repeticoes': getattr(settings, 'SQL_LIMITE_REPETICOES', 10),
+        }
+        orcamento.update(getattr(settings, 'SQL_ORCAMENTOS_POR_VIEW', {}).get(nome_view, {}))
+        return orcamento
+
+    def _finalizar(self, request, response, medicao, duracao):
+        tempo_db_ms = medicao.tempo * 1000
+        response['Server-Timing'] = (
+            f'db;dur={tempo_db_ms:.2f};desc="{medicao.consultas} consultas", total;dur={duracao * 1000:.2f}'
+        )
+
+        nome_view = request.resolver_match.view_name if request.resolver_match else request.path
+        orcamento = self._orcamento(nome_view)
+        sql_repetido, repeticoes = medicao.mais_repetida()
+        problemas = []
+        if medicao.consultas > orcamento['consultas']:
+            problemas.append(f'{medicao.consultas} consultas (orçamento {orcamento["consultas"]})')
+        if tempo_db_ms > orcamento['tempo_ms']:
+            problemas.append(f'{tempo_db_ms:.1f} ms no banco (orçamento {orcamento["tempo_ms"]} ms)')
+        if repeticoes >= orcamento['repeticoes']:
+            problemas.append(f'possível N+1: consulta repetida {repeticoes}x: {sql_repetido[:200]}')
+        if problemas:
+            logger.warning('%s %s excedeu o orçamento de SQL: %s', request.method, nome_view, '; '.join(problemas))
+        return response
+
+
+class PerfilamentoMiddleware:
+    """
+    Perfila uma requisição sob demanda: staff com ?_perfil=1 na URL, ou qualquer cliente com um
+    token assinado no cabeçalho X-Perfil (manage.py token_perfil). Grava o pstats do cProfile e as
+    pilhas colapsadas (para flame graph) como CapturaPerfil, listadas no admin e podadas a cada
+    captura nova (PERFIL_MAXIMO_CAPTURAS, PERFIL_DIAS_CAPTURAS). Sem gatilho o custo é o de duas
+    buscas em dicionário.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _gatilho(self, request):
+        token = request.META.get('HTTP_X_PERFIL')
+        if token is not None:
+            return 'token' if perfilamento.token_valido(token) else None
+        if '_perfil=' in request.META.get('QUERY_STRING', '') and request.GET.get('_perfil') == '1':
+            return 'staff'
+        return None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        gatilho = self._gatilho(request)
+        if gatilho is None or (gatilho == 'staff' and not request.user.is_staff):
+            return self.get_response(request)
+        captura = perfilamento.tentar_capturar()
+        if captura is None:
+            return self.get_response(request)
+        try:
+            with captura:
+                response = self.get_response(request)
+            return self._gravar(request, response, captura)
+        finally:
+            perfilamento.liberar()
+
+    async def __acall__(self, request):
+        gatilho = self._gatilho(request)
+        if gatilho is None or (gatilho == 'staff' and not (await request.auser()).is_staff):
+            return await self.get_response(request)
+        captura = perfilamento.tentar_capturar()
+        if captura is None:
+            return await self.get_response(request)
+        # Em views assíncronas o perfil cobre a thread do event loop inteira, com as outras
+        # requisições que rodarem nela; o trabalho feito em sync_to_async aparece como espera.
+        # A captura fica marcada com escopo "loop" no admin.
+        try:
+            with captura:
+                response = await self.get_response(request)
+            return await sync_to_async(self._gravar)(request, response, captura, escopo='loop')
+        finally:
+            perfilamento.liberar()
+
+    def _gravar(self, request, response, captura, escopo='thread'):
+        from .models import CapturaPerfil
+
+        rota = request.resolver_match.view_name if request.resolver_match else 'sem_rota'
+        nome = f'{rota.replace(":", "-")}-{timezone.now():%Y%m%d-%H%M%S-%f}'
+        usuario = getattr(request, 'user', None)
+        registro = CapturaPerfil(
+            rota=rota,
+            caminho=request.get_full_path()[:500],
+            metodo=request.method,
+            status_code=response.status_code,
+            usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+            duracao_ms=captura.duracao * 1000,
+            amostras=sum(captura.amostrador.pilhas.values()),
+            escopo=escopo,
+        )
+        registro.arquivo_pstats.save(f'{nome}.pstats', ContentFile(captura.pstats_bytes()), save=False)
+        registro.arquivo_pilhas.save(f'{nome}.txt', ContentFile(captura.pilhas_colapsadas().encode()), save=False)
+        registro.save()
+        perfilamento.podar()
+        response['X-Perfil-Captura'] = str(registro.pk)
+        return response
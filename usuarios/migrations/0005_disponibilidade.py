@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0004_alter_usuario_options_alter_usuario_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Disponibilidade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('livres', models.BigIntegerField(default=0)),
+                ('menor_bit', models.BigIntegerField(default=0)),
+                ('cidade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='usuarios.cidade')),
+                ('especialidade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='usuarios.especialidade')),
+                ('profissional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='disponibilidades', to='usuarios.profissional')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('livres__gt', 0)), fields=['especialidade', 'cidade', 'dia', 'menor_bit'], name='disp_esp_cidade_dia'), models.Index(condition=models.Q(('livres__gt', 0)), fields=['especialidade', 'dia', 'menor_bit'], name='disp_esp_dia')],
+                'constraints': [models.UniqueConstraint(fields=('profissional', 'dia'), name='disponibilidade_profissional_dia')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0006_notificacaoemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profissional',
+            name='atualizado_em',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='profissional',
+            name='versao',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
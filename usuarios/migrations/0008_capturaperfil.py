@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0007_profissional_versao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CapturaPerfil',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rota', models.CharField(max_length=100)),
+                ('caminho', models.CharField(max_length=500)),
+                ('metodo', models.CharField(max_length=10)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duracao_ms', models.FloatField()),
+                ('amostras', models.PositiveIntegerField(default=0)),
+                ('arquivo_pstats', models.FileField(upload_to='perfis')),
+                ('arquivo_pilhas', models.FileField(upload_to='perfis')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'captura de perfil',
+                'verbose_name_plural': 'capturas de perfil',
+                'ordering': ['-criado_em'],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+
+def preencher_cards(apps, schema_editor):
+    # Carga inicial sem miniaturas; `manage.py reconstruir_cards` gera as miniaturas depois
+    Profissional = apps.get_model('usuarios', 'Profissional')
+    ProfissionalCard = apps.get_model('usuarios', 'ProfissionalCard')
+    profissionais = Profissional.objects.select_related(
+        'usuario__endereco__cidade__estado', 'especialidade',
+    ).annotate(media=Avg('avaliacoes__nota'), total=Count('avaliacoes'))
+    cards = []
+    for p in profissionais.iterator(chunk_size=1000):
+        usuario = p.usuario
+        nome = f'{usuario.first_name} {usuario.last_name}'.strip() or usuario.username
+        cidade = usuario.endereco.cidade if usuario.endereco_id else None
+        cards.append(ProfissionalCard(
+            profissional_id=p.pk,
+            nome=nome,
+            busca=f'{usuario.username} {nome}',
+            crm=p.CRM,
+            especialidade_id=p.especialidade_id,
+            especialidade_nome=p.especialidade.nome if p.especialidade_id else '',
+            cidade_id=cidade.pk if cidade else None,
+            cidade_nome=cidade.nome if cidade else '',
+            estado_sigla=cidade.estado.sigla if cidade and cidade.estado_id else '',
+            preco_servico=p.preco_servico,
+            nota_media=p.media,
+            total_avaliacoes=p.total,
+        ))
+    ProfissionalCard.objects.bulk_create(cards, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0008_capturaperfil'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfissionalCard',
+            fields=[
+                ('profissional', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='usuarios.profissional')),
+                ('nome', models.CharField(max_length=300)),
+                ('busca', models.CharField(max_length=500)),
+                ('crm', models.IntegerField()),
+                ('especialidade_nome', models.CharField(blank=True, default='', max_length=100)),
+                ('cidade_nome', models.CharField(blank=True, default='', max_length=100)),
+                ('estado_sigla', models.CharField(blank=True, default='', max_length=2)),
+                ('preco_servico', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('nota_media', models.FloatField(blank=True, null=True)),
+                ('total_avaliacoes', models.PositiveIntegerField(default=0)),
+                ('imagem_url', models.CharField(blank=True, default='', max_length=300)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('cidade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='usuarios.cidade')),
+                ('especialidade', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='usuarios.especialidade')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['nome', 'profissional'], name='card_nome'), models.Index(fields=['especialidade', 'nome', 'profissional'], name='card_especialidade_nome')],
+            },
+        ),
+        migrations.RunPython(preencher_cards, migrations.RunPython.noop),
+    ]
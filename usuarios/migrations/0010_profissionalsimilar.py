@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:13
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0009_profissionalcard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfissionalSimilar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posicao', models.PositiveSmallIntegerField()),
+                ('pontuacao', models.FloatField()),
+                ('coavaliacoes', models.PositiveIntegerField(default=0)),
+                ('calculado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('profissional', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='similares', to='usuarios.profissional')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='usuarios.profissionalcard')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('profissional', 'posicao'), name='similar_posicao_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0010_profissionalsimilar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profissionalcard',
+            name='ranking',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profissionalcard',
+            name='ranking_peso',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profissionalcard',
+            name='ranking_referencia',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='profissionalcard',
+            name='ranking_soma_notas',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profissionalcard',
+            name='ranking_soma_recomenda',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='profissionalcard',
+            index=models.Index(fields=['-ranking', 'profissional'], name='card_ranking'),
+        ),
+        migrations.AddIndex(
+            model_name='profissionalcard',
+            index=models.Index(fields=['especialidade', '-ranking', 'profissional'], name='card_especialidade_ranking'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0011_ranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoAvaliacoes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('D', 'Diário'), ('M', 'Mensal')], max_length=1)),
+                ('inicio', models.DateField()),
+                ('avaliacoes', models.IntegerField(default=0)),
+                ('estrelas_1', models.IntegerField(default=0)),
+                ('estrelas_2', models.IntegerField(default=0)),
+                ('estrelas_3', models.IntegerField(default=0)),
+                ('estrelas_4', models.IntegerField(default=0)),
+                ('estrelas_5', models.IntegerField(default=0)),
+                ('recomendacoes', models.IntegerField(default=0)),
+                ('respostas', models.IntegerField(default=0)),
+                ('profissional', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='resumos', to='usuarios.profissional')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('profissional', 'periodo', 'inicio'), name='resumo_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('usuarios', '0012_resumoavaliacoes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avaliacao',
+            index=models.Index(fields=['data_avaliacao'], name='avaliacao_data'),
+        ),
+        migrations.AddIndex(
+            model_name='comentario',
+            index=models.Index(fields=['data_comentario'], name='comentario_data'),
+        ),
+        migrations.AddIndex(
+            model_name='endereco',
+            index=models.Index(fields=['cep'], name='endereco_cep'),
+        ),
+        migrations.AddIndex(
+            model_name='servico',
+            index=models.Index(fields=['data_agendamento'], name='servico_agendamento'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['email'], name='usuario_email'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['date_joined'], name='usuario_cadastro'),
+        ),
+    ]
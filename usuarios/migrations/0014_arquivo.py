@@ -0,0 +1,49 @@
+# Generated by Django 5.1.4 on 2026-10-19 14:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0013_indices_admin'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='avaliacao',
+            name='servico',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='usuarios.servico'),
+        ),
+        migrations.CreateModel(
+            name='ComentarioArquivado',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('texto', models.TextField()),
+                ('data_comentario', models.DateTimeField()),
+                ('autor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('avaliacao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='respostas_arquivadas', to='usuarios.avaliacao')),
+            ],
+            options={
+                'verbose_name': 'comentário arquivado',
+                'verbose_name_plural': 'comentários arquivados',
+            },
+        ),
+        migrations.CreateModel(
+            name='ServicoArquivado',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('data_agendamento', models.DateTimeField()),
+                ('data_realizacao', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('AGENDADO', 'Agendado'), ('REALIZADO', 'Realizado'), ('CANCELADO', 'Cancelado')], max_length=20)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('profissional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='servicos_arquivados', to='usuarios.profissional')),
+            ],
+            options={
+                'verbose_name': 'serviço arquivado',
+                'verbose_name_plural': 'serviços arquivados',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-19 15:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Carga inicial do total: respostas quentes e arquivadas de cada avaliação
+CONTAR_RESPOSTAS = '''
+UPDATE usuarios_avaliacao SET total_respostas =
+    (SELECT count(*) FROM usuarios_comentario c WHERE c.avaliacao_id = usuarios_avaliacao.id)
+    + (SELECT count(*) FROM usuarios_comentarioarquivado a WHERE a.avaliacao_id = usuarios_avaliacao.id)
+'''
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0015_versao_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='avaliacao',
+            name='total_respostas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='comentario',
+            name='avaliacao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='respostas', to='usuarios.avaliacao'),
+        ),
+        migrations.AddIndex(
+            model_name='comentario',
+            index=models.Index(fields=['avaliacao', 'data_comentario', 'id'], name='comentario_thread'),
+        ),
+        migrations.RunSQL(CONTAR_RESPOSTAS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-19 15:08
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remover_duplicadas(apps, schema_editor):
+    # Envios repetidos antes da restrição: fica a primeira avaliação de cada par. Os serviços
+    # criados junto com as repetidas saem também (e levam as avaliações na cascata). Os
+    # agregados dos profissionais afetados se refazem com reconstruir_cards, calcular_ranking e
+    # reconstruir_resumos.
+    Avaliacao = apps.get_model('usuarios', 'Avaliacao')
+    Servico = apps.get_model('usuarios', 'Servico')
+    ServicoArquivado = apps.get_model('usuarios', 'ServicoArquivado')
+    pares = Avaliacao.objects.values('profissional_id', 'cliente_id').annotate(
+        total=Count('id'), primeira=Min('id'),
+    ).filter(total__gt=1)
+    for par in list(pares):
+        repetidas = Avaliacao.objects.filter(
+            profissional_id=par['profissional_id'], cliente_id=par['cliente_id'],
+        ).exclude(pk=par['primeira'])
+        servicos = list(repetidas.values_list('servico_id', flat=True))
+        ServicoArquivado.objects.filter(pk__in=servicos).delete()
+        Servico.objects.filter(pk__in=servicos).delete()
+        repetidas.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0016_respostas'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='avaliacao',
+            constraint=models.UniqueConstraint(fields=('profissional', 'cliente'), name='avaliacao_profissional_cliente'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-19 15:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0017_avaliacao_unica'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfissionalEmAlta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posicao', models.PositiveSmallIntegerField(unique=True)),
+                ('pontuacao', models.FloatField()),
+                ('avaliacoes', models.PositiveIntegerField(default=0)),
+                ('agendamentos', models.PositiveIntegerField(default=0)),
+                ('calculado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('profissional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='usuarios.profissionalcard')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AtividadeRecente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balde', models.IntegerField()),
+                ('avaliacoes', models.IntegerField(default=0)),
+                ('agendamentos', models.IntegerField(default=0)),
+                ('profissional', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='usuarios.profissional')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['balde'], name='atividade_balde')],
+                'constraints': [models.UniqueConstraint(fields=('profissional', 'balde'), name='atividade_balde_unico')],
+            },
+        ),
+    ]
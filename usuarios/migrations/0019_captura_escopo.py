@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0018_tendencias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='capturaperfil',
+            name='escopo',
+            field=models.CharField(choices=[('thread', 'Thread da requisição'), ('loop', 'Event loop inteiro')], default='thread', max_length=10),
+        ),
+    ]
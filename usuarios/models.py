@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
 
 
 class Estado(models.Model):
@@ -24,6 +25,11 @@ class Endereco(models.Model):
     bairro = models.CharField(max_length=100, blank=True, null=True)
     cep = models.CharField(max_length=8, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['cep'], name='endereco_cep'),  # busca do admin
+        ]
+
     def __str__(self):
         return f'{self.cidade.nome} - {self.cidade.estado.sigla}'
 
@@ -37,6 +43,11 @@ class Usuario(AbstractUser):
 
     class Meta:
         db_table = 'usuario'
+        # Busca e hierarquia de datas do admin
+        indexes = [
+            models.Index(fields=['email'], name='usuario_email'),
+            models.Index(fields=['date_joined'], name='usuario_cadastro'),
+        ]
 
     def delete(self, *args, **kwargs):
         try:
@@ -83,6 +94,24 @@ class Profissional(models.Model):
     CRM = models.IntegerField(unique=True, default=None)
     biografia = models.TextField(blank=True, null=True)
     preco_servico = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Incrementado a cada alteração que muda a página de detalhes (validador do ETag)
+    versao = models.PositiveIntegerField(default=0)
+    atualizado_em = models.DateTimeField(default=timezone.now)
+
+    def save(self, *args, **kwargs):
+        adicionando = self._state.adding
+        # No banco, não a partir da cópia em memória: duas edições simultâneas mudam a versão duas vezes
+        self.versao = 1 if adicionando else models.F('versao') + 1
+        self.atualizado_em = timezone.now()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'versao', 'atualizado_em'}
+        super().save(*args, **kwargs)
+        if not adicionando:
+            self.refresh_from_db(fields=['versao'])
+
+    @classmethod
+    def marcar_alterados(cls, queryset):
+        return queryset.update(versao=models.F('versao') + 1, atualizado_em=timezone.now())
 
     def calcular_nota_media(self):
         avaliacoes = self.avaliacoes.all()
@@ -96,16 +125,38 @@ class Profissional(models.Model):
         return self.usuario.username
 
 
+STATUS_SERVICO = [
+    ('AGENDADO', 'Agendado'),
+    ('REALIZADO', 'Realizado'),
+    ('CANCELADO', 'Cancelado')
+]
+
+
 class Servico(models.Model):
     profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name='servicos')
     cliente = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='servicos_contratados')
     data_agendamento = models.DateTimeField()
     data_realizacao = models.DateTimeField(null=True, blank=True)
-    status = models.CharField(max_length=20, choices=[
-        ('AGENDADO', 'Agendado'),
-        ('REALIZADO', 'Realizado'),
-        ('CANCELADO', 'Cancelado')
-    ], default='AGENDADO')
+    status = models.CharField(max_length=20, choices=STATUS_SERVICO, default='AGENDADO')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['data_agendamento'], name='servico_agendamento'),
+        ]
+
+    def _guardar_agenda(self):
+        # Status e horário como estão no banco: o sinal libera o slot antigo quando eles mudam
+        self._agenda_gravada = (self.__dict__.get('status'), self.__dict__.get('data_agendamento'))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._guardar_agenda()
+        return instancia
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._guardar_agenda()
 
     def __str__(self):
         return f'Profissional: {self.profissional.usuario.username} ({self.profissional.especialidade.nome}) - Cliente: {self.cliente.username}'
@@ -113,7 +164,8 @@ class Servico(models.Model):
 class Avaliacao(models.Model):
     profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name='avaliacoes')
     cliente = models.ForeignKey(Usuario, on_delete=models.CASCADE)
-    servico = models.OneToOneField(Servico, on_delete=models.CASCADE)
+    # Sem FOREIGN KEY no banco: serviços antigos vão para ServicoArquivado com o mesmo id
+    servico = models.OneToOneField(Servico, on_delete=models.CASCADE, db_constraint=False)
     nota = models.IntegerField(
         validators=[
             MinValueValidator(1),
@@ -124,21 +176,280 @@ class Avaliacao(models.Model):
     comentario = models.TextField(blank=True, null=True)
     data_avaliacao = models.DateTimeField(auto_now_add=True)
     recomenda = models.BooleanField(default=True)
+    # Respostas quentes + arquivadas, mantido pelos sinais de Comentario (usuarios/respostas.py)
+    total_respostas = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-data_avaliacao']
+        # Uma avaliação por cliente e profissional, garantida pelo banco mesmo com envios simultâneos
+        constraints = [
+            models.UniqueConstraint(fields=['profissional', 'cliente'], name='avaliacao_profissional_cliente'),
+        ]
+        # A ordenação padrão (e a do admin) percorre este índice em vez de ordenar a tabela toda
+        indexes = [
+            models.Index(fields=['data_avaliacao'], name='avaliacao_data'),
+        ]
 
     def __str__(self):
         return f'Avaliação de {self.cliente.get_full_name()} para {self.profissional.usuario.get_full_name()}'
 
 class Comentario(models.Model):
-    avaliacao = models.ForeignKey(Avaliacao, on_delete=models.CASCADE, related_name='respostas')
+    # Sem índice próprio: o comentario_thread começa pela avaliação
+    avaliacao = models.ForeignKey(Avaliacao, on_delete=models.CASCADE, related_name='respostas', db_index=False)
     autor = models.ForeignKey(Usuario, on_delete=models.CASCADE)
     texto = models.TextField()
     data_comentario = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['data_comentario']
+        indexes = [
+            models.Index(fields=['data_comentario'], name='comentario_data'),
+            # Prévia e cursor de uma thread: percorre as respostas de uma avaliação já em ordem
+            models.Index(fields=['avaliacao', 'data_comentario', 'id'], name='comentario_thread'),
+        ]
 
     def __str__(self):
         return f'Comentário de {self.autor.get_full_name()} em {self.data_comentario}'
+
+
+# Tabelas frias (usuarios/arquivo.py, comando arquivar). O id é o da linha original e, como
+# IntegerField, vira o INTEGER PRIMARY KEY do SQLite (o próprio rowid, sem índice à parte).
+class ServicoArquivado(models.Model):
+    id = models.IntegerField(primary_key=True)
+    profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name='servicos_arquivados')
+    cliente = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='+')
+    data_agendamento = models.DateTimeField()
+    data_realizacao = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_SERVICO)
+
+    class Meta:
+        verbose_name = 'serviço arquivado'
+        verbose_name_plural = 'serviços arquivados'
+
+    def __str__(self):
+        return f'Serviço {self.id} ({self.get_status_display()}, arquivado)'
+
+
+class ComentarioArquivado(models.Model):
+    id = models.IntegerField(primary_key=True)
+    avaliacao = models.ForeignKey(Avaliacao, on_delete=models.CASCADE, related_name='respostas_arquivadas')
+    autor = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='+')
+    texto = models.TextField()
+    data_comentario = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'comentário arquivado'
+        verbose_name_plural = 'comentários arquivados'
+
+    def __str__(self):
+        return f'Comentário de {self.autor.get_full_name()} em {self.data_comentario} (arquivado)'
+
+
+class Disponibilidade(models.Model):
+    # Um registro por profissional por dia; cada bit de `livres` é um horário da grade
+    # (bit 0 = primeiro horário do dia). `menor_bit` guarda o bit livre mais baixo
+    # (livres & -livres) para ordenar "o horário mais cedo" direto pelo índice.
+    profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name='disponibilidades')
+    dia = models.DateField()
+    livres = models.BigIntegerField(default=0)
+    menor_bit = models.BigIntegerField(default=0)
+    especialidade = models.ForeignKey(Especialidade, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    cidade = models.ForeignKey(Cidade, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profissional', 'dia'], name='disponibilidade_profissional_dia'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['especialidade', 'cidade', 'dia', 'menor_bit'],
+                condition=models.Q(livres__gt=0),
+                name='disp_esp_cidade_dia',
+            ),
+            models.Index(
+                fields=['especialidade', 'dia', 'menor_bit'],
+                condition=models.Q(livres__gt=0),
+                name='disp_esp_dia',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.profissional_id} - {self.dia:%d/%m/%Y}'
+
+
+class NotificacaoEmail(models.Model):
+    # Outbox: gravada na mesma transação da ação e enviada depois pelo comando enviar_notificacoes
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('ENVIADO', 'Enviado'),
+        ('FALHOU', 'Falhou'),
+    ]
+
+    destinatario = models.EmailField()
+    assunto = models.CharField(max_length=200)
+    corpo = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDENTE')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    erro = models.TextField(blank=True, default='')
+    criado_em = models.DateTimeField(auto_now_add=True)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'proxima_tentativa'], name='notificacao_fila'),
+        ]
+
+    def __str__(self):
+        return f'{self.assunto} -> {self.destinatario} ({self.status})'
+
+
+class ProfissionalCard(models.Model):
+    # Read model da listagem (index.html): uma linha plana por profissional, mantida por usuarios/cards.py
+    profissional = models.OneToOneField(Profissional, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    nome = models.CharField(max_length=300)
+    busca = models.CharField(max_length=500)
+    crm = models.IntegerField()
+    especialidade = models.ForeignKey(
+        Especialidade, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False,
+    )
+    especialidade_nome = models.CharField(max_length=100, blank=True, default='')
+    cidade = models.ForeignKey(Cidade, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    cidade_nome = models.CharField(max_length=100, blank=True, default='')
+    estado_sigla = models.CharField(max_length=2, blank=True, default='')
+    preco_servico = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    nota_media = models.FloatField(null=True, blank=True)
+    total_avaliacoes = models.PositiveIntegerField(default=0)
+    imagem_url = models.CharField(max_length=300, blank=True, default='')
+    # Ordenação "mais bem avaliados" (usuarios/ranking.py). As somas ponderadas pelo decaimento
+    # valem em ranking_referencia e permitem atualizar a pontuação a cada avaliação sem reler as outras.
+    ranking = models.FloatField(default=0)
+    ranking_peso = models.FloatField(default=0)
+    ranking_soma_notas = models.FloatField(default=0)
+    ranking_soma_recomenda = models.FloatField(default=0)
+    ranking_referencia = models.DateTimeField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['nome', 'profissional'], name='card_nome'),
+            models.Index(fields=['especialidade', 'nome', 'profissional'], name='card_especialidade_nome'),
+            models.Index(fields=['-ranking', 'profissional'], name='card_ranking'),
+            models.Index(fields=['especialidade', '-ranking', 'profissional'], name='card_especialidade_ranking'),
+        ]
+
+    def __str__(self):
+        return f'{self.nome} ({self.especialidade_nome})'
+
+
+class ProfissionalSimilar(models.Model):
+    # Top-K de profissionais parecidos, calculado em lote por usuarios/similares.py
+    profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name='similares', db_index=False)
+    similar = models.ForeignKey(ProfissionalCard, on_delete=models.CASCADE, related_name='+')
+    posicao = models.PositiveSmallIntegerField()
+    pontuacao = models.FloatField()
+    coavaliacoes = models.PositiveIntegerField(default=0)
+    calculado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profissional', 'posicao'], name='similar_posicao_unica'),
+        ]
+
+
+class ResumoAvaliacoes(models.Model):
+    # Rollup diário e mensal das avaliações de um profissional, mantido por usuarios/resumos.py.
+    # Os contadores são deltas somados por upsert e podem ficar negativos por um instante
+    # quando uma avaliação anterior ao backfill é excluída; por isso não são Positive*.
+    PERIODO_CHOICES = [
+        ('D', 'Diário'),
+        ('M', 'Mensal'),
+    ]
+
+    profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name='resumos', db_index=False)
+    periodo = models.CharField(max_length=1, choices=PERIODO_CHOICES)
+    inicio = models.DateField()  # o dia, ou o primeiro dia do mês
+    avaliacoes = models.IntegerField(default=0)
+    estrelas_1 = models.IntegerField(default=0)
+    estrelas_2 = models.IntegerField(default=0)
+    estrelas_3 = models.IntegerField(default=0)
+    estrelas_4 = models.IntegerField(default=0)
+    estrelas_5 = models.IntegerField(default=0)
+    recomendacoes = models.IntegerField(default=0)
+    respostas = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profissional', 'periodo', 'inicio'], name='resumo_unico'),
+        ]
+
+    def __str__(self):
+        return f'{self.profissional_id} {self.get_periodo_display()} {self.inicio}: {self.avaliacoes}'
+
+
+class AtividadeRecente(models.Model):
+    # Contadores de atividade por profissional em baldes de TENDENCIAS_BALDE segundos, somados por
+    # upsert pelas descargas de usuarios/tendencias.py; baldes fora da janela são podados
+    profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name='+', db_index=False)
+    balde = models.IntegerField()  # segundos desde a época // TENDENCIAS_BALDE
+    avaliacoes = models.IntegerField(default=0)
+    agendamentos = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profissional', 'balde'], name='atividade_balde_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['balde'], name='atividade_balde'),
+        ]
+
+
+class ProfissionalEmAlta(models.Model):
+    # Top-K da faixa "Em alta" da página inicial, recalculado por usuarios/tendencias.py
+    posicao = models.PositiveSmallIntegerField(unique=True)
+    profissional = models.ForeignKey(ProfissionalCard, on_delete=models.CASCADE, related_name='+')
+    pontuacao = models.FloatField()
+    avaliacoes = models.PositiveIntegerField(default=0)  # na janela, sem decaimento
+    agendamentos = models.PositiveIntegerField(default=0)
+    calculado_em = models.DateTimeField(default=timezone.now)
+
+
+# Sob ASGI o cProfile e o amostrador veem a thread do event loop: tudo o que rodou nele durante a
+# requisição (outras requisições inclusive) entra na captura
+ESCOPO_PERFIL = [
+    ('thread', 'Thread da requisição'),
+    ('loop', 'Event loop inteiro'),
+]
+
+
+class CapturaPerfil(models.Model):
+    # Perfil de uma requisição gravado pelo PerfilamentoMiddleware
+    rota = models.CharField(max_length=100)
+    caminho = models.CharField(max_length=500)
+    metodo = models.CharField(max_length=10)
+    status_code = models.PositiveSmallIntegerField()
+    usuario = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    duracao_ms = models.FloatField()
+    amostras = models.PositiveIntegerField(default=0)
+    escopo = models.CharField(max_length=10, choices=ESCOPO_PERFIL, default='thread')
+    arquivo_pstats = models.FileField(upload_to='perfis')
+    arquivo_pilhas = models.FileField(upload_to='perfis')
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-criado_em']
+        verbose_name = 'captura de perfil'
+        verbose_name_plural = 'capturas de perfil'
+
+    def __str__(self):
+        return f'{self.rota} {self.criado_em:%d/%m/%Y %H:%M:%S} ({self.duracao_ms:.0f} ms)'
+
+
+class VersaoCache(models.Model):
+    # Contador por conjunto de dados em cache nos processos (usuarios/referencia.py): quem grava
+    # incrementa; cada worker compara com a versão que carregou e recarrega se mudou
+    nome = models.CharField(max_length=50, primary_key=True)
+    versao = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.nome} v{self.versao}'
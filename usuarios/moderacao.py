@@ -0,0 +1,164 @@
+"""
+Moderação em massa de avaliações e respostas (spam): por autor, por período e por trecho do texto.
+
+Apagar pelo ORM, uma linha por vez, dispara a cascata e os sinais de cada linha: para cada
+avaliação ou resposta os cards, o ranking, os rollups e a versão da página eram recalculados de
+novo. Aqui as linhas escolhidas saem em lotes de MODERACAO_LOTE, com DELETE ... WHERE id IN (...)
+direto (sem sinais), numa transação por lote. Assim a trava de escrita do SQLite dura pouco e as
+views seguem gravando entre os lotes. Cada lote de avaliações leva junto as respostas (quentes e
+arquivadas) e o serviço criado com a avaliação, como em excluir_avaliacao. No fim,
+corrigir_agregados() refaz uma vez, para o conjunto de profissionais afetados, tudo o que os
+sinais manteriam: médias dos cards, ranking, rollups, total de respostas e versão das páginas.
+"""
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import cards, ranking, respostas, resumos
+from .models import Avaliacao, Comentario, ComentarioArquivado, Profissional, Servico, ServicoArquivado
+
+# Campos de autor, data e texto de cada modelo moderado
+CAMPOS = {
+    Avaliacao: ('cliente', 'data_avaliacao', ('titulo', 'comentario')),
+    Comentario: ('autor', 'data_comentario', ('texto',)),
+    ComentarioArquivado: ('autor', 'data_comentario', ('texto',)),
+}
+TAMANHO_IN = 500  # ids por IN (...) na correção dos agregados
+
+
+def _lote(lote):
+    return lote or getattr(settings, 'MODERACAO_LOTE', 1000)
+
+
+def filtro(modelo, autores=None, desde=None, ate=None, texto=None, regex=False):
+    """Q com os critérios informados (combinados com E). autores: ids de Usuario."""
+    autor, data, campos_texto = CAMPOS[modelo]
+    condicao = Q()
+    if autores is not None:
+        condicao &= Q(**{f'{autor}__in': autores})
+    if desde is not None:
+        condicao &= Q(**{f'{data}__gte': desde})
+    if ate is not None:
+        condicao &= Q(**{f'{data}__lt': ate})
+    if texto:
+        busca = Q()
+        for campo in campos_texto:
+            busca |= Q(**{f'{campo}__iregex' if regex else f'{campo}__icontains': texto})
+        condicao &= busca
+    return condicao
+
+
+def _apagar(cursor, modelo, coluna, valores):
+    if not valores:
+        return 0
+    marcadores = ', '.join(['%s'] * len(valores))
+    cursor.execute(f'DELETE FROM {modelo._meta.db_table} WHERE "{coluna}" IN ({marcadores})', list(valores))
+    return cursor.rowcount
+
+
+def _em_lotes(consulta, colunas, apagar, lote, pausa):
+    # Paginação pelo pk: o que já foi apagado não volta na consulta seguinte
+    ultimo = 0
+    while True:
+        linhas = list(consulta.filter(pk__gt=ultimo).order_by('pk').values_list('pk', *colunas)[:_lote(lote)])
+        if not linhas:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            apagar(cursor, linhas)
+        ultimo = linhas[-1][0]
+        if pausa:
+            time.sleep(pausa)
+
+
+def _novo_resultado():
+    return {'avaliacoes': 0, 'comentarios': 0, 'servicos': 0, 'profissionais': set(), 'respostas_de': set()}
+
+
+def excluir_avaliacoes(consulta, lote=None, pausa=0, resultado=None):
+    """Apaga as avaliações da consulta com as respostas e os serviços delas. Não corrige agregados."""
+    resultado = resultado if resultado is not None else _novo_resultado()
+
+    def apagar(cursor, linhas):
+        ids = [pk for pk, _, _ in linhas]
+        servicos = [servico_id for _, _, servico_id in linhas]
+        for modelo in (Comentario, ComentarioArquivado):
+            resultado['comentarios'] += _apagar(cursor, modelo, 'avaliacao_id', ids)
+        resultado['avaliacoes'] += _apagar(cursor, Avaliacao, 'id', ids)
+        # O serviço nasce com a avaliação (_criar_avaliacao) e pode já estar arquivado
+        for modelo in (Servico, ServicoArquivado):
+            resultado['servicos'] += _apagar(cursor, modelo, 'id', servicos)
+        resultado['profissionais'].update(profissional_id for _, profissional_id, _ in linhas)
+
+    _em_lotes(consulta, ('profissional_id', 'servico_id'), apagar, lote, pausa)
+    return resultado
+
+
+def excluir_comentarios(consulta, lote=None, pausa=0, resultado=None):
+    """Apaga as respostas da consulta (Comentario ou ComentarioArquivado). Não corrige agregados."""
+    resultado = resultado if resultado is not None else _novo_resultado()
+
+    def apagar(cursor, linhas):
+        resultado['comentarios'] += _apagar(cursor, consulta.model, 'id', [pk for pk, _, _ in linhas])
+        resultado['respostas_de'].update(avaliacao_id for _, avaliacao_id, _ in linhas)
+        resultado['profissionais'].update(profissional_id for _, _, profissional_id in linhas)
+
+    _em_lotes(consulta, ('avaliacao_id', 'avaliacao__profissional_id'), apagar, lote, pausa)
+    return resultado
+
+
+def _fatias(valores):
+    valores = sorted(valores)
+    for inicio in range(0, len(valores), TAMANHO_IN):
+        yield valores[inicio:inicio + TAMANHO_IN]
+
+
+def corrigir_agregados(profissional_ids, avaliacao_ids=()):
+    """Uma passada sobre os afetados: o que os sinais teriam atualizado linha a linha."""
+    for ids in _fatias(avaliacao_ids):
+        respostas.recontar(ids)
+    for ids in _fatias(profissional_ids):
+        with transaction.atomic():
+            Profissional.marcar_alterados(Profissional.objects.filter(pk__in=ids))
+            cards.atualizar_notas(ids)
+            ranking.recalcular(ids)
+            resumos.reconstruir(ids)
+
+
+def executar(avaliacoes=None, comentarios=(), lote=None, pausa=0):
+    """
+    Apaga as avaliações da consulta `avaliacoes` e as respostas das consultas em `comentarios` e
+    corrige os agregados no fim. Devolve as contagens, o número de profissionais afetados, os
+    segundos de cada fase e as linhas apagadas por segundo.
+    """
+    inicio = time.perf_counter()
+    resultado = _novo_resultado()
+    if avaliacoes is not None:
+        excluir_avaliacoes(avaliacoes, lote, pausa, resultado)
+    for consulta in comentarios:
+        excluir_comentarios(consulta, lote, pausa, resultado)
+    apagadas = time.perf_counter()
+    corrigir_agregados(resultado['profissionais'], resultado['respostas_de'])
+    fim = time.perf_counter()
+    linhas = resultado['avaliacoes'] + resultado['comentarios'] + resultado['servicos']
+    return {
+        'avaliacoes': resultado['avaliacoes'],
+        'comentarios': resultado['comentarios'],
+        'servicos': resultado['servicos'],
+        'profissionais': len(resultado['profissionais']),
+        'segundos_exclusao': apagadas - inicio,
+        'segundos_agregados': fim - apagadas,
+        'linhas_por_segundo': linhas / (apagadas - inicio) if linhas else 0.0,
+    }
+
+
+def moderar(alvos=('avaliacoes', 'comentarios'), lote=None, pausa=0, **criterios):
+    """executar() sobre as avaliações e/ou respostas que casam com os critérios de filtro()."""
+    if all(criterios.get(nome) in (None, '') for nome in ('autores', 'desde', 'ate', 'texto')):
+        raise ValueError('Informe ao menos um critério (autor, período ou texto).')
+    avaliacoes = Avaliacao.objects.filter(filtro(Avaliacao, **criterios)) if 'avaliacoes' in alvos else None
+    comentarios = [
+        modelo.objects.filter(filtro(modelo, **criterios)) for modelo in (Comentario, ComentarioArquivado)
+    ] if 'comentarios' in alvos else []
+    return executar(avaliacoes, comentarios, lote, pausa)
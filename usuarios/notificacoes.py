@@ -0,0 +1,232 @@
+import logging
+import smtplib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import NotificacaoEmail
+
+logger = logging.getLogger(__name__)
+
+# Recusas do servidor que dizem respeito à mensagem (destinatário, remetente, conteúdo). Os demais
+# erros de SMTP e de socket (SMTPException também é OSError) são da conexão: o lote é interrompido
+ERROS_DA_MENSAGEM = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class ConexaoPerdida(Exception):
+    """A conexão SMTP caiu no meio do lote; `resultado` traz o que foi processado antes."""
+
+    def __init__(self, resultado):
+        super().__init__('Conexão SMTP perdida no meio do lote')
+        self.resultado = resultado
+
+
+def _config():
+    return {
+        'lote': getattr(settings, 'NOTIFICACOES_LOTE', 100),
+        'max_tentativas': getattr(settings, 'NOTIFICACOES_MAX_TENTATIVAS', 5),
+        'espera_base': getattr(settings, 'NOTIFICACOES_ESPERA_BASE', 30),  # segundos
+        'reserva': getattr(settings, 'NOTIFICACOES_RESERVA', 300),  # segundos
+        'espera_maxima': getattr(settings, 'NOTIFICACOES_ESPERA_MAXIMA', 300),  # segundos
+    }
+
+
+def enfileirar(destinatario, assunto, corpo):
+    # Deve ser chamado dentro da transação da view: se ela falhar, a notificação some junto
+    if not destinatario:
+        return None
+    return NotificacaoEmail.objects.create(destinatario=destinatario, assunto=assunto, corpo=corpo)
+
+
+def notificar_agendamento(servico):
+    profissional = servico.profissional.usuario
+    horario = timezone.localtime(servico.data_agendamento)
+    return enfileirar(
+        profissional.email,
+        'Nova consulta agendada',
+        f'Olá Dr(a). {profissional.get_full_name()}, {servico.cliente.get_full_name() or servico.cliente.username} '
+        f'agendou uma consulta para {horario:%d/%m/%Y às %H:%M}.',
+    )
+
+
+def notificar_avaliacao(avaliacao):
+    profissional = avaliacao.profissional.usuario
+    return enfileirar(
+        profissional.email,
+        'Você recebeu uma nova avaliação',
+        f'Olá Dr(a). {profissional.get_full_name()}, você recebeu uma avaliação nota {avaliacao.nota}.\n\n'
+        f'{avaliacao.titulo or ""}\n{avaliacao.comentario or ""}',
+    )
+
+
+def notificar_resposta(comentario):
+    autor_avaliacao = comentario.avaliacao.cliente
+    if autor_avaliacao.pk == comentario.autor_id:
+        return None
+    return enfileirar(
+        autor_avaliacao.email,
+        'Sua avaliação recebeu uma resposta',
+        f'{comentario.autor.get_full_name() or comentario.autor.username} respondeu sua avaliação:\n\n{comentario.texto}',
+    )
+
+
+def _reservar_lote(tamanho, agora):
+    config = _config()
+    ids = list(
+        NotificacaoEmail.objects.filter(status='PENDENTE', proxima_tentativa__lte=agora)
+        .order_by('proxima_tentativa', 'id')
+        .values_list('id', flat=True)[:tamanho]
+    )
+    if not ids:
+        return []
+    # Empurra a próxima tentativa para frente antes de enviar; se o worker morrer no meio,
+    # as mensagens voltam para a fila quando a reserva expira. O filtro por proxima_tentativa
+    # impede que dois workers reservem a mesma linha.
+    reserva = agora + timedelta(seconds=config['reserva'])
+    NotificacaoEmail.objects.filter(id__in=ids, status='PENDENTE', proxima_tentativa__lte=agora).update(
+        proxima_tentativa=reserva,
+    )
+    return list(NotificacaoEmail.objects.filter(id__in=ids, proxima_tentativa=reserva))
+
+
+def processar_lote(conexao=None, tamanho=None):
+    """Envia um lote de notificações pendentes usando `conexao` (aberta uma única vez pelo chamador)."""
+    config = _config()
+    tamanho = tamanho or config['lote']
+    agora = timezone.now()
+    notificacoes = _reservar_lote(tamanho, agora)
+    if not notificacoes:
+        return {'enviados': 0, 'falhas': 0, 'atraso_medio_s': 0.0}
+
+    conexao = conexao or get_connection()
+    enviados, falhas, atraso_total = [], [], 0.0
+    perdida = None
+    try:
+        for notificacao in notificacoes:
+            mensagem = EmailMessage(
+                notificacao.assunto,
+                notificacao.corpo,
+                settings.DEFAULT_FROM_EMAIL,
+                [notificacao.destinatario],
+                connection=conexao,
+            )
+            try:
+                conexao.send_messages([mensagem])
+            except Exception as e:
+                if isinstance(e, OSError) and not isinstance(e, ERROS_DA_MENSAGEM):
+                    # Conexão caiu: esta e as seguintes voltam para a fila sem gastar tentativa
+                    perdida = e
+                    break
+                notificacao.tentativas += 1
+                notificacao.erro = str(e)
+                if notificacao.tentativas >= config['max_tentativas']:
+                    notificacao.status = 'FALHOU'
+                else:
+                    espera = config['espera_base'] * 2 ** (notificacao.tentativas - 1)
+                    notificacao.proxima_tentativa = timezone.now() + timedelta(seconds=espera)
+                falhas.append(notificacao)
+                logger.warning('Falha ao enviar notificação %s: %s', notificacao.id, e)
+            else:
+                notificacao.status = 'ENVIADO'
+                notificacao.enviado_em = timezone.now()
+                atraso_total += (notificacao.enviado_em - notificacao.criado_em).total_seconds()
+                enviados.append(notificacao)
+    finally:
+        NotificacaoEmail.objects.bulk_update(enviados, ['status', 'enviado_em'])
+        NotificacaoEmail.objects.bulk_update(falhas, ['status', 'tentativas', 'erro', 'proxima_tentativa'])
+        processadas = {notificacao.id for notificacao in enviados + falhas}
+        restantes = [notificacao.id for notificacao in notificacoes if notificacao.id not in processadas]
+        if restantes:
+            # Saída no meio do lote: o resto volta para a fila sem esperar a reserva expirar
+            NotificacaoEmail.objects.filter(id__in=restantes, status='PENDENTE').update(proxima_tentativa=agora)
+    resultado = {
+        'enviados': len(enviados),
+        'falhas': len(falhas),
+        'atraso_medio_s': atraso_total / len(enviados) if enviados else 0.0,
+    }
+    if perdida is not None:
+        raise ConexaoPerdida(resultado) from perdida
+    return resultado
+
+
+def estatisticas_fila():
+    pendentes = NotificacaoEmail.objects.filter(status='PENDENTE')
+    mais_antiga = pendentes.aggregate(Min('criado_em'))['criado_em__min']
+    return {
+        'pendentes': pendentes.count(),
+        'falhas_definitivas': NotificacaoEmail.objects.filter(status='FALHOU').count(),
+        'atraso_fila_s': (timezone.now() - mais_antiga).total_seconds() if mais_antiga else 0.0,
+    }
+
+
+def _abrir(conexao):
+    try:
+        conexao.open()
+    except Exception:
+        logger.exception('Não foi possível abrir a conexão SMTP')
+        return False
+    return True
+
+
+def _fechar(conexao):
+    try:
+        conexao.close()
+    except Exception:
+        logger.warning('Erro ao fechar a conexão SMTP', exc_info=True)
+
+
+def drenar(tamanho=None, continuo=False, intervalo=5, parar=None):
+    """
+    Processa a fila em lotes sobre uma única conexão SMTP.
+
+    Se a conexão não abre ou cai, o modo contínuo tenta de novo depois de `intervalo` segundos,
+    dobrando a espera a cada falha seguida (até NOTIFICACOES_ESPERA_MAXIMA); fora dele a drenagem
+    termina e as mensagens continuam na fila. Retorna as métricas acumuladas (mensagens enviadas,
+    falhas, vazão em msg/s).
+    """
+    total = {'enviados': 0, 'falhas': 0, 'lotes': 0, 'falhas_conexao': 0}
+    inicio = time.perf_counter()
+    conexao = get_connection()
+    aberta, seguidas = False, 0
+    try:
+        while True:
+            aberta = aberta or _abrir(conexao)
+            if aberta:
+                try:
+                    resultado = processar_lote(conexao, tamanho)
+                except Exception as e:
+                    # Conexão SMTP caiu: o resto do lote já voltou para a fila; reabre na próxima volta
+                    logger.exception('Erro ao processar lote de notificações')
+                    if isinstance(e, ConexaoPerdida):
+                        total['enviados'] += e.resultado['enviados']
+                        total['falhas'] += e.resultado['falhas']
+                    _fechar(conexao)
+                    aberta = False
+            if not aberta:
+                total['falhas_conexao'] += 1
+                seguidas += 1
+                if not continuo or (parar and parar()):
+                    break
+                time.sleep(min(intervalo * 2 ** (seguidas - 1), _config()['espera_maxima']))
+                continue
+            seguidas = 0
+            total['enviados'] += resultado['enviados']
+            total['falhas'] += resultado['falhas']
+            if resultado['enviados'] or resultado['falhas']:
+                total['lotes'] += 1
+                logger.info('Lote de notificações: %s', resultado)
+                continue
+            if not continuo or (parar and parar()):
+                break
+            time.sleep(intervalo)
+    finally:
+        _fechar(conexao)
+
+    duracao = time.perf_counter() - inicio
+    total['duracao_s'] = round(duracao, 3)
+    total['vazao_msg_s'] = round(total['enviados'] / duracao, 1) if duracao else 0.0
+    return total
@@ -0,0 +1,118 @@
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+SALT_TOKEN = 'usuarios.perfilamento'
+
+# Só uma captura por vez: o cProfile é um só por processo a partir do Python 3.12
+# e duas capturas simultâneas distorceriam uma à outra.
+_trava = threading.Lock()
+
+
+def gerar_token():
+    """Valor para o cabeçalho X-Perfil, válido por PERFIL_VALIDADE_TOKEN segundos."""
+    return signing.TimestampSigner(salt=SALT_TOKEN).sign('perfil')
+
+
+def token_valido(valor):
+    validade = getattr(settings, 'PERFIL_VALIDADE_TOKEN', 3600)
+    try:
+        return signing.TimestampSigner(salt=SALT_TOKEN).unsign(valor, max_age=validade) == 'perfil'
+    except signing.BadSignature:
+        return False
+
+
+class Amostrador(threading.Thread):
+    """Amostra periodicamente a pilha de uma thread e acumula as pilhas no formato colapsado."""
+
+    def __init__(self, thread_id, intervalo):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            pilha = []
+            while frame is not None:
+                pilha.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if pilha:
+                self.pilhas[';'.join(reversed(pilha))] += 1
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+class Captura:
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        intervalo = getattr(settings, 'PERFIL_INTERVALO_AMOSTRAGEM', 0.001)
+        self.amostrador = Amostrador(threading.get_ident(), intervalo)
+        self.duracao = 0.0
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        self.amostrador.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        self.amostrador.parar()
+        self.duracao = time.perf_counter() - self.inicio
+
+    def pstats_bytes(self):
+        # Mesmo conteúdo que Profile.dump_stats grava; abre com pstats.Stats(caminho) ou snakeviz
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
+
+    def pilhas_colapsadas(self):
+        # Uma linha "raiz;...;folha contagem" por pilha: entrada do flamegraph.pl / speedscope
+        return ''.join(f'{pilha} {total}\n' for pilha, total in self.amostrador.pilhas.most_common())
+
+
+def tentar_capturar():
+    """Devolve uma Captura se não houver outra em andamento, senão None."""
+    if not _trava.acquire(blocking=False):
+        return None
+    return Captura()
+
+
+def liberar():
+    _trava.release()
+
+
+def resumo(caminho, limite=30):
+    saida = io.StringIO()
+    estatisticas = pstats.Stats(caminho, stream=saida)
+    estatisticas.sort_stats('cumulative').print_stats(limite)
+    return saida.getvalue()
+
+
+def podar():
+    """
+    Apaga as capturas além das PERFIL_MAXIMO_CAPTURAS mais recentes e as com mais de
+    PERFIL_DIAS_CAPTURAS dias. Os arquivos saem junto (sinal post_delete). Devolve quantas apagou.
+    """
+    from .models import CapturaPerfil
+
+    maximo = getattr(settings, 'PERFIL_MAXIMO_CAPTURAS', 200)
+    dias = getattr(settings, 'PERFIL_DIAS_CAPTURAS', 7)
+    excedentes = list(CapturaPerfil.objects.order_by('-criado_em', '-pk').values_list('pk', flat=True)[maximo:])
+    antigas = CapturaPerfil.objects.filter(criado_em__lt=timezone.now() - timedelta(days=dias))
+    apagadas, _ = (antigas | CapturaPerfil.objects.filter(pk__in=excedentes)).delete()
+    return apagadas
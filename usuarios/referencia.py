@@ -0,0 +1,85 @@
+"""
+Cache em memória, por processo, dos dados de referência: estados, cidades e especialidades.
+
+Essas tabelas mudam quase nunca, mas eram lidas em toda página inicial e em todo formulário de
+cadastro e de perfil. Cada worker carrega tudo uma vez e guarda a versão da linha
+VersaoCache('referencia'). Os sinais incrementam essa versão a cada gravação, na mesma transação
+da alteração. Cada worker confere a versão no máximo a cada REFERENCIA_INTERVALO segundos, então
+as alterações chegam aos outros processos com esse atraso. Os objetos devolvidos são
+compartilhados entre as requisições: não devem ser alterados.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+
+from .models import Cidade, Especialidade, Estado, VersaoCache
+
+NOME = 'referencia'
+
+
+class DadosReferencia:
+    def __init__(self):
+        self.estados = list(Estado.objects.order_by('pk'))
+        self.estados_por_id = {estado.pk: estado for estado in self.estados}
+        self.especialidades = list(Especialidade.objects.order_by('pk'))
+        self.especialidades_por_id = {especialidade.pk: especialidade for especialidade in self.especialidades}
+        # Cidades como tuplas (5 mil instâncias de modelo custariam vários MB por processo)
+        self.cidades = {}
+        self.cidades_por_estado = defaultdict(list)
+        for pk, nome, estado_id in Cidade.objects.order_by('pk').values_list('pk', 'nome', 'estado_id'):
+            self.cidades[pk] = (nome, estado_id)
+            self.cidades_por_estado[estado_id].append({'id': pk, 'nome': nome})
+
+    def cidade(self, pk):
+        """Instância de Cidade (com o estado já carregado) ou None."""
+        dados = self.cidades.get(pk)
+        if dados is None:
+            return None
+        cidade = Cidade.from_db('default', ['id', 'nome', 'estado_id'], (pk, *dados))
+        if dados[1] in self.estados_por_id:
+            cidade._state.fields_cache['estado'] = self.estados_por_id[dados[1]]
+        return cidade
+
+
+_trava = threading.Lock()
+_dados = None
+_versao = None
+_conferido_em = 0.0
+
+
+def _versao_atual():
+    return VersaoCache.objects.filter(nome=NOME).values_list('versao', flat=True).first() or 0
+
+
+def dados():
+    global _dados, _versao, _conferido_em
+    atual = _dados
+    if atual is not None and time.monotonic() - _conferido_em < getattr(settings, 'REFERENCIA_INTERVALO', 5):
+        return atual
+    with _trava:
+        versao = _versao_atual()
+        if _dados is None or versao != _versao:
+            # A versão é lida antes dos dados: uma gravação no meio só faz recarregar na próxima vez
+            _dados, _versao = DadosReferencia(), versao
+        _conferido_em = time.monotonic()
+        return _dados
+
+
+async def adados():
+    """dados() para views assíncronas: só vai a uma thread quando precisa consultar o banco."""
+    atual = _dados
+    if atual is not None and time.monotonic() - _conferido_em < getattr(settings, 'REFERENCIA_INTERVALO', 5):
+        return atual
+    return await sync_to_async(dados)()
+
+
+def invalidar():
+    """Incrementa a versão (todos os processos recarregam) e descarta a cópia deste processo."""
+    global _dados
+    if not VersaoCache.objects.filter(nome=NOME).update(versao=F('versao') + 1):
+        VersaoCache.objects.get_or_create(nome=NOME, defaults={'versao': 1})
+    _dados = None
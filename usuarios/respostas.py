@@ -0,0 +1,116 @@
+"""
+Respostas (Comentario) das avaliações: prévia por página e paginação por cursor.
+
+Cada avaliação guarda em total_respostas quantas respostas tem, somando as quentes e as arquivadas.
+Os sinais de Comentario mantêm esse total, o arquivamento não o altera (só muda a tabela) e
+recontar() o reconstrói depois de cargas em massa. As páginas mostram só as RESPOSTAS_PREVIA
+primeiras de cada avaliação. Elas vêm de uma consulta com janela (ROW_NUMBER() por avaliação)
+para cada tabela, com o autor no mesmo JOIN. Assim o número de consultas não depende de quantas
+avaliações há na página nem de quantas respostas cada uma tem. O resto da thread vem de
+/avaliacao/<id>/respostas/?apos=<cursor>, em ordem de (data_comentario, id). O cursor é a
+posição da última resposta mostrada, então uma resposta nova no meio não faz repetir nem pular
+nenhuma.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, RowNumber
+from django.db.models.expressions import Window
+
+from .models import Avaliacao, Comentario, ComentarioArquivado
+
+MODELOS = (Comentario, ComentarioArquivado)
+FORMATO_CURSOR = '%Y%m%d%H%M%S%f'
+
+
+def quantidade_previa():
+    return getattr(settings, 'RESPOSTAS_PREVIA', 3)
+
+
+def _ordem(comentario):
+    return comentario.data_comentario, comentario.pk
+
+
+def codificar_cursor(comentario):
+    data = comentario.data_comentario.astimezone(dt_timezone.utc)
+    return f'{data.strftime(FORMATO_CURSOR)}.{comentario.pk}'
+
+
+def decodificar_cursor(cursor):
+    """(data, id) a partir do cursor; ValueError se ele for inválido."""
+    data, _, pk = cursor.partition('.')
+    return datetime.strptime(data, FORMATO_CURSOR).replace(tzinfo=dt_timezone.utc), int(pk)
+
+
+def _primeiras(modelo, avaliacao_ids, quantidade):
+    posicao = Window(
+        RowNumber(), partition_by=F('avaliacao_id'), order_by=(F('data_comentario').asc(), F('pk').asc()),
+    )
+    return modelo.objects.filter(avaliacao_id__in=avaliacao_ids).annotate(posicao=posicao).filter(
+        posicao__lte=quantidade,
+    ).select_related('autor').order_by()
+
+
+def previas(avaliacoes, quantidade=None):
+    """
+    Preenche em cada avaliação lista_respostas (as primeiras respostas), respostas_restantes e
+    cursor_respostas (de onde continuar). Devolve a lista de avaliações.
+    """
+    avaliacoes = list(avaliacoes)
+    quantidade = quantidade or quantidade_previa()
+    por_avaliacao = {avaliacao.pk: [] for avaliacao in avaliacoes}
+    # Só consulta quem tem resposta: páginas sem nenhuma não custam nada
+    com_respostas = [avaliacao.pk for avaliacao in avaliacoes if avaliacao.total_respostas]
+    if com_respostas:
+        for modelo in MODELOS:
+            for comentario in _primeiras(modelo, com_respostas, quantidade):
+                por_avaliacao[comentario.avaliacao_id].append(comentario)
+    for avaliacao in avaliacoes:
+        # Cada tabela trouxe as suas N primeiras; juntas, as N primeiras da thread estão entre elas
+        lista = sorted(por_avaliacao[avaliacao.pk], key=_ordem)[:quantidade]
+        avaliacao.lista_respostas = lista
+        avaliacao.respostas_restantes = max(avaliacao.total_respostas - len(lista), 0)
+        avaliacao.cursor_respostas = codificar_cursor(lista[-1]) if lista else ''
+    return avaliacoes
+
+
+def pagina(avaliacao_id, apos=None, quantidade=None):
+    """As `quantidade` respostas seguintes ao cursor `apos` (ou as primeiras): (lista, próximo cursor ou None)."""
+    quantidade = quantidade or quantidade_previa()
+    filtro = Q(avaliacao_id=avaliacao_id)
+    if apos:
+        data, pk = decodificar_cursor(apos)
+        filtro &= Q(data_comentario__gt=data) | Q(data_comentario=data, pk__gt=pk)
+    lista = []
+    for modelo in MODELOS:
+        # Uma a mais que o pedido para saber se ainda há outra página
+        lista.extend(
+            modelo.objects.filter(filtro).select_related('autor').order_by('data_comentario', 'pk')[:quantidade + 1]
+        )
+    lista.sort(key=_ordem)
+    proximo = codificar_cursor(lista[quantidade - 1]) if len(lista) > quantidade else None
+    return lista[:quantidade], proximo
+
+
+def ajustar_total(avaliacao_id, delta):
+    Avaliacao.objects.filter(pk=avaliacao_id).update(total_respostas=F('total_respostas') + delta)
+
+
+def _contagem(modelo):
+    return Coalesce(
+        Subquery(
+            modelo.objects.filter(avaliacao_id=OuterRef('pk')).order_by().values('avaliacao_id')
+            .annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def recontar(avaliacao_ids=None):
+    """Recalcula total_respostas (todas as avaliações ou só as indicadas) com um UPDATE."""
+    consulta = Avaliacao.objects.all()
+    if avaliacao_ids is not None:
+        consulta = consulta.filter(pk__in=avaliacao_ids)
+    return consulta.update(total_respostas=_contagem(Comentario) + _contagem(ComentarioArquivado))
@@ -0,0 +1,287 @@
+"""
+Rollups das avaliações por profissional: uma linha por dia (janela recente) e uma por mês.
+
+Criar ou excluir uma avaliação ou um comentário soma um delta nas linhas do dia e do mês com
+um upsert atômico; editar uma avaliação reconta só o dia e o mês dela. O painel do perfil e o
+endpoint JSON leem apenas estas linhas, então o custo não cresce com o histórico de avaliações.
+"""
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ResumoAvaliacoes
+
+CONTADORES = [
+    'avaliacoes', 'estrelas_1', 'estrelas_2', 'estrelas_3', 'estrelas_4', 'estrelas_5', 'recomendacoes', 'respostas',
+]
+SEGUNDOS_POR_DIA = 86400
+JULIANO_EPOCA = 2440587.5  # julianday('1970-01-01')
+
+
+def dias_diarios():
+    """Quantos dias de linhas diárias são mantidos (as mensais ficam para sempre)."""
+    return getattr(settings, 'RESUMOS_DIAS_DIARIO', 90)
+
+
+def _inicio_diario():
+    return timezone.localdate() - timedelta(days=dias_diarios() - 1)
+
+
+def _deltas_avaliacao(avaliacao, sinal):
+    return {
+        'avaliacoes': sinal,
+        f'estrelas_{int(avaliacao.nota)}': sinal,
+        'recomendacoes': sinal if avaliacao.recomenda else 0,
+    }
+
+
+def _somar(profissional_id, quando, deltas):
+    """Soma `deltas` nas linhas do dia e do mês de `quando` (cria as linhas se preciso)."""
+    dia = timezone.localdate(quando)
+    linhas = [('M', dia.replace(day=1))]
+    # Exclusões antigas não recriam dias que já saíram da janela
+    if dia >= _inicio_diario():
+        linhas.append(('D', dia))
+    valores = [deltas.get(campo, 0) for campo in CONTADORES]
+    tabela = ResumoAvaliacoes._meta.db_table
+    colunas = ', '.join(CONTADORES)
+    # Upsert com soma no próprio banco: duas avaliações simultâneas não perdem incremento
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {tabela} (profissional_id, periodo, inicio, {colunas}) '
+            f'VALUES (%s, %s, %s, {", ".join(["%s"] * len(CONTADORES))}) '
+            f'ON CONFLICT (profissional_id, periodo, inicio) DO UPDATE SET '
+            + ', '.join(f'{c} = {c} + excluded.{c}' for c in CONTADORES),
+            [(profissional_id, periodo, inicio.isoformat(), *valores) for periodo, inicio in linhas],
+        )
+
+
+def registrar_avaliacao(avaliacao, sinal=1):
+    _somar(avaliacao.profissional_id, avaliacao.data_avaliacao, _deltas_avaliacao(avaliacao, sinal))
+
+
+def registrar_comentario(comentario, profissional_id, sinal=1):
+    _somar(profissional_id, comentario.data_comentario, {'respostas': sinal})
+
+
+def _juliano(dia):
+    """Instante UTC do início local do dia, como o julianday() do SQLite."""
+    instante = timezone.make_aware(datetime.combine(dia, datetime.min.time()))
+    return instante.timestamp() / SEGUNDOS_POR_DIA + JULIANO_EPOCA
+
+
+def _instante(juliano):
+    return datetime.fromtimestamp((juliano - JULIANO_EPOCA) * SEGUNDOS_POR_DIA, tz=dt_timezone.utc)
+
+
+def _inicios(periodo, primeiro, ultimo):
+    """Inícios dos períodos de `primeiro` a `ultimo` e mais um, que fecha o último intervalo."""
+    atual = primeiro.replace(day=1) if periodo == 'M' else primeiro
+    inicios = [atual]
+    while atual <= ultimo:
+        atual = _meses_antes(atual, -1) if periodo == 'M' else atual + timedelta(days=1)
+        inicios.append(atual)
+    return inicios
+
+
+def _carregar(profissional_ids=None, desde=None, ate=None):
+    """Avaliações (profissional, nota, recomenda, julianday) e comentários (profissional, julianday)."""
+    filtros, parametros = [], []
+    if profissional_ids is not None:
+        filtros.append(f'a.profissional_id IN ({", ".join(["%s"] * len(profissional_ids))})')
+        parametros += list(profissional_ids)
+    consultas = []
+    for colunas, data, tabela in [
+        ('a.profissional_id, a.nota, a.recomenda', 'a.data_avaliacao', 'usuarios_avaliacao a'),
+        ('a.profissional_id', 'c.data_comentario',
+         'usuarios_comentario c JOIN usuarios_avaliacao a ON a.id = c.avaliacao_id'),
+        # Respostas movidas pelo arquivamento (usuarios/arquivo.py) continuam contando
+        ('a.profissional_id', 'c.data_comentario',
+         'usuarios_comentarioarquivado c JOIN usuarios_avaliacao a ON a.id = c.avaliacao_id'),
+    ]:
+        where, valores = list(filtros), list(parametros)
+        if desde is not None:
+            where.append(f'julianday({data}) >= %s')
+            valores.append(_juliano(desde))
+        if ate is not None:
+            where.append(f'julianday({data}) < %s')
+            valores.append(_juliano(ate))
+        sql = f'SELECT {colunas}, julianday({data}) FROM {tabela}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        consultas.append((sql, valores, colunas.count(',') + 2))
+    # Cursor direto e NumPy: converter 1M de datas para o fuso local linha a linha levava ~30s
+    resultado = []
+    with connection.cursor() as cursor:
+        for sql, valores, largura in consultas:
+            cursor.execute(sql, valores)
+            resultado.append(np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, largura))
+    avaliacoes, comentarios, arquivados = resultado
+    return avaliacoes, np.concatenate([comentarios, arquivados])
+
+
+def _contar(periodo, avaliacoes, comentarios):
+    """Conta avaliações e comentários por (profissional, período) em tuplas prontas para o INSERT."""
+    datas = np.concatenate([avaliacoes[:, 3], comentarios[:, 1]])
+    if not len(datas):
+        return []
+    primeiro = timezone.localdate(_instante(datas.min()))
+    ultimo = timezone.localdate(_instante(datas.max()))
+    inicios = _inicios(periodo, primeiro, ultimo)
+    limites = np.array([_juliano(inicio) for inicio in inicios])
+
+    # Chave (profissional, período) de cada linha: o período sai de uma busca binária nos limites
+    profissionais = np.concatenate([avaliacoes[:, 0], comentarios[:, 0]]).astype(np.int64)
+    chaves = profissionais * len(inicios) + np.searchsorted(limites, datas, side='right') - 1
+    unicas, grupo = np.unique(chaves, return_inverse=True)
+    n = len(avaliacoes)
+    grupo_avaliacoes, grupo_comentarios = grupo[:n], grupo[n:]
+    notas = avaliacoes[:, 1]
+    contagens = {
+        'avaliacoes': np.bincount(grupo_avaliacoes, minlength=len(unicas)),
+        **{
+            f'estrelas_{k}': np.bincount(grupo_avaliacoes, weights=notas == k, minlength=len(unicas))
+            for k in range(1, 6)
+        },
+        'recomendacoes': np.bincount(grupo_avaliacoes, weights=avaliacoes[:, 2], minlength=len(unicas)),
+        'respostas': np.bincount(grupo_comentarios, minlength=len(unicas)),
+    }
+    colunas = [contagens[campo].astype(np.int64).tolist() for campo in CONTADORES]
+    datas = [inicio.isoformat() for inicio in inicios]
+    return [
+        (chave // len(inicios), periodo, datas[chave % len(inicios)], *valores)
+        for chave, *valores in zip(unicas.tolist(), *colunas)
+    ]
+
+
+def _inserir(linhas):
+    # executemany com tuplas: instanciar e passar pelo bulk_create ~350k objetos levava ~20s
+    tabela = ResumoAvaliacoes._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {tabela} (profissional_id, periodo, inicio, {", ".join(CONTADORES)}) '
+            f'VALUES ({", ".join(["%s"] * (len(CONTADORES) + 3))})',
+            linhas,
+        )
+
+
+def recontar(profissional_id, quando):
+    """Recalcula do zero as linhas do dia e do mês de `quando` (edição de avaliação)."""
+    dia = timezone.localdate(quando)
+    mes = dia.replace(day=1)
+    periodos = [('M', mes, _meses_antes(mes, -1))]
+    if dia >= _inicio_diario():
+        periodos.append(('D', dia, dia + timedelta(days=1)))
+    with transaction.atomic():
+        for periodo, inicio, fim in periodos:
+            avaliacoes, comentarios = _carregar([profissional_id], desde=inicio, ate=fim)
+            ResumoAvaliacoes.objects.filter(profissional_id=profissional_id, periodo=periodo, inicio=inicio).delete()
+            _inserir(_contar(periodo, avaliacoes, comentarios))
+
+
+def reconstruir(profissional_ids=None):
+    """Backfill: recria as linhas mensais de todo o histórico e as diárias da janela recente."""
+    avaliacoes, comentarios = _carregar(profissional_ids)
+    inicio_diario = _juliano(_inicio_diario())
+    recentes = avaliacoes[avaliacoes[:, 3] >= inicio_diario], comentarios[comentarios[:, 1] >= inicio_diario]
+    linhas = _contar('M', avaliacoes, comentarios) + _contar('D', *recentes)
+
+    resumos = ResumoAvaliacoes.objects.all()
+    if profissional_ids is not None:
+        resumos = resumos.filter(profissional_id__in=profissional_ids)
+    with transaction.atomic():
+        resumos.delete()
+        _inserir(linhas)
+    return len(linhas)
+
+
+def podar():
+    """Apaga as linhas diárias que saíram da janela; devolve quantas foram apagadas."""
+    apagadas, _ = ResumoAvaliacoes.objects.filter(periodo='D', inicio__lt=_inicio_diario()).delete()
+    return apagadas
+
+
+def _media(linha):
+    if not linha['avaliacoes']:
+        return None
+    soma = sum(n * linha[f'estrelas_{n}'] for n in range(1, 6))
+    return round(soma / linha['avaliacoes'], 2)
+
+
+def _meses_antes(mes, quantidade):
+    indice = mes.year * 12 + mes.month - 1 - quantidade
+    return mes.replace(year=indice // 12, month=indice % 12 + 1)
+
+
+def _serie(profissional_id, periodo, inicios):
+    """Linhas do período para cada início pedido, com zeros onde não houve movimento."""
+    existentes = {
+        linha['inicio']: linha
+        for linha in ResumoAvaliacoes.objects.filter(
+            profissional_id=profissional_id, periodo=periodo, inicio__gte=inicios[0], inicio__lte=inicios[-1],
+        ).values('inicio', *CONTADORES)
+    }
+    serie = []
+    for inicio in inicios:
+        linha = existentes.get(inicio) or dict.fromkeys(CONTADORES, 0)
+        serie.append({
+            'inicio': inicio,
+            'avaliacoes': linha['avaliacoes'],
+            'media': _media(linha),
+            'recomendacoes': linha['recomendacoes'],
+            'respostas': linha['respostas'],
+        })
+    maior = max((item['avaliacoes'] for item in serie), default=0)
+    for item in serie:
+        item['percentual'] = round(100 * item['avaliacoes'] / maior) if maior else 0
+    return serie
+
+
+def painel(profissional_id, meses=12, dias=30):
+    """Distribuição de estrelas, volume mensal e tendência, lidos só dos rollups (três consultas)."""
+    hoje = timezone.localdate()
+    mes_atual = hoje.replace(day=1)
+    dias = min(dias, dias_diarios())
+
+    # O total vem da soma das linhas mensais: no máximo uma por mês de histórico
+    totais = ResumoAvaliacoes.objects.filter(profissional_id=profissional_id, periodo='M').aggregate(
+        **{campo: Sum(campo, default=0) for campo in CONTADORES}
+    )
+    estrelas = [
+        {
+            'nota': n,
+            'quantidade': totais[f'estrelas_{n}'],
+            'percentual': round(100 * totais[f'estrelas_{n}'] / totais['avaliacoes']) if totais['avaliacoes'] else 0,
+        }
+        for n in range(5, 0, -1)
+    ]
+
+    mensal = _serie(profissional_id, 'M', [_meses_antes(mes_atual, i) for i in range(meses - 1, -1, -1)])
+    diario = _serie(profissional_id, 'D', [hoje - timedelta(days=i) for i in range(dias - 1, -1, -1)])
+
+    # Tendência: média dos últimos 3 meses contra a dos 3 anteriores
+    def media_de(itens):
+        quantidade = sum(item['avaliacoes'] for item in itens)
+        soma = sum(item['media'] * item['avaliacoes'] for item in itens if item['media'] is not None)
+        return soma / quantidade if quantidade else None
+
+    recentes, anteriores = media_de(mensal[-3:]), media_de(mensal[-6:-3])
+    tendencia = round(recentes - anteriores, 2) if recentes is not None and anteriores is not None else None
+
+    return {
+        'total': {
+            'avaliacoes': totais['avaliacoes'],
+            'media': _media(totais),
+            'recomendacoes': totais['recomendacoes'],
+            'respostas': totais['respostas'],
+            'estrelas': estrelas,
+        },
+        'tendencia': tendencia,
+        'mensal': mensal,
+        'diario': diario,
+    }
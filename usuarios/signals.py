@@ -0,0 +1,194 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cards, disponibilidade, eventos, ranking, referencia, respostas, resumos, tendencias
+from .models import (
+    Avaliacao,
+    CapturaPerfil,
+    Cidade,
+    Comentario,
+    ComentarioArquivado,
+    Disponibilidade,
+    Endereco,
+    Especialidade,
+    Estado,
+    Profissional,
+    ProfissionalCard,
+    ResumoAvaliacoes,
+    Servico,
+    Usuario,
+)
+
+
+@receiver(post_save, sender=Profissional)
+def profissional_salvo(sender, instance, created, **kwargs):
+    cards.atualizar([instance.pk])
+    if created:
+        disponibilidade.preencher([instance.pk])
+        return
+    # Mantém os campos denormalizados da busca de horários em dia
+    Disponibilidade.objects.filter(profissional=instance).update(
+        especialidade_id=instance.especialidade_id,
+        cidade_id=instance.usuario.endereco.cidade_id if instance.usuario.endereco_id else None,
+    )
+
+
+@receiver(post_delete, sender=Profissional)
+def profissional_excluido(sender, instance, **kwargs):
+    # As avaliações saem na mesma cascata e podem ter recriado linhas de resumo depois da
+    # exclusão delas; a checagem de FK do SQLite só acontece no commit, então dá tempo de limpar
+    ResumoAvaliacoes.objects.filter(profissional_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Endereco)
+def endereco_salvo(sender, instance, **kwargs):
+    Disponibilidade.objects.filter(profissional__usuario__endereco=instance).update(cidade_id=instance.cidade_id)
+    Profissional.marcar_alterados(Profissional.objects.filter(usuario__endereco=instance))
+    cards.atualizar(Profissional.objects.filter(usuario__endereco=instance).values('pk'))
+
+
+@receiver(post_save, sender=Estado)
+@receiver(post_delete, sender=Estado)
+@receiver(post_save, sender=Cidade)
+@receiver(post_delete, sender=Cidade)
+@receiver(post_save, sender=Especialidade)
+@receiver(post_delete, sender=Especialidade)
+def referencia_alterada(sender, **kwargs):
+    # Os workers recarregam estados, cidades e especialidades (usuarios/referencia.py)
+    referencia.invalidar()
+
+
+@receiver(post_save, sender=Cidade)
+def cidade_salva(sender, instance, created, **kwargs):
+    if not created:
+        ProfissionalCard.objects.filter(cidade=instance).update(
+            cidade_nome=instance.nome, estado_sigla=instance.estado.sigla if instance.estado_id else '',
+        )
+        # O nome da cidade aparece na página do profissional: muda a versão (ETag/Last-Modified)
+        Profissional.marcar_alterados(Profissional.objects.filter(usuario__endereco__cidade=instance))
+
+
+@receiver(post_save, sender=Especialidade)
+def especialidade_salva(sender, instance, created, **kwargs):
+    if not created:
+        ProfissionalCard.objects.filter(especialidade=instance).update(especialidade_nome=instance.nome)
+        Profissional.marcar_alterados(Profissional.objects.filter(especialidade=instance))
+
+
+@receiver(post_save, sender=Usuario)
+def usuario_salvo(sender, instance, created, update_fields=None, **kwargs):
+    # O login só atualiza last_login, que não aparece em nenhuma página de profissional
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    # Nome e foto aparecem na página do próprio profissional e nas que o usuário avaliou/respondeu
+    afetados = Profissional.objects.filter(
+        Q(usuario=instance) | Q(avaliacoes__cliente=instance) | Q(avaliacoes__respostas__autor=instance)
+    )
+    Profissional.marcar_alterados(Profissional.objects.filter(pk__in=afetados.values('pk')))
+    cards.atualizar(Profissional.objects.filter(usuario=instance).values('pk'))
+
+
+def _registrar_atividade_apos_commit(profissional_id, tipo):
+    # Só conta o que foi gravado; uma falha na descarga não derruba a requisição (robust)
+    transaction.on_commit(lambda: tendencias.registrar(profissional_id, tipo), robust=True)
+
+
+@receiver(post_save, sender=Servico)
+def servico_salvo(sender, instance, created, **kwargs):
+    # Único ponto que ocupa e libera o bit do horário; agendar_horario lê horario_reservado
+    anterior = getattr(instance, '_agenda_gravada', None)
+    if anterior is None and not created:
+        # Instância montada fora do banco: sem o estado anterior, só vale o horário atual
+        anterior = ('AGENDADO', instance.data_agendamento) if instance.status == 'CANCELADO' else (None, None)
+    instance._guardar_agenda()
+    if anterior is not None and anterior[0] == 'AGENDADO' and (
+        instance.status == 'CANCELADO' or anterior[1] != instance.data_agendamento
+    ):
+        disponibilidade.liberar(instance.profissional_id, anterior[1])
+    if instance.status == 'AGENDADO' and (created or anterior != instance._agenda_gravada):
+        instance.horario_reservado = disponibilidade.ocupar(instance.profissional_id, instance.data_agendamento)
+        if created:
+            _registrar_atividade_apos_commit(instance.profissional_id, 'agendamento')
+
+
+@receiver(post_delete, sender=Servico)
+def servico_excluido(sender, instance, **kwargs):
+    if instance.status == 'AGENDADO':
+        disponibilidade.liberar(instance.profissional_id, instance.data_agendamento)
+
+
+def _publicar_apos_commit(profissional_id, tipo, dados):
+    canal = eventos.canal_profissional(profissional_id)
+    transaction.on_commit(lambda: eventos.central.publicar(canal, tipo, dados))
+
+
+@receiver(post_save, sender=Avaliacao)
+def avaliacao_salva(sender, instance, created, **kwargs):
+    Profissional.marcar_alterados(Profissional.objects.filter(pk=instance.profissional_id))
+    cards.atualizar_notas([instance.profissional_id])
+    if created:
+        ranking.registrar_avaliacao(instance)
+        resumos.registrar_avaliacao(instance)
+        _registrar_atividade_apos_commit(instance.profissional_id, 'avaliacao')
+    else:
+        ranking.recalcular_profissional(instance.profissional_id)
+        resumos.recontar(instance.profissional_id, instance.data_avaliacao)
+    if created and eventos.central.tem_assinantes(eventos.canal_profissional(instance.profissional_id)):
+        _publicar_apos_commit(instance.profissional_id, 'avaliacao_criada', eventos.dados_avaliacao(instance))
+
+
+@receiver(post_delete, sender=Avaliacao)
+def avaliacao_excluida(sender, instance, **kwargs):
+    Profissional.marcar_alterados(Profissional.objects.filter(pk=instance.profissional_id))
+    cards.atualizar_notas([instance.profissional_id])
+    ranking.recalcular_profissional(instance.profissional_id)
+    resumos.registrar_avaliacao(instance, sinal=-1)
+    if eventos.central.tem_assinantes(eventos.canal_profissional(instance.profissional_id)):
+        _publicar_apos_commit(instance.profissional_id, 'avaliacao_excluida', {'id': instance.id})
+
+
+def _profissional_do_comentario(comentario):
+    # Evita consulta quando a avaliação já está em cache (caso normal nas views)
+    if type(comentario).avaliacao.is_cached(comentario):
+        return comentario.avaliacao.profissional_id
+    return Avaliacao.objects.filter(id=comentario.avaliacao_id).values_list('profissional_id', flat=True).first()
+
+
+@receiver(post_save, sender=Comentario)
+def comentario_salvo(sender, instance, created, **kwargs):
+    Profissional.marcar_alterados(Profissional.objects.filter(avaliacoes__id=instance.avaliacao_id))
+    if not created:
+        return
+    respostas.ajustar_total(instance.avaliacao_id, 1)
+    profissional_id = _profissional_do_comentario(instance)
+    if profissional_id:
+        resumos.registrar_comentario(instance, profissional_id)
+    if profissional_id and eventos.central.tem_assinantes():
+        _publicar_apos_commit(profissional_id, 'comentario_criado', eventos.dados_comentario(instance))
+
+
+@receiver(post_delete, sender=Comentario)
+@receiver(post_delete, sender=ComentarioArquivado)
+def comentario_excluido(sender, instance, **kwargs):
+    Profissional.marcar_alterados(Profissional.objects.filter(avaliacoes__id=instance.avaliacao_id))
+    respostas.ajustar_total(instance.avaliacao_id, -1)
+    # Na exclusão em cascata os comentários saem antes da avaliação, que ainda é encontrada aqui
+    profissional_id = _profissional_do_comentario(instance)
+    if profissional_id:
+        resumos.registrar_comentario(instance, profissional_id, sinal=-1)
+    if profissional_id and eventos.central.tem_assinantes():
+        _publicar_apos_commit(
+            profissional_id, 'comentario_excluido', {'id': instance.id, 'avaliacao_id': instance.avaliacao_id},
+        )
+
+
+@receiver(post_delete, sender=CapturaPerfil)
+def captura_excluida(sender, instance, **kwargs):
+    # Os arquivos só saem se a exclusão da linha for confirmada
+    def apagar_arquivos():
+        instance.arquivo_pstats.delete(save=False)
+        instance.arquivo_pilhas.delete(save=False)
+
+    transaction.on_commit(apagar_arquivos)
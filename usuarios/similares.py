@@ -0,0 +1,206 @@
+"""
+"Profissionais parecidos" calculados em lote com NumPy.
+
+O sinal principal é a coavaliação: clientes que avaliaram os dois profissionais. Com A a
+matriz esparsa cliente x profissional, as coavaliações são A^T A; aqui ela é montada sem
+materializar A, gerando os pares de profissionais de cada cliente e contando com np.unique.
+Especialidade, cidade e proximidade de preço completam a pontuação e garantem candidatos
+para quem ainda não tem avaliações.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Avaliacao, Profissional, ProfissionalCard, ProfissionalSimilar
+
+PESOS_PADRAO = {'coavaliacao': 0.5, 'especialidade': 0.3, 'cidade': 0.1, 'preco': 0.1}
+
+
+def _config():
+    return {
+        'top_k': getattr(settings, 'SIMILARES_TOP_K', 6),
+        'pesos': getattr(settings, 'SIMILARES_PESOS', PESOS_PADRAO),
+        'janela': getattr(settings, 'SIMILARES_JANELA_PRECO', 10),
+        'max_por_cliente': getattr(settings, 'SIMILARES_MAX_AVALIACOES_CLIENTE', 200),
+        'encolhimento': getattr(settings, 'SIMILARES_ENCOLHIMENTO', 3),
+    }
+
+
+def _carregar_profissionais():
+    linhas = list(ProfissionalCard.objects.order_by('pk').values_list(
+        'profissional_id', 'especialidade_id', 'cidade_id', 'preco_servico',
+    ))
+    ids = np.array([l[0] for l in linhas], dtype=np.int64)
+    especialidade = np.array([l[1] if l[1] is not None else -1 for l in linhas], dtype=np.int64)
+    cidade = np.array([l[2] if l[2] is not None else -1 for l in linhas], dtype=np.int64)
+    preco = np.array([float(l[3]) if l[3] is not None else np.nan for l in linhas], dtype=np.float64)
+    return ids, especialidade, cidade, preco
+
+
+def _carregar_avaliacoes(ids):
+    # Cursor direto: 1M de tuplas sem instanciar modelos
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT cliente_id, profissional_id FROM usuarios_avaliacao')
+        dados = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+    clientes, profissionais = dados[:, 0], dados[:, 1]
+    # Troca ids por índices 0..n-1 e descarta profissionais sem card
+    indices = np.searchsorted(ids, profissionais)
+    validos = (indices < len(ids)) & (ids[np.minimum(indices, len(ids) - 1)] == profissionais)
+    clientes, indices = clientes[validos], indices[validos]
+    # Um par (cliente, profissional) conta uma vez
+    chaves = np.unique(clientes * len(ids) + indices)
+    return chaves // len(ids), chaves % len(ids)
+
+
+def _coavaliacoes(clientes, profissionais, n, max_por_cliente):
+    """Pares (a, b) com a < b e quantos clientes avaliaram os dois."""
+    ordem = np.lexsort((profissionais, clientes))
+    c, p = clientes[ordem], profissionais[ordem]
+    if not len(c):
+        vazio = np.array([], dtype=np.int64)
+        return vazio, vazio, vazio
+    inicios = np.flatnonzero(np.r_[True, c[1:] != c[:-1]])
+    # Clientes com avaliações demais (robôs, contas de teste) entram só com as primeiras
+    tamanhos = np.minimum(np.diff(np.r_[inicios, len(c)]), max_por_cliente)
+
+    pares = [np.array([], dtype=np.int64)]
+    # Agrupa clientes pelo número de avaliações: cada grupo vira uma matriz (clientes x k)
+    # e os pares saem de um único indexamento com triu_indices
+    for k in np.unique(tamanhos):
+        if k < 2:
+            continue
+        grupo = inicios[tamanhos == k]
+        matriz = p[grupo[:, None] + np.arange(k)]
+        i, j = np.triu_indices(k, 1)
+        a, b = matriz[:, i].ravel(), matriz[:, j].ravel()
+        pares.append(np.minimum(a, b) * n + np.maximum(a, b))
+    chaves, contagem = np.unique(np.concatenate(pares), return_counts=True)
+    return chaves // n, chaves % n, contagem
+
+
+def _vizinhos_por_preco(grupos, preco, janela):
+    """Pares entre cada profissional e os `janela` seguintes do mesmo grupo, em ordem de preço."""
+    precos = np.nan_to_num(preco, nan=np.inf)
+    ordem = np.lexsort((precos, grupos))
+    g = grupos[ordem]
+    a, b = [], []
+    for d in range(1, janela + 1):
+        mesmo = g[:-d] == g[d:]
+        a.append(ordem[:-d][mesmo])
+        b.append(ordem[d:][mesmo])
+    return np.concatenate(a), np.concatenate(b)
+
+
+def calcular(profissional_ids=None):
+    """
+    Calcula o top-K de cada profissional. Devolve {profissional_id: [(similar_id, pontuacao, coavaliacoes)]}.
+
+    Com `profissional_ids`, só as listas desses profissionais são calculadas (atualização
+    incremental): os pares de coavaliação vêm apenas dos clientes que avaliaram algum deles.
+    """
+    config = _config()
+    pesos = config['pesos']
+    ids, especialidade, cidade, preco = _carregar_profissionais()
+    n = len(ids)
+    if n < 2:
+        return {}
+    clientes, profissionais = _carregar_avaliacoes(ids)
+    total_avaliacoes = np.bincount(profissionais, minlength=n)
+
+    alvo = np.ones(n, dtype=bool)
+    if profissional_ids is not None:
+        alvo = np.isin(ids, np.fromiter(profissional_ids, dtype=np.int64))
+        clientes_alvo = np.unique(clientes[alvo[profissionais]])
+        mascara = np.isin(clientes, clientes_alvo)
+        clientes, profissionais = clientes[mascara], profissionais[mascara]
+
+    co_a, co_b, co_n = _coavaliacoes(clientes, profissionais, n, config['max_por_cliente'])
+
+    # Candidatos por atributos: mesmo especialidade+cidade e mesma especialidade, vizinhos de preço
+    esp_cidade = especialidade * (cidade.max() + 2) + (cidade + 1)
+    at_a1, at_b1 = _vizinhos_por_preco(esp_cidade, preco, config['janela'])
+    at_a2, at_b2 = _vizinhos_por_preco(especialidade, preco, config['janela'])
+    at_a, at_b = np.concatenate([at_a1, at_a2]), np.concatenate([at_b1, at_b2])
+    at_chaves = np.minimum(at_a, at_b) * n + np.maximum(at_a, at_b)
+
+    co_chaves = co_a * n + co_b
+    chaves = np.unique(np.concatenate([co_chaves, at_chaves]))
+    a, b = chaves // n, chaves % n
+    co = np.zeros(len(chaves), dtype=np.int64)
+    co[np.searchsorted(chaves, co_chaves)] = co_n
+
+    # Cosseno das coavaliações com encolhimento para pares com poucos clientes em comum
+    denominador = np.sqrt(np.maximum(total_avaliacoes[a] * total_avaliacoes[b], 1))
+    cosseno = (co / denominador) * (co / (co + config['encolhimento']))
+    mesma_especialidade = (especialidade[a] == especialidade[b]) & (especialidade[a] >= 0)
+    mesma_cidade = (cidade[a] == cidade[b]) & (cidade[a] >= 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        proximidade = 1 - np.abs(preco[a] - preco[b]) / np.maximum(preco[a], preco[b])
+    proximidade = np.nan_to_num(np.clip(proximidade, 0, 1), nan=0.0)
+    pontuacao = (
+        pesos['coavaliacao'] * cosseno
+        + pesos['especialidade'] * mesma_especialidade
+        + pesos['cidade'] * mesma_cidade
+        + pesos['preco'] * proximidade
+    )
+
+    # A similaridade é simétrica: cada par entra nas duas direções
+    origem = np.concatenate([a, b])
+    destino = np.concatenate([b, a])
+    pontuacao = np.concatenate([pontuacao, pontuacao])
+    co = np.concatenate([co, co])
+    manter = alvo[origem]
+    origem, destino, pontuacao, co = origem[manter], destino[manter], pontuacao[manter], co[manter]
+
+    # Top-K por origem: ordena por (origem, -pontuação, destino) e corta pela posição no grupo
+    ordem = np.lexsort((destino, -pontuacao, origem))
+    origem, destino, pontuacao, co = origem[ordem], destino[ordem], pontuacao[ordem], co[ordem]
+    inicios = np.flatnonzero(np.r_[True, origem[1:] != origem[:-1]]) if len(origem) else np.array([], dtype=np.int64)
+    posicao = np.arange(len(origem)) - np.repeat(inicios, np.diff(np.r_[inicios, len(origem)]))
+    manter = posicao < config['top_k']
+
+    # Quem não tem candidatos fica com lista vazia (apaga uma lista antiga)
+    resultado = {pid: [] for pid in ids[alvo].tolist()}
+    for o, d, s, c in zip(ids[origem[manter]].tolist(), ids[destino[manter]].tolist(),
+                          pontuacao[manter].tolist(), co[manter].tolist()):
+        resultado[o].append((d, round(s, 6), c))
+    return resultado
+
+
+def gravar(resultado, lote=5000):
+    """Grava só as listas que mudaram; devolve os ids dos profissionais atualizados."""
+    atuais = {}
+    pids = list(resultado)
+    for i in range(0, len(pids), 500):
+        existentes = ProfissionalSimilar.objects.filter(profissional_id__in=pids[i:i + 500])
+        for profissional_id, similar_id in existentes.order_by('profissional_id', 'posicao').values_list(
+                'profissional_id', 'similar_id'):
+            atuais.setdefault(profissional_id, []).append(similar_id)
+
+    alterados = [pid for pid, lista in resultado.items() if [d for d, _, _ in lista] != atuais.get(pid, [])]
+    agora = timezone.now()
+    with transaction.atomic():
+        for i in range(0, len(alterados), lote):
+            bloco = alterados[i:i + lote]
+            ProfissionalSimilar.objects.filter(profissional_id__in=bloco).delete()
+            ProfissionalSimilar.objects.bulk_create([
+                ProfissionalSimilar(
+                    profissional_id=pid, similar_id=similar_id, posicao=posicao,
+                    pontuacao=pontuacao, coavaliacoes=coavaliacoes, calculado_em=agora,
+                )
+                for pid in bloco
+                for posicao, (similar_id, pontuacao, coavaliacoes) in enumerate(resultado[pid])
+            ], batch_size=lote)
+            # O painel faz parte da página de detalhes: invalida o ETag de quem mudou
+            Profissional.marcar_alterados(Profissional.objects.filter(pk__in=bloco))
+    return alterados
+
+
+def afetados_desde(desde):
+    """Profissionais cujas listas podem ter mudado desde `desde` (para a atualização incremental)."""
+    clientes = Avaliacao.objects.filter(data_avaliacao__gt=desde).values('cliente_id')
+    ids = set(Profissional.objects.filter(atualizado_em__gt=desde).values_list('pk', flat=True))
+    ids.update(Avaliacao.objects.filter(cliente_id__in=clientes).values_list('profissional_id', flat=True))
+    ids.update(ProfissionalCard.objects.filter(profissional__similares__isnull=True).values_list('pk', flat=True))
+    return ids
@@ -0,0 +1,238 @@
+"""
+Faixa "Em alta" da página inicial: profissionais com mais avaliações e agendamentos recentes.
+
+Os sinais chamam registrar() depois do commit de cada avaliação nova e de cada agendamento. O
+evento só soma 1 num contador em memória do processo, no balde de TENDENCIAS_BALDE segundos em
+que caiu. descarregar() grava os contadores pendentes em AtividadeRecente com um upsert que soma
+no próprio banco. Assim vários workers gravam o mesmo balde sem perder incremento, e os contadores
+sobrevivem a reinícios. Na saída do processo também há uma descarga. Só o que ainda não tinha
+sido descarregado se perde se o processo morrer.
+
+recalcular() lê os baldes da janela (TENDENCIAS_JANELA baldes), aplica o decaimento (a atividade
+vale metade a cada TENDENCIAS_MEIA_VIDA segundos) e grava as TENDENCIAS_TOP_K primeiras em
+ProfissionalEmAlta. Também poda os baldes que saíram da janela.
+
+As gravações não acontecem em requisição de leitura. Em cada worker, uma thread de fundo
+(habilitada por core/wsgi.py e core/asgi.py, iniciada no primeiro uso dentro do processo) chama
+manter() a cada TENDENCIAS_DESCARGA segundos. manter() descarrega os contadores e, com uma trava
+no cache compartilhado, faz um só recálculo por TENDENCIAS_INTERVALO entre todos os workers.
+Sem a thread (shell, cron), o comando calcular_tendencias faz o recálculo. registrar() também
+descarrega direto quando chega a TENDENCIAS_DESCARGA_MAXIMO contadores, mas ele só roda depois
+do commit de uma escrita. em_alta() só lê: devolve a cópia em memória do top-K, relida da tabela
+no máximo uma vez por intervalo em cada processo.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import AtividadeRecente, Profissional, ProfissionalEmAlta
+
+logger = logging.getLogger('usuarios.tendencias')
+
+TIPOS = ('avaliacao', 'agendamento')
+CHAVE_TRAVA = 'tendencias:recalculo'
+
+
+def _config():
+    return {
+        'balde': getattr(settings, 'TENDENCIAS_BALDE', 3600),
+        'janela': getattr(settings, 'TENDENCIAS_JANELA', 7 * 24),
+        'meia_vida': getattr(settings, 'TENDENCIAS_MEIA_VIDA', 24 * 3600),
+        'pesos': getattr(settings, 'TENDENCIAS_PESOS', {'avaliacao': 1.0, 'agendamento': 1.0}),
+        'top_k': getattr(settings, 'TENDENCIAS_TOP_K', 6),
+        'descarga': getattr(settings, 'TENDENCIAS_DESCARGA', 10),
+        'descarga_maximo': getattr(settings, 'TENDENCIAS_DESCARGA_MAXIMO', 1000),
+        'intervalo': getattr(settings, 'TENDENCIAS_INTERVALO', 60),
+    }
+
+
+def balde(instante=None):
+    """Balde de um instante (timestamp em segundos; padrão: agora)."""
+    return int((time.time() if instante is None else instante) // _config()['balde'])
+
+
+# Contadores ainda não descarregados: {(profissional_id, balde): [avaliacoes, agendamentos]}
+_trava = threading.Lock()
+_pendentes = defaultdict(lambda: [0, 0])
+
+
+def registrar(profissional_id, tipo):
+    """Conta um evento ('avaliacao' ou 'agendamento') do profissional no balde atual."""
+    _garantir_tarefa()
+    with _trava:
+        _pendentes[(profissional_id, balde())][TIPOS.index(tipo)] += 1
+        cheio = len(_pendentes) >= _config()['descarga_maximo']
+    if cheio:
+        descarregar()
+
+
+def descarregar():
+    """Grava os contadores pendentes deste processo; devolve quantas linhas foram somadas."""
+    global _pendentes
+    with _trava:
+        linhas, _pendentes = _pendentes, defaultdict(lambda: [0, 0])
+    if not linhas:
+        return 0
+    tabela = AtividadeRecente._meta.db_table
+    try:
+        # O EXISTS descarta o profissional excluído entre o evento e a descarga
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {tabela} (profissional_id, balde, avaliacoes, agendamentos) '
+                f'SELECT %s, %s, %s, %s WHERE EXISTS (SELECT 1 FROM {Profissional._meta.db_table} WHERE id = %s) '
+                'ON CONFLICT (profissional_id, balde) DO UPDATE SET '
+                'avaliacoes = avaliacoes + excluded.avaliacoes, agendamentos = agendamentos + excluded.agendamentos',
+                [(pk, numero, *contadores, pk) for (pk, numero), contadores in linhas.items()],
+            )
+    except Exception:
+        # Devolve os contadores para a próxima descarga
+        with _trava:
+            for chave, (avaliacoes, agendamentos) in linhas.items():
+                _pendentes[chave][0] += avaliacoes
+                _pendentes[chave][1] += agendamentos
+        raise
+    return len(linhas)
+
+
+def _descarregar_na_saida():
+    if _pendentes:
+        try:
+            descarregar()
+        except Exception:
+            logger.warning('Tendências: descarga na saída falhou', exc_info=True)
+
+
+atexit.register(_descarregar_na_saida)
+
+
+def recalcular(instante=None):
+    """Refaz o top-K a partir dos baldes da janela e poda os antigos. Devolve quantos entraram."""
+    config = _config()
+    atual = balde(instante)
+    inicio = atual - config['janela'] + 1
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT profissional_id, balde, avaliacoes, agendamentos FROM {AtividadeRecente._meta.db_table} '
+            'WHERE balde >= %s AND balde <= %s',
+            [inicio, atual],
+        )
+        dados = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 4)
+
+    ids, indices = np.unique(dados[:, 0].astype(np.int64), return_inverse=True)
+    idade = (atual - dados[:, 1]) * config['balde']
+    peso = 0.5 ** (idade / config['meia_vida'])
+    atividade = config['pesos']['avaliacao'] * dados[:, 2] + config['pesos']['agendamento'] * dados[:, 3]
+    pontuacao = np.bincount(indices, weights=atividade * peso, minlength=len(ids))
+    avaliacoes = np.bincount(indices, weights=dados[:, 2], minlength=len(ids))
+    agendamentos = np.bincount(indices, weights=dados[:, 3], minlength=len(ids))
+
+    # argpartition separa as K maiores sem ordenar o resto; empate fica com o menor id
+    k = min(config['top_k'], int((pontuacao > 0).sum()))
+    escolhidos = np.argpartition(-pontuacao, k - 1)[:k] if k else np.array([], dtype=np.int64)
+    escolhidos = sorted(escolhidos, key=lambda i: (-pontuacao[i], ids[i]))
+
+    agora = timezone.now()
+    with transaction.atomic():
+        ProfissionalEmAlta.objects.all().delete()
+        ProfissionalEmAlta.objects.bulk_create([
+            ProfissionalEmAlta(
+                posicao=posicao, profissional_id=int(ids[i]), pontuacao=float(pontuacao[i]),
+                avaliacoes=int(avaliacoes[i]), agendamentos=int(agendamentos[i]), calculado_em=agora,
+            )
+            for posicao, i in enumerate(escolhidos, start=1)
+        ])
+        AtividadeRecente.objects.filter(balde__lt=inicio).delete()
+    return len(escolhidos)
+
+
+def _recalcular_se_vencido():
+    # cache.add é atômico entre processos: só um worker recalcula por intervalo
+    if cache.add(CHAVE_TRAVA, True, _config()['intervalo']):
+        recalcular()
+
+
+def manter():
+    """Descarrega os contadores e recalcula o top-K se o intervalo venceu (tarefa de fundo)."""
+    descarregar()
+    _recalcular_se_vencido()
+
+
+# Thread de fundo: uma por processo (o pid muda no fork dos workers)
+_trava_tarefa = threading.Lock()
+_tarefa_habilitada = False
+_tarefa_pid = None
+
+
+def habilitar_tarefa():
+    """Liga a thread de fundo deste servidor; ela sobe no primeiro uso de cada processo."""
+    global _tarefa_habilitada
+    _tarefa_habilitada = True
+
+
+def _garantir_tarefa():
+    global _tarefa_pid
+    if not _tarefa_habilitada or _tarefa_pid == os.getpid():
+        return
+    with _trava_tarefa:
+        if _tarefa_pid != os.getpid():
+            threading.Thread(target=_laco, name='tendencias', daemon=True).start()
+            _tarefa_pid = os.getpid()
+
+
+def _laco():
+    while True:
+        time.sleep(_config()['descarga'])
+        try:
+            manter()
+        except Exception:
+            logger.warning('Tendências: descarga ou recálculo falhou', exc_info=True)
+        finally:
+            connection.close()  # a conexão desta thread não fica aberta entre as voltas
+
+
+def _carregar():
+    return [
+        {
+            'profissional_id': item.profissional_id,
+            'nome': item.profissional.nome,
+            'especialidade_nome': item.profissional.especialidade_nome,
+            'imagem_url': item.profissional.imagem_url,
+            'nota_media': item.profissional.nota_media,
+            'avaliacoes': item.avaliacoes,
+            'agendamentos': item.agendamentos,
+        }
+        for item in ProfissionalEmAlta.objects.select_related('profissional').order_by('posicao')
+    ]
+
+
+_trava_leitura = threading.Lock()
+_lista = None
+_lido_em = 0.0
+
+
+def em_alta():
+    """Top-K atual (lista de dicionários compartilhada entre as requisições: não alterar)."""
+    global _lista, _lido_em
+    _garantir_tarefa()
+    atual = _lista
+    if atual is not None and time.monotonic() - _lido_em < _config()['intervalo']:
+        return atual
+    with _trava_leitura:
+        if _lista is None or time.monotonic() - _lido_em >= _config()['intervalo']:
+            _lista, _lido_em = _carregar(), time.monotonic()
+        return _lista
+
+
+def esquecer():
+    """Descarta a cópia em memória: a próxima chamada de em_alta() relê a tabela."""
+    global _lista
+    _lista = None
@@ -1,3 +1,1939 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import smtplib
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import IntegrityError, connection
+from django.db.models import F, QuerySet
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    admissao, aquecimento, arquivo, cache_sqlite, cards, ceps, disponibilidade, estaticos, eventos, exportacao, moderacao, notificacoes,
+    perfilamento, ranking, referencia, respostas, resumos, similares, tendencias, views,
+)
+from .forms import UsuarioCreationForm
+from .models import (
+    AtividadeRecente,
+    Avaliacao,
+    CapturaPerfil,
+    Cidade,
+    Comentario,
+    ComentarioArquivado,
+    Disponibilidade,
+    Endereco,
+    Especialidade,
+    Estado,
+    NotificacaoEmail,
+    Profissional,
+    ProfissionalCard,
+    ProfissionalEmAlta,
+    ResumoAvaliacoes,
+    Servico,
+    ServicoArquivado,
+    Usuario,
+    VersaoCache,
+)
+from .views import IndexView
+
+
+def proximo_dia_util(a_partir_de):
+    dia = a_partir_de + timedelta(days=1)
+    while dia.weekday() >= 5:
+        dia += timedelta(days=1)
+    return dia
+
+
+class DadosBaseMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.estado = Estado.objects.create(nome='São Paulo', sigla='SP')
+        cls.cidade = Cidade.objects.create(nome='Campinas', estado=cls.estado)
+        cls.outra_cidade = Cidade.objects.create(nome='Santos', estado=cls.estado)
+        cls.especialidade = Especialidade.objects.create(nome='Cardiologia')
+        cls.cliente = Usuario.objects.create_user(username='cliente', password='senha', first_name='Ana')
+
+    @classmethod
+    def criar_profissional(cls, username, crm, cidade=None, especialidade=None):
+        endereco = Endereco.objects.create(cidade=cidade or cls.cidade)
+        usuario = Usuario.objects.create_user(
+            username=username, password='senha', email=f'{username}@exemplo.com', endereco=endereco,
+        )
+        return Profissional.objects.create(
+            usuario=usuario,
+            CRM=crm,
+            especialidade=especialidade or cls.especialidade,
+        )
+
+
+@override_settings(AGENDA_HORIZONTE_DIAS=14)
+class DisponibilidadeTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.profissional = self.criar_profissional('dra_maria', 1001)
+        self.outro = self.criar_profissional('dr_joao', 1002)
+        self.dia = proximo_dia_util(timezone.localdate())
+
+    def test_cadastro_materializa_horizonte(self):
+        dias = list(disponibilidade.dias_do_horizonte())
+        self.assertEqual(Disponibilidade.objects.filter(profissional=self.profissional).count(), len(dias))
+        linha = Disponibilidade.objects.get(profissional=self.profissional, dia=self.dia)
+        self.assertEqual(linha.livres, disponibilidade.grade_completa())
+        self.assertEqual(linha.cidade_id, self.cidade.id)
+
+    def test_cadastro_nao_poda_os_outros_profissionais(self):
+        ontem = timezone.localdate() - timedelta(days=1)
+        Disponibilidade.objects.create(profissional=self.outro, dia=ontem)
+        self.criar_profissional('dra_nova', 1004)
+        self.assertTrue(Disponibilidade.objects.filter(profissional=self.outro, dia=ontem).exists())
+
+        call_command('preencher_disponibilidade', stdout=StringIO())
+        self.assertFalse(Disponibilidade.objects.filter(dia__lt=timezone.localdate()).exists())
+
+    def test_agendamento_e_cancelamento_atualizam_bitmap(self):
+        horario = disponibilidade.horario_do_slot(self.dia, 0)
+        servico = Servico.objects.create(
+            profissional=self.profissional, cliente=self.cliente, data_agendamento=horario,
+        )
+        linha = Disponibilidade.objects.get(profissional=self.profissional, dia=self.dia)
+        self.assertFalse(linha.livres & 1)
+        self.assertEqual(linha.menor_bit, 2)
+
+        servico.status = 'CANCELADO'
+        servico.save()
+        linha.refresh_from_db()
+        self.assertEqual(linha.livres, disponibilidade.grade_completa())
+        self.assertEqual(linha.menor_bit, 1)
+
+    def test_remarcar_libera_o_horario_antigo(self):
+        antigo, novo = (disponibilidade.horario_do_slot(self.dia, i) for i in (0, 3))
+        servico = Servico.objects.create(profissional=self.profissional, cliente=self.cliente, data_agendamento=antigo)
+        servico = Servico.objects.get(pk=servico.pk)
+        servico.data_agendamento = novo
+        servico.save()
+        linha = Disponibilidade.objects.get(profissional=self.profissional, dia=self.dia)
+        self.assertEqual(linha.livres, disponibilidade.grade_completa() & ~(1 << 3))
+        # Na mesma instância: remarca de novo e cancela
+        servico.data_agendamento = antigo
+        servico.save()
+        servico.status = 'CANCELADO'
+        servico.save()
+        linha.refresh_from_db()
+        self.assertEqual(linha.livres, disponibilidade.grade_completa())
+
+    def test_reserva_do_mesmo_horario_so_funciona_uma_vez(self):
+        horario = disponibilidade.horario_do_slot(self.dia, 3)
+        self.assertTrue(disponibilidade.ocupar(self.profissional.id, horario))
+        self.assertFalse(disponibilidade.ocupar(self.profissional.id, horario))
+
+    def test_proximos_horarios_ordenados_e_filtrados(self):
+        distante = self.criar_profissional('dr_pedro', 1003, cidade=self.outra_cidade)
+        agora = timezone.make_aware(datetime.combine(self.dia, datetime.min.time()))
+        disponibilidade.ocupar(self.profissional.id, disponibilidade.horario_do_slot(self.dia, 0))
+
+        horarios = disponibilidade.proximos_horarios(self.especialidade.id, self.cidade.id, 3, agora=agora)
+        self.assertEqual(horarios, [
+            (disponibilidade.horario_do_slot(self.dia, 0), self.outro.id),
+            (disponibilidade.horario_do_slot(self.dia, 1), self.profissional.id),
+            (disponibilidade.horario_do_slot(self.dia, 1), self.outro.id),
+        ])
+        self.assertNotIn(distante.id, {p for _, p in horarios})
+
+    def test_proximos_horarios_ignora_slots_passados_de_hoje(self):
+        agora = disponibilidade.horario_do_slot(self.dia, 4) + timedelta(minutes=1)
+        horarios = disponibilidade.proximos_horarios(self.especialidade.id, quantidade=1, agora=agora)
+        self.assertEqual(horarios[0][0], disponibilidade.horario_do_slot(self.dia, 5))
+
+    def test_endpoint_agendar_e_buscar(self):
+        self.client.force_login(self.cliente)
+        horario = disponibilidade.horario_do_slot(self.dia, 2)
+        url = reverse('agendar_horario', args=[self.profissional.id])
+
+        resposta = self.client.post(url, {'horario': horario.isoformat()})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self.client.post(url, {'horario': horario.isoformat()}).status_code, 409)
+        # O conflito desfaz o serviço e a notificação; o horário continua com o primeiro
+        self.assertEqual(Servico.objects.filter(data_agendamento=horario).count(), 1)
+        self.assertEqual(NotificacaoEmail.objects.count(), 1)
+        self.assertFalse(Disponibilidade.objects.get(profissional=self.profissional, dia=self.dia).livres & (1 << 2))
+
+        resposta = self.client.get(reverse('proximos_horarios'), {
+            'especialidade': self.especialidade.id, 'cidade': self.cidade.id, 'quantidade': 5,
+        })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.json()['horarios']), 5)
+
+    def test_mudanca_de_cidade_atualiza_busca(self):
+        endereco = self.profissional.usuario.endereco
+        endereco.cidade = self.outra_cidade
+        endereco.save()
+        self.assertFalse(
+            Disponibilidade.objects.filter(profissional=self.profissional).exclude(cidade=self.outra_cidade).exists()
+        )
+
+
+class BackendComFalha(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPRecipientsRefused({'pessoa@exemplo.com': (550, b'Caixa inexistente')})
+
+
+class NotificacoesTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.profissional = self.criar_profissional('dra_maria', 1001)
+        self.client.force_login(self.cliente)
+
+    def avaliar(self):
+        return self.client.post(reverse('adicionar_avaliacao', args=[self.profissional.id]), {'nota': 5})
+
+    def test_avaliacao_grava_outbox_sem_enviar(self):
+        self.assertEqual(self.avaliar().status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        notificacao = NotificacaoEmail.objects.get()
+        self.assertEqual(notificacao.destinatario, 'dra_maria@exemplo.com')
+        self.assertEqual(notificacao.status, 'PENDENTE')
+
+    def test_drenar_envia_em_lote(self):
+        for i in range(5):
+            notificacoes.enfileirar(f'pessoa{i}@exemplo.com', 'Assunto', 'Corpo')
+        resultado = notificacoes.drenar(tamanho=2)
+        self.assertEqual(resultado['enviados'], 5)
+        self.assertEqual(resultado['lotes'], 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(NotificacaoEmail.objects.filter(status='PENDENTE').exists())
+
+    @override_settings(NOTIFICACOES_MAX_TENTATIVAS=2)
+    def test_falha_agenda_nova_tentativa_e_desiste(self):
+        notificacao = notificacoes.enfileirar('pessoa@exemplo.com', 'Assunto', 'Corpo')
+        resultado = notificacoes.processar_lote(BackendComFalha())
+        self.assertEqual(resultado['falhas'], 1)
+        notificacao.refresh_from_db()
+        self.assertEqual((notificacao.status, notificacao.tentativas), ('PENDENTE', 1))
+        self.assertGreater(notificacao.proxima_tentativa, timezone.now())
+
+        # Ainda em espera: o próximo lote não pega a mensagem
+        self.assertEqual(notificacoes.processar_lote(BackendComFalha())['falhas'], 0)
+
+        NotificacaoEmail.objects.update(proxima_tentativa=timezone.now())
+        notificacoes.processar_lote(BackendComFalha())
+        notificacao.refresh_from_db()
+        self.assertEqual(notificacao.status, 'FALHOU')
+
+    def test_smtp_fora_do_ar_espera_e_tenta_de_novo(self):
+        for i in range(3):
+            notificacoes.enfileirar(f'pessoa{i}@exemplo.com', 'Assunto', 'Corpo')
+        backend = type(mail.get_connection())
+        with mock.patch.object(backend, 'open', side_effect=ConnectionError('SMTP indisponível')), \
+                mock.patch.object(notificacoes.time, 'sleep') as dormir, \
+                self.assertLogs('usuarios.notificacoes', 'ERROR'):
+            resultado = notificacoes.drenar()
+        self.assertEqual((resultado['enviados'], resultado['falhas_conexao']), (0, 1))
+        dormir.assert_not_called()
+        # Nada foi reservado: as mensagens continuam prontas para a próxima execução
+        self.assertEqual(NotificacaoEmail.objects.filter(proxima_tentativa__lte=timezone.now()).count(), 3)
+
+        falhas = [ConnectionError('SMTP indisponível')] * 2 + [None]
+        with mock.patch.object(backend, 'open', side_effect=falhas), \
+                mock.patch.object(notificacoes.time, 'sleep') as dormir, \
+                self.assertLogs('usuarios.notificacoes') as registros:
+            resultado = notificacoes.drenar(
+                continuo=True, intervalo=5,
+                parar=lambda: not NotificacaoEmail.objects.filter(status='PENDENTE').exists(),
+            )
+        self.assertEqual((resultado['enviados'], resultado['falhas_conexao']), (3, 2))
+        self.assertEqual([chamada.args for chamada in dormir.call_args_list], [(5,), (10,)])
+        self.assertEqual(sum('abrir a conexão SMTP' in linha for linha in registros.output), 2)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_queda_da_conexao_no_meio_do_lote_nao_gasta_tentativa(self):
+        for i in range(3):
+            notificacoes.enfileirar(f'pessoa{i}@exemplo.com', 'Assunto', 'Corpo')
+        backend = type(mail.get_connection())
+        enviar_original, chamadas = backend.send_messages, []
+
+        def enviar(conexao, mensagens):
+            chamadas.append(mensagens)
+            if len(chamadas) == 2:
+                raise smtplib.SMTPServerDisconnected('Conexão encerrada pelo servidor')
+            return enviar_original(conexao, mensagens)
+
+        with mock.patch.object(backend, 'send_messages', enviar), \
+                mock.patch.object(backend, 'close') as fechar, \
+                mock.patch.object(notificacoes.time, 'sleep'), \
+                self.assertLogs('usuarios.notificacoes', 'ERROR'):
+            resultado = notificacoes.drenar(
+                continuo=True, parar=lambda: not NotificacaoEmail.objects.filter(status='PENDENTE').exists(),
+            )
+        self.assertEqual((resultado['enviados'], resultado['falhas'], resultado['falhas_conexao']), (3, 0, 1))
+        self.assertGreaterEqual(fechar.call_count, 2)  # fechou a conexão morta antes de reabrir
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            list(NotificacaoEmail.objects.values_list('status', 'tentativas').distinct()), [('ENVIADO', 0)],
+        )
+
+    def test_lote_interrompido_devolve_o_resto_para_a_fila(self):
+        for i in range(3):
+            notificacoes.enfileirar(f'pessoa{i}@exemplo.com', 'Assunto', 'Corpo')
+        conexao = mail.get_connection()
+        with mock.patch.object(conexao, 'send_messages', side_effect=[1, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                notificacoes.processar_lote(conexao)
+        self.assertEqual(NotificacaoEmail.objects.filter(status='ENVIADO').count(), 1)
+        pendentes = NotificacaoEmail.objects.filter(status='PENDENTE')
+        self.assertEqual(pendentes.filter(proxima_tentativa__lte=timezone.now(), tentativas=0).count(), 2)
+
+
+class ViewsAssincronasTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.profissional = self.criar_profissional('dra_maria', 1001)
+        servico = Servico.objects.create(
+            profissional=self.profissional, cliente=self.cliente,
+            data_agendamento=timezone.now(), status='REALIZADO',
+        )
+        self.avaliacao = Avaliacao.objects.create(
+            profissional=self.profissional, cliente=self.cliente, servico=servico, nota=4,
+        )
+        self.async_client = AsyncClient()
+
+    async def test_carregar_cidades(self):
+        resposta = await self.async_client.get(reverse('carregar_cidades'), {'estado': self.estado.id})
+        self.assertEqual({c['nome'] for c in resposta.json()}, {'Campinas', 'Santos'})
+
+    async def test_comentar_e_excluir(self):
+        await self.async_client.aforce_login(self.cliente)
+        resposta = await self.async_client.post(
+            reverse('adicionar_comentario', args=[self.avaliacao.id]), {'texto': 'Obrigado!'},
+        )
+        self.assertEqual(resposta.json()['status'], 'success')
+        comentario = await Comentario.objects.aget(avaliacao=self.avaliacao)
+
+        outro = await Usuario.objects.acreate(username='intruso')
+        await self.async_client.aforce_login(outro)
+        resposta = await self.async_client.post(reverse('excluir_comentario', args=[comentario.id]))
+        self.assertEqual(resposta.status_code, 403)
+
+        await self.async_client.aforce_login(self.cliente)
+        resposta = await self.async_client.post(reverse('excluir_comentario', args=[comentario.id]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(await Comentario.objects.filter(id=comentario.id).aexists())
+
+    async def test_excluir_avaliacao_remove_servico(self):
+        await self.async_client.aforce_login(self.cliente)
+        resposta = await self.async_client.post(reverse('excluir_avaliacao', args=[self.avaliacao.id]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(await Servico.objects.filter(id=self.avaliacao.servico_id).aexists())
+
+
+class CentralEventosTests(TestCase):
+    async def test_publicacao_de_outra_thread_chega_ao_assinante(self):
+        central = eventos.CentralEventos()
+        assinatura = central.assinar('canal')
+        thread = threading.Thread(target=central.publicar, args=('canal', 'teste', {'ok': True}))
+        thread.start()
+        thread.join()
+        mensagem = await asyncio.wait_for(assinatura.fila.get(), 1)
+        self.assertEqual(mensagem, 'event: teste\ndata: {"ok": true}\n\n')
+
+    @override_settings(EVENTOS_FILA_MAXIMA=2)
+    async def test_cliente_lento_e_desconectado(self):
+        central = eventos.CentralEventos()
+        assinatura = central.assinar('canal')
+        for i in range(3):
+            central.publicar('canal', 'teste', {'i': i})
+        self.assertTrue(assinatura.encerrada)
+        self.assertIsNone(await assinatura.fila.get())
+
+    @mock.patch.object(eventos, 'central', eventos.CentralEventos())
+    async def test_fechar_stream_cancela_assinatura(self):
+        assinatura = eventos.central.assinar('canal')
+        stream = eventos.stream('canal', assinatura)
+        await anext(stream)
+        await stream.aclose()
+        self.assertFalse(eventos.central.tem_assinantes())
+        self.assertEqual(eventos.central.publicar('canal', 'teste', {}), 0)
+
+
+class EventosProfissionalTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.profissional = self.criar_profissional('dra_maria', 1001)
+        self.async_client = AsyncClient()
+
+    @mock.patch.object(eventos, 'central', eventos.CentralEventos())
+    async def test_stream_recebe_evento(self):
+        await self.async_client.aforce_login(self.cliente)
+        resposta = await self.async_client.get(reverse('eventos_profissional', args=[self.profissional.id]))
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        conteudo = resposta.streaming_content
+        self.assertEqual(await anext(conteudo), b'retry: 3000\n\n')
+
+        canal = eventos.canal_profissional(self.profissional.id)
+        eventos.central.publicar(canal, 'avaliacao_excluida', {'id': 7})
+        mensagem = (await anext(conteudo)).decode()
+        self.assertTrue(mensagem.startswith('event: avaliacao_excluida'))
+        self.assertEqual(json.loads(mensagem.split('data: ')[1]), {'id': 7})
+
+
+    def test_wsgi_responde_204(self):
+        self.client.force_login(self.cliente)
+        resposta = self.client.get(reverse('eventos_profissional', args=[self.profissional.id]))
+        self.assertEqual(resposta.status_code, 204)
+
+
+class DetalhesCondicionalTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.profissional = self.criar_profissional('dra_maria', 1001)
+        self.url = reverse('profissional_detalhes', args=[self.profissional.id])
+        self.client.force_login(self.cliente)
+        self.client.get(self.url)  # define o cookie CSRF
+
+    def test_revisita_sem_mudancas_responde_304_sem_renderizar(self):
+        primeira = self.client.get(self.url)
+        self.assertEqual(primeira.status_code, 200)
+        with self.assertNumQueries(3):  # sessão, usuário e validador
+            segunda = self.client.get(self.url, HTTP_IF_NONE_MATCH=primeira['ETag'])
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda.content, b'')
+
+    def test_if_modified_since(self):
+        primeira = self.client.get(self.url)
+        segunda = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=primeira['Last-Modified'])
+        self.assertEqual(segunda.status_code, 304)
+
+    def test_nova_avaliacao_invalida_validador(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(reverse('adicionar_avaliacao', args=[self.profissional.id]), {'nota': 5})
+        resposta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_renomear_cidade_ou_especialidade_invalida_validador(self):
+        outro = self.criar_profissional('dr_santos', 1002, cidade=self.outra_cidade)
+        versao_outro = Profissional.objects.get(pk=outro.pk).versao
+        for referencia_alterada, nome in ((self.cidade, 'Campinas (SP)'), (self.especialidade, 'Cardiologia Clínica')):
+            etag = self.client.get(self.url)['ETag']
+            referencia_alterada.nome = nome
+            referencia_alterada.save()
+            resposta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertContains(resposta, nome)
+        # Outra cidade: só a troca de especialidade o alcança
+        self.assertEqual(Profissional.objects.get(pk=outro.pk).versao, versao_outro + 1)
+
+    def test_edicoes_simultaneas_mudam_a_versao_duas_vezes(self):
+        primeira, segunda = Profissional.objects.get(pk=self.profissional.pk), Profissional.objects.get(pk=self.profissional.pk)
+        versao = primeira.versao
+        primeira.biografia = 'Cardiologista'
+        primeira.save()
+        segunda.preco_servico = 200
+        segunda.save(update_fields=['preco_servico'])
+        self.assertEqual((primeira.versao, segunda.versao), (versao + 1, versao + 2))
+        self.assertEqual(Profissional.objects.get(pk=self.profissional.pk).versao, versao + 2)
+
+    def test_etag_depende_do_usuario(self):
+        etag = self.client.get(self.url)['ETag']
+        outro = Usuario.objects.create_user(username='outro', password='senha')
+        self.client.force_login(outro)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+def view_n_mais_1(request):
+    # Uma consulta pelo usuário de cada profissional
+    return HttpResponse(', '.join(p.usuario.username for p in Profissional.objects.all()))
+
+
+urlpatterns = [path('n-mais-1/', view_n_mais_1, name='n_mais_1')]
+
+
+class InstrumentacaoSQLTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        for i in range(4):
+            self.criar_profissional(f'medico_{i}', 2000 + i)
+
+    def test_server_timing(self):
+        resposta = self.client.get(reverse('login'))
+        self.assertRegex(resposta['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ consultas", total;dur=[\d.]+$')
+
+    @override_settings(SQL_LIMITE_REPETICOES=3, ROOT_URLCONF='usuarios.tests')
+    def test_alerta_de_n_mais_1(self):
+        # View de teste (urlpatterns abaixo): as páginas reais não devem ter N+1 para servir de exemplo
+        with self.assertLogs('usuarios.sql', 'WARNING') as logs:
+            self.client.get(reverse('n_mais_1'))
+        self.assertIn('possível N+1', logs.output[0])
+
+    @override_settings(SQL_ORCAMENTOS_POR_VIEW={'index': {'consultas': 1}})
+    def test_orcamento_por_view(self):
+        with self.assertLogs('usuarios.sql', 'WARNING') as logs:
+            self.client.get(reverse('index'))
+        self.assertIn('orçamento 1', logs.output[0])
+
+    async def test_conta_consultas_de_view_assincrona(self):
+        # Cache de referência frio: a versão e as três tabelas
+        referencia._dados = None
+        resposta = await AsyncClient().get(reverse('carregar_cidades'), {'estado': self.estado.id})
+        self.assertIn('desc="4 consultas"', resposta['Server-Timing'])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PerfilamentoTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.staff = Usuario.objects.create_user(username='admin', password='senha', is_staff=True)
+
+    def test_staff_com_parametro_gera_captura(self):
+        original = IndexView.get_context_data
+
+        def view_lenta(view, **kwargs):
+            # Garante várias amostras de pilha independentemente da velocidade da máquina
+            time.sleep(0.05)
+            return original(view, **kwargs)
+
+        self.client.force_login(self.staff)
+        with mock.patch.object(IndexView, 'get_context_data', view_lenta):
+            resposta = self.client.get(reverse('index'), {'_perfil': '1'})
+        captura = CapturaPerfil.objects.get(pk=resposta['X-Perfil-Captura'])
+        self.assertEqual(captura.rota, 'index')
+        self.assertEqual(captura.usuario, self.staff)
+        self.assertEqual(captura.escopo, 'thread')
+        self.assertIn('index', captura.arquivo_pstats.name)
+        self.assertGreater(captura.amostras, 0)
+        pilhas = captura.arquivo_pilhas.read().decode()
+        self.assertIn('usuarios.middleware:__call__;', pilhas)
+        self.assertIn('usuarios.tests:view_lenta', pilhas)
+        self.assertIn('cumulative', perfilamento.resumo(captura.arquivo_pstats.path))
+
+    def test_usuario_comum_nao_perfila(self):
+        self.client.force_login(self.cliente)
+        resposta = self.client.get(reverse('index'), {'_perfil': '1'})
+        self.assertNotIn('X-Perfil-Captura', resposta)
+        self.assertFalse(CapturaPerfil.objects.exists())
+
+    def test_cabecalho_assinado(self):
+        self.client.get(reverse('login'), HTTP_X_PERFIL='falso')
+        self.assertFalse(CapturaPerfil.objects.exists())
+        resposta = self.client.get(reverse('login'), HTTP_X_PERFIL=perfilamento.gerar_token())
+        self.assertEqual(CapturaPerfil.objects.get().pk, int(resposta['X-Perfil-Captura']))
+
+    @override_settings(PERFIL_MAXIMO_CAPTURAS=2, PERFIL_DIAS_CAPTURAS=7)
+    def test_capturas_antigas_sao_podadas_com_os_arquivos(self):
+        token = perfilamento.gerar_token()
+        primeira = self.client.get(reverse('login'), HTTP_X_PERFIL=token)['X-Perfil-Captura']
+        velha = CapturaPerfil.objects.get(pk=primeira)
+        arquivos = [velha.arquivo_pstats.path, velha.arquivo_pilhas.path]
+        self.assertTrue(all(os.path.exists(caminho) for caminho in arquivos))
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                self.client.get(reverse('login'), HTTP_X_PERFIL=token)
+        self.assertEqual(CapturaPerfil.objects.count(), 2)
+        self.assertFalse(CapturaPerfil.objects.filter(pk=primeira).exists())
+        self.assertFalse([caminho for caminho in arquivos if os.path.exists(caminho)])
+        # Pela idade
+        CapturaPerfil.objects.update(criado_em=timezone.now() - timedelta(days=8))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(perfilamento.podar(), 2)
+        self.assertFalse(CapturaPerfil.objects.exists())
+
+    async def test_captura_assincrona_marca_o_loop_inteiro(self):
+        resposta = await AsyncClient().get(reverse('login'), headers={'X-Perfil': perfilamento.gerar_token()})
+        captura = await CapturaPerfil.objects.aget(pk=resposta['X-Perfil-Captura'])
+        self.assertEqual(captura.escopo, 'loop')
+
+    def test_admin_lista_capturas(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('login'), {'_perfil': '1'})
+        self.staff.is_superuser = True
+        self.staff.save()
+        captura = CapturaPerfil.objects.get()
+        resposta = self.client.get(reverse('admin:usuarios_capturaperfil_change', args=[captura.pk]))
+        self.assertContains(resposta, 'Funções mais custosas')
+
+
+class ProfissionalCardTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.profissional = self.criar_profissional('dra_maria', 3001)
+
+    def test_card_criado_com_dados_planos(self):
+        card = ProfissionalCard.objects.get(pk=self.profissional.pk)
+        self.assertEqual(card.nome, 'dra_maria')
+        self.assertEqual(card.crm, 3001)
+        self.assertEqual(card.especialidade_nome, 'Cardiologia')
+        self.assertEqual((card.cidade_nome, card.estado_sigla), ('Campinas', 'SP'))
+        self.assertEqual(card.total_avaliacoes, 0)
+
+    def test_sinais_mantem_card_em_dia(self):
+        servico = Servico.objects.create(
+            profissional=self.profissional, cliente=self.cliente, data_agendamento=timezone.now(),
+        )
+        Avaliacao.objects.create(profissional=self.profissional, cliente=self.cliente, servico=servico, nota=4)
+        usuario = self.profissional.usuario
+        usuario.first_name, usuario.last_name = 'Maria', 'Souza'
+        usuario.save()
+        endereco = usuario.endereco
+        endereco.cidade = self.outra_cidade
+        endereco.save()
+        self.especialidade.nome = 'Cardiologia Clínica'
+        self.especialidade.save()
+
+        card = ProfissionalCard.objects.get(pk=self.profissional.pk)
+        self.assertEqual((card.nota_media, card.total_avaliacoes), (4.0, 1))
+        self.assertEqual(card.nome, 'Maria Souza')
+        self.assertEqual(card.cidade_nome, 'Santos')
+        self.assertEqual(card.especialidade_nome, 'Cardiologia Clínica')
+
+        Avaliacao.objects.all().delete()
+        card.refresh_from_db()
+        self.assertEqual((card.nota_media, card.total_avaliacoes), (None, 0))
+
+    def test_index_le_so_do_card_com_consultas_fixas(self):
+        for i in range(6):
+            self.criar_profissional(f'medico_{i}', 3100 + i)
+        # contagem da paginação e página de cards; as especialidades do filtro e a faixa "Em alta" vêm do cache
+        referencia.dados()
+        tendencias.em_alta()
+        with self.assertNumQueries(2):
+            resposta = self.client.get(reverse('index'), {'especialidade': self.especialidade.id})
+        self.assertContains(resposta, 'CRM: 3001')
+        with self.assertNumQueries(2):
+            resposta = self.client.get(reverse('index'), {'nome': 'medico_5'})
+        self.assertContains(resposta, 'CRM: 3105')
+        self.assertNotContains(resposta, 'CRM: 3001')
+
+    def test_reconstruir(self):
+        ProfissionalCard.objects.all().delete()
+        call_command('reconstruir_cards', stdout=StringIO())
+        self.assertTrue(ProfissionalCard.objects.filter(pk=self.profissional.pk).exists())
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_miniatura_pre_calculada(self):
+        conteudo = BytesIO()
+        Image.new('RGB', (800, 600), 'blue').save(conteudo, 'PNG')
+        self.profissional.imagem.save('foto.png', ContentFile(conteudo.getvalue()))
+        card = ProfissionalCard.objects.get(pk=self.profissional.pk)
+        self.assertTrue(card.imagem_url.endswith('miniaturas/foto-260.jpg'))
+        with Image.open(os.path.join(settings.MEDIA_ROOT, 'miniaturas', 'foto-260.jpg')) as miniatura:
+            self.assertEqual(miniatura.size, (260, 260))
+
+
+class SimilaresTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.dermatologia = Especialidade.objects.create(nome='Dermatologia')
+        self.a = self.criar_profissional('dr_a', 4001)
+        self.b = self.criar_profissional('dr_b', 4002)
+        self.c = self.criar_profissional('dr_c', 4003, cidade=self.outra_cidade, especialidade=self.dermatologia)
+        self.d = self.criar_profissional('dr_d', 4004, cidade=self.outra_cidade, especialidade=self.dermatologia)
+        # Três clientes avaliaram A e C; ninguém avaliou C e D juntos
+        for i in range(3):
+            cliente = Usuario.objects.create_user(username=f'paciente_{i}', password='senha')
+            for profissional in (self.a, self.c):
+                servico = Servico.objects.create(
+                    profissional=profissional, cliente=cliente, data_agendamento=timezone.now(),
+                )
+                Avaliacao.objects.create(profissional=profissional, cliente=cliente, servico=servico, nota=5)
+
+    def test_coavaliacao_e_atributos(self):
+        resultado = similares.calcular()
+        lista_a = {similar: co for similar, _, co in resultado[self.a.pk]}
+        self.assertEqual(lista_a[self.c.pk], 3)
+        self.assertIn(self.b.pk, lista_a)
+        self.assertNotIn(self.a.pk, lista_a)
+        # D não tem coavaliações, mas é da mesma especialidade e cidade de C
+        self.assertEqual(resultado[self.d.pk][0][0], self.c.pk)
+        pontuacoes = [p for _, p, _ in resultado[self.c.pk]]
+        self.assertEqual(pontuacoes, sorted(pontuacoes, reverse=True))
+
+    def test_incremental_e_gravacao_so_do_que_mudou(self):
+        self.assertEqual(set(similares.calcular([self.d.pk])), {self.d.pk})
+        self.assertEqual(set(similares.gravar(similares.calcular())), {self.a.pk, self.b.pk, self.c.pk, self.d.pk})
+        self.assertEqual(similares.gravar(similares.calcular()), [])
+        self.assertIn(self.d.pk, similares.afetados_desde(timezone.now() - timedelta(minutes=5)))
+
+    def test_painel_na_pagina_de_detalhes(self):
+        call_command('calcular_similares', stdout=StringIO())
+        self.client.force_login(self.cliente)
+        resposta = self.client.get(reverse('profissional_detalhes', args=[self.a.pk]))
+        self.assertContains(resposta, 'Profissionais Parecidos')
+        self.assertEqual(resposta.context['similares'][0].similar_id, self.b.pk)
+        self.assertContains(resposta, reverse('profissional_detalhes', args=[self.c.pk]))
+
+
+class RankingTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.novato = self.criar_profissional('dr_novato', 5001)
+        self.veterano = self.criar_profissional('dr_veterano', 5002)
+
+    def avaliar(self, profissional, notas, recomenda=True):
+        for i, nota in enumerate(notas):
+            cliente = Usuario.objects.create(username=f'p_{profissional.pk}_{i}')
+            servico = Servico.objects.create(profissional=profissional, cliente=cliente, data_agendamento=timezone.now())
+            Avaliacao.objects.create(
+                profissional=profissional, cliente=cliente, servico=servico, nota=nota, recomenda=recomenda,
+            )
+
+    def pontos(self, profissional):
+        return ProfissionalCard.objects.get(pk=profissional.pk).ranking
+
+    def test_uma_nota_5_nao_supera_muitas_notas_altas(self):
+        self.avaliar(self.novato, [5])
+        self.avaliar(self.veterano, [5] * 32 + [4] * 8)
+        self.assertGreater(self.pontos(self.veterano), self.pontos(self.novato))
+        self.assertAlmostEqual(
+            ProfissionalCard.objects.get(pk=self.novato.pk).nota_media, 5.0,
+        )
+
+    def test_incremental_coincide_com_lote(self):
+        self.avaliar(self.veterano, [5, 3, 4, 2])
+        self.avaliar(self.novato, [4], recomenda=False)
+        incremental = {p.pk: self.pontos(p) for p in (self.novato, self.veterano)}
+        call_command('calcular_ranking', stdout=StringIO())
+        for profissional in (self.novato, self.veterano):
+            self.assertAlmostEqual(self.pontos(profissional), incremental[profissional.pk], places=6)
+        Avaliacao.objects.filter(profissional=self.veterano, nota=2).delete()
+        self.assertGreater(self.pontos(self.veterano), incremental[self.veterano.pk])
+
+    def test_avaliacoes_antigas_pesam_menos(self):
+        self.avaliar(self.novato, [5] * 10)
+        self.avaliar(self.veterano, [5] * 10)
+        Avaliacao.objects.filter(profissional=self.veterano).update(
+            data_avaliacao=timezone.now() - timedelta(days=3 * 365),
+        )
+        ranking.recalcular()
+        self.assertGreater(self.pontos(self.novato), self.pontos(self.veterano))
+
+    def test_index_ordena_pelo_ranking_sem_ler_avaliacoes(self):
+        self.avaliar(self.veterano, [5] * 5)
+        referencia.dados()
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('index'), {'ordem': 'avaliacao'})
+        self.assertEqual(len(consultas), 2)
+        self.assertFalse(any('usuarios_avaliacao' in q['sql'] for q in consultas.captured_queries))
+        self.assertEqual(
+            [card.profissional_id for card in resposta.context['profissionais']], [self.veterano.pk, self.novato.pk],
+        )
+
+
+class ResumoAvaliacoesTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.profissional = self.criar_profissional('dra_resumo', 6001)
+
+    def avaliar(self, notas, recomenda=True):
+        avaliacoes = []
+        for nota in notas:
+            cliente = Usuario.objects.create(username=f'r_{Usuario.objects.count()}')
+            servico = Servico.objects.create(profissional=self.profissional, cliente=cliente, data_agendamento=timezone.now())
+            avaliacoes.append(Avaliacao.objects.create(
+                profissional=self.profissional, cliente=cliente, servico=servico, nota=nota, recomenda=recomenda,
+            ))
+        return avaliacoes
+
+    def linhas(self):
+        # Linhas zeradas por exclusões não fazem diferença para o painel
+        todas = ResumoAvaliacoes.objects.values_list('profissional_id', 'periodo', 'inicio', *resumos.CONTADORES)
+        return sorted(linha for linha in todas if any(linha[3:]))
+
+    def test_incremental_coincide_com_backfill(self):
+        avaliacoes = self.avaliar([5, 4, 4, 1])
+        self.avaliar([3], recomenda=False)
+        Comentario.objects.create(avaliacao=avaliacoes[0], autor=self.profissional.usuario, texto='Obrigado')
+        Comentario.objects.create(avaliacao=avaliacoes[3], autor=self.profissional.usuario, texto='Sinto muito')
+        removido = Comentario.objects.create(avaliacao=avaliacoes[1], autor=self.cliente, texto='Apagar')
+        removido.delete()
+        avaliacoes[3].delete()  # leva o comentário junto
+        avaliacoes[2].nota = 2
+        avaliacoes[2].save()
+
+        incremental = self.linhas()
+        hoje = timezone.localdate()
+        diario = ResumoAvaliacoes.objects.get(profissional=self.profissional, periodo='D', inicio=hoje)
+        self.assertEqual(
+            (diario.avaliacoes, diario.estrelas_5, diario.estrelas_4, diario.estrelas_2, diario.estrelas_1,
+             diario.recomendacoes, diario.respostas),
+            (4, 1, 1, 1, 0, 3, 1),
+        )
+        resumos.reconstruir()
+        self.assertEqual(self.linhas(), incremental)
+
+    def test_exclusao_antiga_nao_recria_dia_fora_da_janela(self):
+        antiga, = self.avaliar([4])
+        quando = timezone.now() - timedelta(days=400)
+        Avaliacao.objects.filter(pk=antiga.pk).update(data_avaliacao=quando)
+        resumos.reconstruir()
+        antiga.refresh_from_db()
+        antiga.delete()
+        mes = timezone.localdate(quando).replace(day=1)
+        self.assertEqual(ResumoAvaliacoes.objects.get(periodo='M', inicio=mes).avaliacoes, 0)
+        self.assertFalse(ResumoAvaliacoes.objects.filter(periodo='D').exists())
+
+        # Linhas diárias velhas saem na poda; as mensais ficam
+        ResumoAvaliacoes.objects.create(profissional=self.profissional, periodo='D', inicio=timezone.localdate(quando))
+        self.assertEqual(resumos.podar(), 1)
+        self.assertTrue(ResumoAvaliacoes.objects.filter(periodo='M').exists())
+
+    def test_painel_le_so_os_rollups(self):
+        self.avaliar([5, 5, 4])
+        with self.assertNumQueries(3):
+            painel = resumos.painel(self.profissional.pk)
+        self.assertEqual(painel['total']['avaliacoes'], 3)
+        self.assertEqual(painel['total']['media'], 4.67)
+        self.assertEqual([e['quantidade'] for e in painel['total']['estrelas']], [2, 1, 0, 0, 0])
+        self.assertEqual(len(painel['mensal']), 12)
+        self.assertEqual(painel['mensal'][-1]['avaliacoes'], 3)
+        self.assertEqual(len(painel['diario']), 30)
+
+        # Mais histórico não muda o número de consultas
+        self.avaliar([3] * 20)
+        with self.assertNumQueries(3):
+            resumos.painel(self.profissional.pk)
+
+    def test_endpoint_json_e_perfil(self):
+        self.avaliar([5, 2])
+        url = reverse('resumo_avaliacoes', args=[self.profissional.pk])
+        self.client.force_login(self.profissional.usuario)
+        dados = self.client.get(url, {'meses': 3, 'dias': 7}).json()
+        self.assertEqual(dados['status'], 'success')
+        self.assertEqual(dados['total']['avaliacoes'], 2)
+        self.assertEqual(len(dados['mensal']), 3)
+        self.assertEqual(dados['diario'][-1]['inicio'], timezone.localdate().isoformat())
+        self.assertContains(self.client.get(reverse('profile')), 'Distribuição das notas')
+
+        self.client.force_login(self.cliente)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_excluir_profissional_com_avaliacoes(self):
+        avaliacao, = self.avaliar([5])
+        Comentario.objects.create(avaliacao=avaliacao, autor=self.cliente, texto='Comentário')
+        self.profissional.usuario.delete()
+        self.assertFalse(ResumoAvaliacoes.objects.exists())
+
+
+class AdminTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_superuser(username='root', password='senha', email='root@exemplo.com')
+        self.client.force_login(self.admin)
+        self.profissionais = 0
+
+    def popular(self, quantidade):
+        """Cada rodada cria um registro novo em todas as tabelas do admin."""
+        for _ in range(quantidade):
+            self.profissionais += 1
+            profissional = self.criar_profissional(f'adm_{self.profissionais}', 7000 + self.profissionais)
+            cliente = Usuario.objects.create(username=f'adm_cliente_{self.profissionais}')
+            servico = Servico.objects.create(profissional=profissional, cliente=cliente, data_agendamento=timezone.now())
+            avaliacao = Avaliacao.objects.create(profissional=profissional, cliente=cliente, servico=servico, nota=4)
+            Comentario.objects.create(avaliacao=avaliacao, autor=profissional.usuario, texto='Obrigado')
+            NotificacaoEmail.objects.create(destinatario=f'{cliente.username}@exemplo.com', assunto='a', corpo='b')
+            CapturaPerfil.objects.create(rota='index', caminho='/', metodo='GET', status_code=200,
+                                         duracao_ms=1, amostras=1, usuario=cliente)
+            estado = Estado.objects.create(nome=f'Estado {self.profissionais}', sigla=f'E{self.profissionais}')
+            Cidade.objects.create(nome=f'Cidade {self.profissionais}', estado=estado)
+            Especialidade.objects.create(nome=f'Especialidade {self.profissionais}')
+
+    def consultas(self, url):
+        with CaptureQueriesContext(connection) as capturadas:
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return [q['sql'] for q in capturadas.captured_queries]
+
+    def test_changelists_com_consultas_constantes(self):
+        changelists = [
+            reverse(f'admin:usuarios_{modelo._meta.model_name}_changelist')
+            for modelo in admin.site._registry if modelo._meta.app_label == 'usuarios'
+        ]
+        self.popular(2)
+        poucos = {url: len(self.consultas(url)) for url in changelists}
+        self.popular(5)
+        for url in changelists:
+            with self.subTest(url=url):
+                self.assertEqual(len(self.consultas(url)), poucos[url])
+
+    @override_settings(ADMIN_LIMITE_CONTAGEM_EXATA=3)
+    def test_tabela_grande_usa_contagem_estimada(self):
+        self.popular(5)
+        arquivo.analisar()
+        url = reverse('admin:usuarios_avaliacao_changelist')
+        consultas = self.consultas(url)
+        self.assertFalse([sql for sql in consultas if 'COUNT(' in sql])
+        # Nem a hierarquia de datas nem os filtros varrem a tabela com SELECT DISTINCT
+        self.assertFalse([sql for sql in consultas if 'DISTINCT' in sql])
+        # Com filtro a contagem é exata
+        self.assertTrue([sql for sql in self.consultas(url + '?nota=4') if 'COUNT(' in sql])
+
+    @override_settings(ADMIN_LIMITE_CONTAGEM_EXATA=3)
+    def test_contagem_com_ids_espalhados(self):
+        self.popular(3)
+        avaliacao = Avaliacao.objects.first()
+        Comentario.objects.create(pk=10 ** 6, avaliacao=avaliacao, autor=self.cliente, texto='Longe')
+        ComentarioArquivado.objects.create(pk=10 ** 6, avaliacao=avaliacao, autor=self.cliente,
+                                           texto='Arquivado', data_comentario=timezone.now())
+        url = reverse('admin:usuarios_comentario_changelist')
+        # Sem ANALYZE não há estimativa: o maior pk não vira total
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 4)
+        arquivo.analisar()
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 4)
+        # Estatística velha fica limitada à faixa de pks que sobrou
+        Comentario.objects.exclude(pk=10 ** 6).delete()
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 1)
+        # O arquivo sempre conta exato
+        resposta = self.client.get(reverse('admin:usuarios_comentarioarquivado_changelist'))
+        self.assertEqual(type(resposta.context['cl'].paginator).__name__, 'Paginator')
+        self.assertEqual(resposta.context['cl'].result_count, 1)
+
+    def test_busca_exata_por_username(self):
+        self.popular(3)
+        url = reverse('admin:usuarios_avaliacao_changelist')
+        resposta = self.client.get(url, {'q': 'adm_cliente_2'})
+        self.assertEqual(resposta.context['cl'].result_count, 1)
+        self.assertEqual(resposta.context['cl'].result_list[0].cliente.username, 'adm_cliente_2')
+        resposta = self.client.get(url, {'q': 'adm_2'})  # o usuário do profissional
+        self.assertEqual(resposta.context['cl'].result_count, 1)
+        # Texto numa coluna numérica (CRM) não quebra a busca
+        resposta = self.client.get(reverse('admin:usuarios_profissional_changelist'), {'q': 'abc'})
+        self.assertEqual(resposta.context['cl'].result_count, 0)
+        resposta = self.client.get(reverse('admin:usuarios_profissional_changelist'), {'q': '7001'})
+        self.assertEqual(resposta.context['cl'].result_count, 1)
+
+    def test_formularios_nao_listam_tabelas_grandes(self):
+        self.popular(1)
+        avaliacao = Avaliacao.objects.get()
+        resposta = self.client.get(reverse('admin:usuarios_avaliacao_change', args=[avaliacao.pk]))
+        self.assertContains(resposta, 'vForeignKeyRawIdAdminField')
+        self.assertNotContains(resposta, '<select name="servico"')
+        resposta = self.client.get(reverse('admin:usuarios_usuario_change', args=[self.admin.pk]))
+        self.assertNotContains(resposta, '<select name="endereco"')
+
+
+class CidadeFormTests(DadosBaseMixin, TestCase):
+    def dados_cadastro(self, **extra):
+        return {
+            'username': 'novo', 'first_name': 'Novo', 'last_name': 'Cliente', 'email': 'novo@exemplo.com',
+            'password1': 'senha-forte-123', 'password2': 'senha-forte-123', 'estado': self.estado.pk, **extra,
+        }
+
+    def test_cadastro_nao_lista_todas_as_cidades(self):
+        for i in range(20):
+            Cidade.objects.create(nome=f'Município {i}', estado=self.estado)
+        referencia.dados()
+        for rota in ('register_client', 'register_professional'):
+            with self.subTest(rota=rota), CaptureQueriesContext(connection) as consultas:
+                resposta = self.client.get(reverse(rota))
+            self.assertNotContains(resposta, 'Município')
+            self.assertFalse([q for q in consultas.captured_queries if 'usuarios_cidade' in q['sql']])
+
+    def test_valida_cidade_e_estado_pelo_cache(self):
+        referencia.dados()
+        form = UsuarioCreationForm(data=self.dados_cadastro(cidade=self.cidade.pk))
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertTrue(form.is_valid(), form.errors)
+        # Só as buscas de username repetido
+        self.assertFalse([q for q in consultas.captured_queries if 'usuarios_' in q['sql']])
+        self.assertEqual(form.cleaned_data['cidade'], self.cidade)
+        self.assertEqual(form.cleaned_data['estado'], self.estado)
+
+        # Cidade de outro estado, id inexistente ou texto: inválido
+        outro_estado = Estado.objects.create(nome='Rio de Janeiro', sigla='RJ')
+        niteroi = Cidade.objects.create(nome='Niterói', estado=outro_estado)
+        for valor in (niteroi.pk, 999999, 'abc'):
+            form = UsuarioCreationForm(data=self.dados_cadastro(cidade=valor))
+            self.assertFalse(form.is_valid())
+            self.assertIn('cidade', form.errors)
+
+    def test_formulario_reexibido_mantem_so_a_cidade_escolhida(self):
+        Cidade.objects.create(nome='Sorocaba', estado=self.estado)
+        resposta = self.client.post(reverse('register_client'), self.dados_cadastro(cidade=self.cidade.pk, password2='x'))
+        self.assertContains(resposta, f'<option value="{self.cidade.pk}" selected>Campinas</option>', html=True)
+        self.assertNotContains(resposta, 'Sorocaba')
+
+    def test_edicao_de_perfil(self):
+        usuario = Usuario.objects.create_user(
+            username='morador', password='senha', endereco=Endereco.objects.create(cidade=self.cidade, rua='Rua A'),
+        )
+        self.client.force_login(usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('profile_edit'))
+        self.assertContains(resposta, f'<option value="{self.cidade.pk}" selected>Campinas</option>', html=True)
+        self.assertNotContains(resposta, 'Santos')
+        enderecos = [q for q in consultas.captured_queries if 'usuarios_endereco' in q['sql']]
+        self.assertEqual(len(enderecos), 1)
+
+        resposta = self.client.post(reverse('profile_edit'), {
+            'email': 'morador@exemplo.com', 'rua': 'Rua B', 'cep': '11000000',
+            'estado': self.estado.pk, 'cidade': self.outra_cidade.pk,
+        })
+        self.assertRedirects(resposta, reverse('profile'), fetch_redirect_response=False)
+        usuario.endereco.refresh_from_db()
+        self.assertEqual(usuario.endereco.cidade, self.outra_cidade)
+
+
+class ReferenciaTests(DadosBaseMixin, TestCase):
+    def test_alteracao_de_outro_worker_chega_pela_versao(self):
+        self.assertEqual([e.nome for e in referencia.dados().especialidades], ['Cardiologia'])
+        # Outro processo: grava sem passar pelos sinais deste e incrementa a versão
+        Especialidade.objects.update(nome='Cardiologia Clínica')
+        VersaoCache.objects.filter(nome=referencia.NOME).update(versao=F('versao') + 1)
+        with override_settings(REFERENCIA_INTERVALO=60), self.assertNumQueries(0):
+            self.assertEqual([e.nome for e in referencia.dados().especialidades], ['Cardiologia'])
+        with override_settings(REFERENCIA_INTERVALO=0):
+            self.assertEqual([e.nome for e in referencia.dados().especialidades], ['Cardiologia Clínica'])
+            with self.assertNumQueries(1):  # só a conferência da versão
+                referencia.dados()
+
+    def test_gravacao_invalida_na_hora(self):
+        versao = VersaoCache.objects.get(nome=referencia.NOME).versao
+        referencia.dados()
+        pediatria = Especialidade.objects.create(nome='Pediatria')
+        self.assertEqual(VersaoCache.objects.get(nome=referencia.NOME).versao, versao + 1)
+        self.assertContains(self.client.get(reverse('index')), f'<option value="{pediatria.pk}"')
+        self.assertEqual(
+            self.client.get(reverse('carregar_cidades'), {'estado': self.estado.pk}).json(),
+            [{'id': self.cidade.pk, 'nome': 'Campinas'}, {'id': self.outra_cidade.pk, 'nome': 'Santos'}],
+        )
+        self.outra_cidade.delete()
+        self.assertEqual(len(self.client.get(reverse('carregar_cidades'), {'estado': self.estado.pk}).json()), 1)
+        self.assertEqual(self.client.get(reverse('carregar_cidades'), {'estado': 'x'}).json(), [])
+
+    def test_aquecer(self):
+        referencia._dados = None
+        with mock.patch.object(aquecimento.connections, 'close_all'):  # fecharia a transação do teste
+            tempos = aquecimento.aquecer()
+        self.assertEqual(
+            set(tempos), {'urls', 'traducoes', 'referencia', 'tendencias', 'ceps', 'templates', 'estaticos'},
+        )
+        self.assertNotIn(None, tempos.values())
+        with self.assertNumQueries(0):
+            referencia.dados()
+
+
+def _outro_worker(local, comandos):
+    # Roda num processo filho (fork): abre a própria conexão com o arquivo do cache
+    cache = cache_sqlite.CacheSQLite(local, {})
+    for comando, *argumentos in comandos:
+        getattr(cache, comando)(*argumentos)
+
+
+class CacheSQLiteTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.local = os.path.join(pasta.name, 'cache.sqlite3')
+
+    def novo_cache(self, **opcoes):
+        return cache_sqlite.CacheSQLite(self.local, {'OPTIONS': opcoes})
+
+    def em_outros_processos(self, *comandos, processos=1):
+        contexto = multiprocessing.get_context('fork')
+        filhos = [contexto.Process(target=_outro_worker, args=(self.local, comandos)) for _ in range(processos)]
+        for filho in filhos:
+            filho.start()
+        for filho in filhos:
+            filho.join(30)
+            self.assertEqual(filho.exitcode, 0)
+
+    def test_testes_nao_usam_o_cache_do_projeto(self):
+        local = settings.CACHES['default']['LOCATION']
+        self.assertNotEqual(os.path.dirname(os.path.abspath(local)), str(settings.BASE_DIR))
+        self.assertTrue(os.path.isdir(os.path.dirname(local)))
+
+    def test_ttl_e_lru(self):
+        cache = self.novo_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2, VERIFICAR_A_CADA=1, RESOLUCAO_LRU=0)
+        cache.set('efemera', 1, timeout=-1)
+        self.assertIsNone(cache.get('efemera'))
+        for i in range(10):
+            cache.set(f'k{i}', i)
+            time.sleep(0.002)
+        self.assertEqual(cache.get('k0'), 0)  # k0 vira a mais recente
+        cache.set('k10', 10)  # 11 entradas: sai a metade menos usada
+        presentes = cache.get_many([f'k{i}' for i in range(11)])
+        self.assertIn('k0', presentes)
+        self.assertIn('k10', presentes)
+        self.assertNotIn('k1', presentes)
+        self.assertLessEqual(len(presentes), 6)
+
+    def test_coerencia_entre_processos(self):
+        cache = self.novo_cache()
+        cache.set('nota', 4)
+        chave = cache.chave_namespace('avaliacoes', 'profissional:1')
+        cache.set(chave, 'painel antigo')
+
+        self.em_outros_processos(('set', 'nota', 5), ('invalidar_namespace', 'avaliacoes'))
+        self.assertEqual(cache.get('nota'), 5)
+        self.assertEqual(cache.versao_namespace('avaliacoes'), 2)
+        self.assertIsNone(cache.get(cache.chave_namespace('avaliacoes', 'profissional:1')))
+
+        self.em_outros_processos(('delete', 'nota'))
+        self.assertIsNone(cache.get('nota'))
+
+    def test_incr_atomico_entre_processos(self):
+        cache = self.novo_cache()
+        cache.set('contador', 0)
+        self.em_outros_processos(*[('incr', 'contador')] * 200, processos=4)
+        self.assertEqual(cache.get('contador'), 800)
+        with self.assertRaises(ValueError):
+            cache.incr('inexistente')
+        self.assertTrue(cache.add('inexistente', 'x'))
+        self.assertFalse(cache.add('inexistente', 'y'))
+        self.assertEqual(cache.get('inexistente'), 'x')
+
+
+class CepTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        pasta = tempfile.mkdtemp()
+        self.csv = os.path.join(pasta, 'ceps.csv')
+        self.indice = os.path.join(pasta, 'cep.idx')
+        configuracao = override_settings(CEP_INDICE=self.indice)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def compilar(self, linhas):
+        with open(self.csv, 'w', encoding='utf-8') as arquivo:
+            arquivo.write('cep_inicial;cep_final;uf;cidade;bairro;logradouro\n')
+            arquivo.writelines(';'.join(linha) + '\n' for linha in linhas)
+        saida = StringIO()
+        call_command('compilar_ceps', self.csv, stdout=saida)
+        return saida.getvalue()
+
+    def test_faixa_mais_estreita_vence(self):
+        saida = self.compilar([
+            ('13000000', '13139999', 'SP', 'campinas', '', ''),
+            ('13010000', '13010000', 'SP', 'Campinas', 'Centro', 'Rua Barão de Jaguara'),
+            ('11000000', '11099999', 'sp', 'SANTOS', '', ''),
+            ('20000000', '20099999', 'RJ', 'Rio de Janeiro', '', ''),  # cidade desconhecida
+        ])
+        self.assertIn('1 linhas ignoradas', saida)
+
+        rua = ceps.buscar('13010-000')
+        self.assertEqual(rua['cidade_id'], self.cidade.pk)
+        self.assertEqual(rua['estado_id'], self.estado.pk)
+        self.assertEqual((rua['bairro'], rua['rua'], rua['uf']), ('Centro', 'Rua Barão de Jaguara', 'SP'))
+        # Antes e depois do CEP da rua volta a valer a faixa da cidade
+        for cep in ('13000000', '13009999', '13010001', '13139999'):
+            self.assertEqual(ceps.buscar(cep)['rua'], '', cep)
+            self.assertEqual(ceps.buscar(cep)['cidade'], 'Campinas', cep)
+        self.assertEqual(ceps.buscar('11050000')['cidade_id'], self.outra_cidade.pk)
+        for cep in ('00000000', '12999999', '13140000', '20000000', '99999999', '1301', 'abc'):
+            self.assertIsNone(ceps.buscar(cep), cep)
+
+    def test_rota_nao_consulta_o_banco(self):
+        self.compilar([('13010000', '', 'SP', 'Campinas', 'Centro', 'Rua Barão de Jaguara')])
+        with self.assertNumQueries(0):
+            resposta = self.client.get(reverse('buscar_cep', args=['13010000']))
+        self.assertEqual(resposta.json()['rua'], 'Rua Barão de Jaguara')
+        self.assertIn('max-age=86400', resposta['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('buscar_cep', args=['13010001'])).status_code, 404)
+
+    def test_sem_indice_e_recompilacao(self):
+        self.assertIsNone(ceps.buscar('13010000'))
+        self.assertEqual(self.client.get(reverse('buscar_cep', args=['13010000'])).status_code, 404)
+
+        self.compilar([('13010000', '', 'SP', 'Campinas', '', 'Rua A')])
+        self.assertEqual(ceps.buscar('13010000')['rua'], 'Rua A')
+        # O processo reabre o arquivo quando o comando troca o índice
+        self.compilar([('13010000', '', 'SP', 'Campinas', '', 'Rua B')])
+        self.assertEqual(ceps.buscar('13010000')['rua'], 'Rua B')
+
+    def test_indice_vazio_ou_corrompido_responde_503(self):
+        url = reverse('buscar_cep', args=['13010000'])
+        cabecalho = ceps.CABECALHO.pack(ceps.MAGICO, ceps.MARCA, 1000, 1000).ljust(ceps.INICIO_DADOS, b'\0')
+        for conteudo in (b'', cabecalho):
+            with open(self.indice, 'wb') as arquivo:
+                arquivo.write(conteudo)
+            os.utime(self.indice, ns=(len(conteudo), len(conteudo)))  # assinatura nova mesmo no mesmo instante
+            with self.assertLogs('usuarios.ceps', 'ERROR') as registros:
+                for _ in range(2):
+                    resposta = self.client.get(url)
+                    self.assertEqual(resposta.status_code, 503)
+                    self.assertEqual(resposta.json()['status'], 'error')
+            self.assertEqual(len(registros.output), 1)  # uma vez por arquivo, não por requisição
+
+        self.compilar([('13010000', '', 'SP', 'Campinas', '', 'Rua A')])
+        self.assertEqual(self.client.get(url).json()['rua'], 'Rua A')
+
+
+@override_settings(EXPORTACAO_TAMANHO_LOTE=500)
+class ExportacaoTests(DadosBaseMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.profissional = cls.criar_profissional('dra_export', 3001)
+        cls.outro = cls.criar_profissional('dr_outro', 3002)
+        cls.staff = Usuario.objects.create_user(username='staff', password='senha', is_staff=True)
+
+    def criar_avaliacoes(self, quantidade, profissional=None):
+        profissional = profissional or self.profissional
+        agora = timezone.now()
+        # Um cliente por avaliação (avaliacao_profissional_cliente)
+        inicio = Usuario.objects.count()
+        clientes = Usuario.objects.bulk_create(
+            Usuario(username=f'paciente_export_{inicio + i}') for i in range(quantidade)
+        )
+        servicos = Servico.objects.bulk_create(
+            Servico(profissional=profissional, cliente=cliente, data_agendamento=agora) for cliente in clientes
+        )
+        Avaliacao.objects.bulk_create(
+            Avaliacao(profissional=profissional, cliente=s.cliente, servico=s, nota=4, titulo='Ótimo, "recomendo"',
+                      comentario='linha 1\nlinha 2')
+            for s in servicos
+        )
+
+    def pico_memoria(self, **kwargs):
+        tracemalloc.start()
+        try:
+            total = sum(len(b) for b in exportacao.blocos('avaliacoes', **kwargs))
+            return tracemalloc.get_traced_memory()[1], total
+        finally:
+            tracemalloc.stop()
+
+    def test_memoria_nao_cresce_com_as_linhas(self):
+        self.criar_avaliacoes(2000)
+        pequeno, tamanho_pequeno = self.pico_memoria()
+        self.criar_avaliacoes(18000)
+        grande, tamanho_grande = self.pico_memoria()
+        self.assertGreater(tamanho_grande, 9 * tamanho_pequeno)
+        # 10x mais linhas, praticamente o mesmo pico: um lote do cursor e um bloco de saída
+        self.assertLess(grande, pequeno * 1.5)
+        grande_gzip, _ = self.pico_memoria(formato='jsonl', comprimir=True)
+        self.assertLess(grande_gzip, pequeno * 1.5)
+
+    def test_csv_jsonl_e_gzip(self):
+        self.criar_avaliacoes(3)
+        self.criar_avaliacoes(2, profissional=self.outro)
+        self.client.force_login(self.profissional.usuario)
+        url = reverse('exportar_profissional', args=[self.profissional.pk, 'avaliacoes'])
+
+        resposta = self.client.get(url)
+        self.assertTrue(resposta.streaming)
+        self.assertIn('avaliacoes.csv', resposta['Content-Disposition'])
+        linhas = list(csv.DictReader(StringIO(b''.join(resposta.streaming_content).decode())))
+        self.assertEqual(len(linhas), 3)
+        self.assertEqual(linhas[0]['profissional'], 'dra_export')
+        self.assertEqual(linhas[0]['titulo'], 'Ótimo, "recomendo"')
+        self.assertEqual(linhas[0]['comentario'], 'linha 1\nlinha 2')
+
+        resposta = self.client.get(url, {'formato': 'jsonl', 'gzip': '1'})
+        self.assertEqual(resposta['Content-Type'], 'application/gzip')
+        registros = [json.loads(l) for l in gzip.decompress(b''.join(resposta.streaming_content)).splitlines()]
+        self.assertTrue(all(r['cliente'].startswith('paciente_export_') for r in registros))
+        self.assertEqual(len(registros), 3)
+        self.assertEqual({r['profissional_id'] for r in registros}, {self.profissional.pk})
+
+    def test_permissoes(self):
+        self.client.force_login(self.profissional.usuario)
+        self.assertEqual(self.client.get(reverse('exportar_profissional', args=[self.outro.pk, 'servicos'])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('exportar_dados', args=['servicos'])).status_code, 403)
+        url = reverse('exportar_profissional', args=[self.profissional.pk, 'servicos'])
+        self.assertEqual(self.client.get(url, {'formato': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('exportar_profissional', args=[self.profissional.pk, 'usuarios'])).status_code, 400)
+
+        Comentario.objects.create(avaliacao=self.criar_avaliacao_unica(), autor=self.cliente, texto='Obrigado')
+        self.client.force_login(self.staff)
+        resposta = self.client.get(reverse('exportar_dados', args=['comentarios']), {'formato': 'jsonl'})
+        self.assertEqual(json.loads(b''.join(resposta.streaming_content))['texto'], 'Obrigado')
+
+    def criar_avaliacao_unica(self):
+        self.criar_avaliacoes(1, profissional=self.outro)
+        return Avaliacao.objects.get(profissional=self.outro)
+
+    async def test_asgi_recebe_iterador_assincrono(self):
+        # Um iterador síncrono seria consumido inteiro em memória pelo StreamingHttpResponse
+        client = AsyncClient()
+        await client.aforce_login(self.staff)
+        resposta = await client.get(reverse('exportar_dados', args=['avaliacoes']))
+        self.assertTrue(resposta.is_async)
+        conteudo = b''.join([bloco async for bloco in resposta.streaming_content])
+        self.assertTrue(conteudo.startswith(b'id,profissional_id'))
+
+
+class ArquivoTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.profissional = self.criar_profissional('dra_antiga', 4001)
+        self.antigo = timezone.now() - timedelta(days=800)
+        self.recente = timezone.now() - timedelta(days=10)
+
+    def criar_avaliacao(self, quando, cliente=None):
+        cliente = cliente or Usuario.objects.create_user(username=f'cliente_{Usuario.objects.count()}', password='senha')
+        servico = Servico.objects.create(
+            profissional=self.profissional, cliente=cliente, data_agendamento=quando, status='REALIZADO',
+        )
+        avaliacao = Avaliacao.objects.create(profissional=self.profissional, cliente=cliente, servico=servico, nota=5)
+        Avaliacao.objects.filter(pk=avaliacao.pk).update(data_avaliacao=quando)
+        return avaliacao
+
+    def responder(self, avaliacao, texto, quando):
+        comentario = Comentario.objects.create(avaliacao=avaliacao, autor=self.profissional.usuario, texto=texto)
+        Comentario.objects.filter(pk=comentario.pk).update(data_comentario=quando)
+        return comentario
+
+    def test_move_em_lotes_so_o_que_passou_do_corte(self):
+        antigas = [self.criar_avaliacao(self.antigo) for _ in range(5)]
+        recente = self.criar_avaliacao(self.recente)
+        cancelado = Servico.objects.create(profissional=self.profissional, cliente=self.cliente,
+                                           data_agendamento=self.antigo, status='CANCELADO')
+        agendado = Servico.objects.create(profissional=self.profissional, cliente=self.cliente, data_agendamento=self.antigo)
+        velhas = [self.responder(a, 'Obrigado', self.antigo + timedelta(days=1)) for a in antigas]
+        nova_em_avaliacao_antiga = self.responder(antigas[0], 'Ainda atendo', self.recente)
+        em_avaliacao_recente = self.responder(recente, 'Volte sempre', self.recente)
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(arquivo.arquivar_servicos(arquivo.corte(365), lote=2), 6)
+        self.assertEqual(sum('INSERT INTO usuarios_servicoarquivado' in q['sql'] for q in consultas.captured_queries), 3)
+        self.assertEqual(arquivo.arquivar_comentarios(arquivo.corte(365), lote=2), 5)
+
+        self.assertEqual(
+            set(ServicoArquivado.objects.values_list('pk', flat=True)),
+            {a.servico_id for a in antigas} | {cancelado.pk},
+        )
+        self.assertEqual(set(Servico.objects.values_list('pk', flat=True)), {recente.servico_id, agendado.pk})
+        self.assertEqual(set(ComentarioArquivado.objects.values_list('pk', flat=True)), {c.pk for c in velhas})
+        self.assertEqual(
+            set(Comentario.objects.values_list('pk', flat=True)), {nova_em_avaliacao_antiga.pk, em_avaliacao_recente.pk},
+        )
+        # A avaliação continua apontando para o id do serviço, agora na tabela fria
+        self.assertEqual(Avaliacao.objects.count(), 6)
+        self.assertEqual(ServicoArquivado.objects.get(pk=antigas[0].servico_id).status, 'REALIZADO')
+
+        saida = StringIO()
+        call_command('arquivar', '--estatisticas', stdout=saida)
+        self.assertIn('0 serviços', saida.getvalue())
+        self.assertIn('usuarios_servicoarquivado: 6 linhas', saida.getvalue())
+        self.assertIn('profundidade 1', saida.getvalue())
+
+    def test_paginas_leem_as_respostas_arquivadas(self):
+        avaliacao = self.criar_avaliacao(self.antigo, cliente=self.cliente)
+        self.responder(avaliacao, 'Resposta arquivada', self.antigo + timedelta(days=1))
+        self.responder(avaliacao, 'Resposta nova', self.recente)
+        outra = self.criar_avaliacao(self.antigo)
+        self.responder(outra, 'Outra arquivada', self.antigo)
+        arquivo.arquivar_comentarios(arquivo.corte(365))
+        self.assertEqual(ComentarioArquivado.objects.count(), 2)
+
+        self.client.force_login(self.cliente)
+        detalhes = self.client.get(reverse('profissional_detalhes', args=[self.profissional.pk])).content.decode()
+        perfil = self.client.get(reverse('profile')).content.decode()
+        for pagina in (detalhes, perfil):
+            self.assertLess(pagina.index('Resposta arquivada'), pagina.index('Resposta nova'))
+        self.assertIn('Outra arquivada', detalhes)
+        self.assertNotIn('Outra arquivada', perfil)
+
+    def test_exclusao_e_leituras_derivadas(self):
+        avaliacao = self.criar_avaliacao(self.antigo, cliente=self.cliente)
+        self.responder(avaliacao, 'Obrigado', self.antigo)
+        arquivo.arquivar_servicos(arquivo.corte(365))
+        arquivo.arquivar_comentarios(arquivo.corte(365))
+
+        # Rollups recalculados e exportação continuam vendo o que foi arquivado
+        resumos.reconstruir([self.profissional.pk])
+        self.assertEqual(resumos.painel(self.profissional.pk, meses=60)['total']['respostas'], 1)
+        exportado = b''.join(exportacao.blocos('servicos', profissional_id=self.profissional.pk)).decode()
+        self.assertIn('REALIZADO', exportado)
+
+        self.client.force_login(self.cliente)
+        resposta = self.client.post(reverse('excluir_avaliacao', args=[avaliacao.pk]))
+        self.assertEqual(resposta.json()['status'], 'success')
+        self.assertFalse(Avaliacao.objects.exists())
+        self.assertFalse(ServicoArquivado.objects.exists())
+        self.assertFalse(ComentarioArquivado.objects.exists())
+        # A cascata para as respostas arquivadas também desconta os rollups
+        self.assertEqual(resumos.painel(self.profissional.pk, meses=60)['total']['respostas'], 0)
+        self.assertFalse(ResumoAvaliacoes.objects.exclude(respostas=0).exists())
+
+    def test_autor_exclui_resposta_arquivada(self):
+        avaliacao = self.criar_avaliacao(self.antigo, cliente=self.cliente)
+        comentario = self.responder(avaliacao, 'Obrigado', self.antigo)
+        arquivo.arquivar_comentarios(arquivo.corte(365))
+        resumos.reconstruir([self.profissional.pk])
+        url = reverse('excluir_comentario', args=[comentario.pk])
+
+        self.client.force_login(self.cliente)
+        self.assertEqual(self.client.post(url).status_code, 403)
+        self.client.force_login(self.profissional.usuario)
+        resposta = self.client.post(url)
+        self.assertEqual(resposta.json()['status'], 'success')
+        self.assertFalse(ComentarioArquivado.objects.exists())
+        avaliacao.refresh_from_db()
+        self.assertEqual(avaliacao.total_respostas, 0)
+        self.assertEqual(resumos.painel(self.profissional.pk, meses=60)['total']['respostas'], 0)
+
+
+class RespostasTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.profissional = self.criar_profissional('dr_thread', 4101)
+        self.url = reverse('profissional_detalhes', args=[self.profissional.pk])
+        self.client.force_login(self.cliente)
+        # Autores distintos: um N+1 no autor apareceria como consultas a mais
+        self.autores = [Usuario.objects.create_user(username=f'autor_{i}') for i in range(20)]
+
+    def criar_avaliacoes(self, quantidade):
+        avaliacoes = []
+        for i in range(quantidade):
+            cliente = Usuario.objects.create_user(username=f'paciente_{i}', first_name=f'Paciente {i}')
+            servico = Servico.objects.create(
+                profissional=self.profissional, cliente=cliente, data_agendamento=timezone.now(), status='REALIZADO',
+            )
+            avaliacoes.append(Avaliacao.objects.create(
+                profissional=self.profissional, cliente=cliente, servico=servico, nota=4,
+            ))
+        return avaliacoes
+
+    def responder_em_massa(self, avaliacoes, total):
+        autores = self.autores
+        inicio = timezone.now() - timedelta(days=30)
+        with mock.patch.object(Comentario._meta.get_field('data_comentario'), 'auto_now_add', False):
+            Comentario.objects.bulk_create([
+                Comentario(
+                    avaliacao=avaliacoes[i % len(avaliacoes)], autor=autores[i % len(autores)],
+                    texto=f'Resposta {i}', data_comentario=inicio + timedelta(minutes=i),
+                )
+                for i in range(total)
+            ])
+        respostas.recontar()
+
+    def consultas_da_pagina(self):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(self.url)
+        self.assertEqual(resposta.status_code, 200)
+        return len(consultas.captured_queries), resposta.content.decode()
+
+    @override_settings(RESPOSTAS_PREVIA=3)
+    def test_pagina_com_mil_respostas_custa_o_mesmo_numero_de_consultas(self):
+        avaliacoes = self.criar_avaliacoes(10)
+        self.responder_em_massa(avaliacoes, 10)
+        poucas, _ = self.consultas_da_pagina()
+
+        self.responder_em_massa(avaliacoes, 1000)
+        muitas, pagina = self.consultas_da_pagina()
+        self.assertEqual(muitas, poucas)
+        self.assertEqual(pagina.count('<div class="mb-2" data-comentario-id='), 30)
+        self.assertIn('Ver mais 98 respostas', pagina)
+        # A prévia é a das primeiras respostas de cada thread
+        self.assertIn('>Resposta 0<', pagina)
+        self.assertNotIn('>Resposta 1009<', pagina)
+
+    def test_cursor_percorre_quentes_e_arquivadas_sem_repetir(self):
+        avaliacao, outra = self.criar_avaliacoes(2)
+        self.responder_em_massa([avaliacao, outra], 30)
+        # Metade das respostas vai para a tabela fria; o total da avaliação não muda
+        Comentario.objects.filter(avaliacao=avaliacao).update(data_comentario=F('data_comentario') - timedelta(days=800))
+        Avaliacao.objects.filter(pk=avaliacao.pk).update(data_avaliacao=timezone.now() - timedelta(days=800))
+        self.assertEqual(arquivo.arquivar_comentarios(arquivo.corte(365)), 15)
+        for i in range(3):
+            Comentario.objects.create(avaliacao=avaliacao, autor=self.cliente, texto=f'Nova {i}')
+        avaliacao.refresh_from_db()
+        self.assertEqual(avaliacao.total_respostas, 18)
+
+        [previa] = respostas.previas([avaliacao], quantidade=4)
+        textos = [c.texto for c in previa.lista_respostas]
+        cursor = previa.cursor_respostas
+        while cursor:
+            dados = self.client.get(
+                reverse('respostas_avaliacao', args=[avaliacao.pk]), {'apos': cursor, 'quantidade': 5},
+            ).json()
+            textos += [c['texto'] for c in dados['respostas']]
+            cursor = dados['proximo']
+        esperado = [f'Resposta {i}' for i in range(0, 30, 2)] + ['Nova 0', 'Nova 1', 'Nova 2']
+        self.assertEqual(textos, esperado)
+
+    def test_total_mantido_pelos_sinais(self):
+        [avaliacao] = self.criar_avaliacoes(1)
+        comentarios = [
+            Comentario.objects.create(avaliacao=avaliacao, autor=self.cliente, texto='Oi') for _ in range(3)
+        ]
+        comentarios[0].delete()
+        avaliacao.refresh_from_db()
+        self.assertEqual(avaliacao.total_respostas, 2)
+        Avaliacao.objects.filter(pk=avaliacao.pk).update(total_respostas=0)
+        respostas.recontar([avaliacao.pk])
+        avaliacao.refresh_from_db()
+        self.assertEqual(avaliacao.total_respostas, 2)
+
+        url = reverse('respostas_avaliacao', args=[avaliacao.pk])
+        self.assertEqual(self.client.get(url, {'apos': 'xyz'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('respostas_avaliacao', args=[0])).status_code, 404)
+
+        # As respostas só aparecem para quem está logado, como na página do profissional
+        self.client.logout()
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 302)
+        self.assertTrue(resposta['Location'].startswith(reverse('login')))
+
+
+class AvaliacaoIdempotenteTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        # Cache próprio: o arquivo compartilhado dos workers não entra nos testes
+        configuracao = self.settings(CACHES={'default': {
+            'BACKEND': 'usuarios.cache_sqlite.CacheSQLite', 'LOCATION': os.path.join(pasta.name, 'cache.sqlite3'),
+        }})
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.profissional = self.criar_profissional('dra_unica', 4201)
+        self.url = reverse('adicionar_avaliacao', args=[self.profissional.pk])
+        self.client.force_login(self.cliente)
+
+    def enviar(self, chave=None, **dados):
+        cabecalhos = {'HTTP_IDEMPOTENCY_KEY': chave} if chave else {}
+        return self.client.post(self.url, {'nota': 5, 'comentario': 'Ótima', **dados}, **cabecalhos)
+
+    def test_repeticao_com_a_mesma_chave_devolve_a_resposta_original(self):
+        primeira = self.enviar('envio-1')
+        self.assertEqual(primeira.json()['status'], 'success')
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.enviar('envio-1')
+        self.assertEqual(segunda.status_code, 200)
+        self.assertEqual(segunda.content, primeira.content)
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertFalse(any('usuarios_' in q['sql'] for q in consultas.captured_queries))
+        self.assertEqual(Avaliacao.objects.count(), 1)
+        self.assertEqual(Servico.objects.count(), 1)
+
+        # Mesma chave com outro conteúdo é erro do cliente; outra chave volta a passar pela view
+        self.assertEqual(self.enviar('envio-1', nota=1).status_code, 422)
+        repetida = self.enviar('envio-2')
+        self.assertEqual(repetida.json()['message'], 'Você já avaliou este profissional')
+        self.assertEqual(Servico.objects.count(), 1)
+
+    def test_envio_em_andamento_responde_409(self):
+        chave_cache = 'idempotencia:' + hashlib.sha256(f'{self.cliente.pk}\0{self.url}\0envio-1'.encode()).hexdigest()
+        cache.add(chave_cache, {'impressao': 'outra tentativa'}, 60)
+        self.assertEqual(self.enviar('envio-1').status_code, 409)
+        self.assertFalse(Avaliacao.objects.exists())
+
+    def test_corrida_barrada_pela_restricao_sem_deixar_servico(self):
+        self.enviar()
+        # Simula o outro envio passando pela checagem antes do primeiro gravar
+        with mock.patch.object(QuerySet, 'exists', side_effect=[False, True]):
+            self.assertIsNone(views._criar_avaliacao(self.profissional, self.cliente, {'nota': 4}))
+        self.assertEqual(Avaliacao.objects.count(), 1)
+        self.assertEqual(Servico.objects.count(), 1)
+        with self.assertRaises(IntegrityError):
+            Avaliacao.objects.create(
+                profissional=self.profissional, cliente=self.cliente, servico=Servico.objects.get(), nota=3,
+            )
+
+
+class ModeracaoTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        self.profissionais = [self.criar_profissional(f'dra_mod_{i}', 4300 + i) for i in range(3)]
+        self.spammer = Usuario.objects.create_user(username='spammer')
+        self.legitimas = []
+        for i, profissional in enumerate(self.profissionais):
+            for j in range(3):
+                cliente = Usuario.objects.create_user(username=f'paciente_{i}_{j}')
+                self.legitimas.append(self.avaliar(profissional, cliente, nota=4 + j % 2, titulo='Muito bom'))
+        self.spam = [self.avaliar(p, self.spammer, nota=1, titulo='COMPRE JÁ') for p in self.profissionais[:2]]
+        for avaliacao in self.legitimas[:4]:
+            Comentario.objects.create(avaliacao=avaliacao, autor=self.spammer, texto='Visite meu site')
+            Comentario.objects.create(avaliacao=avaliacao, autor=avaliacao.profissional.usuario, texto='Obrigada!')
+        Comentario.objects.create(avaliacao=self.spam[0], autor=self.cliente, texto='Isto é spam')
+
+    def avaliar(self, profissional, cliente, **dados):
+        servico = Servico.objects.create(
+            profissional=profissional, cliente=cliente, data_agendamento=timezone.now(), status='REALIZADO',
+        )
+        return Avaliacao.objects.create(profissional=profissional, cliente=cliente, servico=servico, **dados)
+
+    def agregados(self):
+        cartoes = sorted(ProfissionalCard.objects.values_list('pk', 'nota_media', 'total_avaliacoes', 'ranking'))
+        linhas = ResumoAvaliacoes.objects.values_list('profissional_id', 'periodo', 'inicio', *resumos.CONTADORES)
+        return (
+            [(pk, media, total) for pk, media, total, _ in cartoes],
+            [ranking for *_, ranking in cartoes],
+            sorted(linha for linha in linhas if any(linha[3:])),
+            sorted(Avaliacao.objects.values_list('pk', 'total_respostas')),
+        )
+
+    def assertAgregadosCorretos(self):
+        # O que a moderação deixou tem de bater com uma reconstrução completa
+        depois = self.agregados()
+        cards.atualizar_notas(Profissional.objects.values('pk'))
+        ranking.recalcular()
+        resumos.reconstruir()
+        respostas.recontar()
+        esperado = self.agregados()
+        self.assertEqual(depois[0], esperado[0])
+        for obtido, correto in zip(depois[1], esperado[1]):
+            self.assertAlmostEqual(obtido, correto, places=6)
+        self.assertEqual(depois[2:], esperado[2:])
+
+    def test_por_autor_apaga_em_lotes_e_corrige_agregados(self):
+        versoes = dict(Profissional.objects.values_list('pk', 'versao'))
+        servicos_spam = [a.servico_id for a in self.spam]
+        relatorio = moderacao.moderar(autores=[self.spammer.pk], lote=2)
+
+        self.assertEqual((relatorio['avaliacoes'], relatorio['comentarios'], relatorio['servicos']), (2, 5, 2))
+        self.assertFalse(Avaliacao.objects.filter(cliente=self.spammer).exists())
+        self.assertFalse(Comentario.objects.filter(autor=self.spammer).exists())
+        self.assertFalse(Servico.objects.filter(pk__in=servicos_spam).exists())
+        self.assertEqual(Avaliacao.objects.count(), 9)
+        self.assertEqual(ProfissionalCard.objects.get(pk=self.profissionais[0].pk).total_avaliacoes, 3)
+        self.assertEqual(Avaliacao.objects.get(pk=self.legitimas[0].pk).total_respostas, 1)
+        # As páginas dos afetados mudam de versão (ETag); a do profissional intocado não
+        novas = dict(Profissional.objects.values_list('pk', 'versao'))
+        self.assertGreater(novas[self.profissionais[0].pk], versoes[self.profissionais[0].pk])
+        self.assertGreater(novas[self.profissionais[1].pk], versoes[self.profissionais[1].pk])
+        self.assertAgregadosCorretos()
+
+    def test_por_texto_e_periodo(self):
+        Avaliacao.objects.filter(pk=self.spam[1].pk).update(data_avaliacao=timezone.now() - timedelta(days=30))
+        relatorio = moderacao.moderar(
+            alvos=('avaliacoes',), texto='compre', desde=timezone.now() - timedelta(days=1),
+        )
+        self.assertEqual(relatorio['avaliacoes'], 1)
+        self.assertEqual(set(Avaliacao.objects.filter(titulo='COMPRE JÁ').values_list('pk', flat=True)),
+                         {self.spam[1].pk})
+        relatorio = moderacao.moderar(alvos=('comentarios',), texto=r'visite\s+meu', regex=True)
+        self.assertEqual(relatorio['comentarios'], 4)
+        self.assertAgregadosCorretos()
+        with self.assertRaises(ValueError):
+            moderacao.moderar(regex=True)
+
+    def test_comando_simular_e_executar(self):
+        saida = StringIO()
+        call_command('moderar', 'tudo', '--autor', 'spammer', '--simular', stdout=saida)
+        self.assertIn('avaliacoes: 2 seriam apagadas', saida.getvalue())
+        self.assertIn('comentarios: 4 seriam apagados', saida.getvalue())
+        self.assertEqual(Avaliacao.objects.count(), 11)
+
+        call_command('moderar', 'tudo', '--autor', 'spammer', '--lote', '1', stdout=saida)
+        self.assertIn('2 avaliações, 5 respostas e 2 serviços apagados', saida.getvalue())
+        self.assertIn('linhas/s', saida.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('moderar', 'tudo', '--autor', 'ninguem')
+
+    def test_acoes_do_admin(self):
+        admin_usuario = Usuario.objects.create_superuser(username='root', password='senha', email='r@exemplo.com')
+        self.client.force_login(admin_usuario)
+        url = reverse('admin:usuarios_comentario_changelist')
+        selecionado = Comentario.objects.filter(autor=self.spammer).first()
+        dados = {'action': 'moderar_autores', '_selected_action': [selecionado.pk], 'index': 0}
+
+        confirmacao = self.client.post(url, dados)
+        self.assertContains(confirmacao, 'spammer')
+        self.assertEqual(Comentario.objects.filter(autor=self.spammer).count(), 4)
+
+        resposta = self.client.post(url, {**dados, 'confirmar': 'sim'}, follow=True)
+        self.assertContains(resposta, '2 avaliações e 5 respostas apagadas')
+        self.assertFalse(Avaliacao.objects.filter(cliente=self.spammer).exists())
+        self.assertFalse(Comentario.objects.filter(autor=self.spammer).exists())
+        self.assertAgregadosCorretos()
+
+    def test_acoes_do_admin_ficam_fora_do_orcamento_das_escritas(self):
+        # Um orçamento estourado no meio dos lotes deixaria parte apagada e os agregados sem correção
+        pools = {
+            'escrita': {'concorrencia': 1, 'fila': 0, 'orcamento': 1e-9},
+            'admin': {'concorrencia': 1, 'fila': 0},
+        }
+        with self.settings(CARGA_ATIVA=True, CARGA_POOLS=pools):
+            admissao.reiniciar()
+            self.addCleanup(admissao.reiniciar)
+            admin_usuario = Usuario.objects.create_superuser(username='root', password='senha', email='r@exemplo.com')
+            self.client.force_login(admin_usuario)
+            resposta = self.client.post(reverse('admin:usuarios_avaliacao_changelist'), {
+                'action': 'moderar_autores', '_selected_action': [self.spam[0].pk], 'index': 0, 'confirmar': 'sim',
+            })
+            self.assertEqual(resposta.status_code, 302)
+            self.assertEqual(admissao.pool('admin').metricas()['aceitas'], 1)
+            self.assertNotIn('escrita', admissao.metricas()['pools'])
+        self.assertFalse(Avaliacao.objects.filter(cliente=self.spammer).exists())
+        self.assertFalse(Comentario.objects.filter(autor=self.spammer).exists())
+        self.assertAgregadosCorretos()
+
+
+class EstaticosTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.raiz = pasta.name
+        configuracao = override_settings(STATIC_ROOT=self.raiz)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_minificar_css_preserva_strings_e_calc(self):
+        css = '/* tema */\n.a:hover , .b > .c {\n  content: "x ;  }";\n  width: calc(1px + 2px);\n}\n/*! licença */'
+        self.assertEqual(
+            estaticos.minificar_css(css),
+            '.a:hover,.b>.c{content:"x ;  }";width:calc(1px + 2px)}/*! licença */',
+        )
+
+    def test_collectstatic_grava_hash_minificado_e_gzip(self):
+        configuracao = self.settings(STORAGES={**settings.STORAGES, 'staticfiles': {
+            'BACKEND': 'usuarios.estaticos.ArmazenamentoEstatico',
+        }})
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        call_command('collectstatic', interactive=False, ignore_patterns=['admin'], verbosity=0)
+        with open(os.path.join(self.raiz, 'staticfiles.json')) as arquivo:
+            nome = json.load(arquivo)['paths']['css/styles.css']
+        self.assertRegex(nome, r'^css/styles\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.raiz, nome), 'rb') as arquivo:
+            minificado = arquivo.read()
+        with open(os.path.join(self.raiz, nome + '.gz'), 'rb') as arquivo:
+            self.assertEqual(gzip.decompress(arquivo.read()), minificado)
+        original = os.path.getsize(os.path.join(settings.BASE_DIR, 'usuarios', 'static', 'css', 'styles.css'))
+        self.assertLess(len(minificado), original)
+        self.assertNotIn(b'\n', minificado)
+        # Imagens já comprimidas não ganham variante
+        self.assertFalse([n for n in os.listdir(os.path.join(self.raiz, 'images')) if n.endswith('.png.gz')])
+
+        # O template passa a apontar para o nome com hash
+        self.assertContains(self.client.get(reverse('index')), f'{settings.STATIC_URL}{nome}')
+        # Um arquivo fora do manifesto é erro, não o nome sem hash
+        with self.assertRaisesMessage(ValueError, 'css/nao-existe.css'):
+            staticfiles_storage.url('css/nao-existe.css')
+
+    def test_middleware_serve_variante_e_cache(self):
+        os.makedirs(os.path.join(self.raiz, 'css'))
+        conteudo = b'.a{color:red}' * 100
+        for nome in ('css/app.0123456789ab.css', 'css/app.css'):
+            with open(os.path.join(self.raiz, nome), 'wb') as arquivo:
+                arquivo.write(conteudo)
+            estaticos.comprimir(os.path.join(self.raiz, nome))
+        url = f'{settings.STATIC_URL}css/app.0123456789ab.css'
+
+        resposta = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta['Content-Encoding'], 'gzip')
+        self.assertEqual(resposta['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(resposta['Vary'], 'Accept-Encoding')
+        self.assertTrue(resposta['Content-Type'].startswith('text/css'))
+        self.assertEqual(gzip.decompress(resposta.content), conteudo)
+        self.assertNotIn('Set-Cookie', resposta)
+
+        resposta = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', resposta)
+        self.assertEqual(resposta.content, conteudo)
+
+        resposta = self.client.get(f'{settings.STATIC_URL}css/app.css')
+        self.assertEqual(resposta['Cache-Control'], 'public, max-age=60')
+        resposta = self.client.get(url, HTTP_IF_MODIFIED_SINCE=resposta['Last-Modified'])
+        self.assertEqual(resposta.status_code, 304)
+
+        self.assertEqual(self.client.get(f'{settings.STATIC_URL}../settings.py').status_code, 404)
+        self.assertEqual(self.client.get(f'{settings.STATIC_URL}css/nao-existe.css').status_code, 404)
+
+    def test_hero_da_pagina_inicial_e_local(self):
+        resposta = self.client.get(reverse('index'))
+        self.assertNotContains(resposta, 'freepik')
+        for largura in (480, 800, 1200):
+            self.assertContains(resposta, f'images/hero-{largura}.webp {largura}w')
+            caminho = os.path.join(settings.BASE_DIR, 'usuarios', 'static', 'images', f'hero-{largura}.webp')
+            with Image.open(caminho) as imagem:
+                self.assertEqual((imagem.format, imagem.width), ('WEBP', largura))
+
+
+class GerarDadosTests(TestCase):
+    def test_gera_volumes_pedidos_sem_avaliacao_duplicada(self):
+        call_command(
+            'gerar_dados', usuarios=60, profissionais=10, avaliacoes=200, comentarios=300,
+            cidades=20, lote=50, sem_disponibilidade=True, stdout=StringIO(),
+        )
+        self.assertEqual(Usuario.objects.count(), 60)
+        self.assertEqual(Profissional.objects.count(), 10)
+        self.assertEqual(Avaliacao.objects.count(), 200)
+        self.assertEqual(Comentario.objects.count(), 300)
+        self.assertEqual(ProfissionalCard.objects.count(), 10)
+        pares = Avaliacao.objects.values_list('profissional_id', 'cliente_id')
+        self.assertEqual(len(set(pares)), 200)
+        self.assertGreater(
+            Avaliacao.objects.dates('data_avaliacao', 'month').count(), 1, 'datas devem ser espalhadas',
+        )
+
+    def test_benchmark_rotas_cobre_todas_as_rotas(self):
+        call_command(
+            'gerar_dados', usuarios=30, profissionais=5, avaliacoes=20, comentarios=20,
+            cidades=5, stdout=StringIO(),
+        )
+        saida = StringIO()
+        call_command('benchmark_rotas', repeticoes=2, aquecimento=0, stdout=saida, stderr=StringIO())
+        rotas = json.loads(saida.getvalue())['rotas']
+        self.assertIn('profissional_detalhes', rotas)
+        self.assertEqual(rotas['adicionar_avaliacao']['metodo'], 'POST')
+        self.assertEqual(rotas['index']['status'], {'200': 2})
+
+
+@override_settings(TENDENCIAS_TOP_K=2, TENDENCIAS_BALDE=3600, TENDENCIAS_JANELA=48, TENDENCIAS_MEIA_VIDA=24 * 3600)
+class TendenciasTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        configuracao = self.settings(CACHES={'default': {
+            'BACKEND': 'usuarios.cache_sqlite.CacheSQLite', 'LOCATION': os.path.join(pasta.name, 'cache.sqlite3'),
+        }})
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        tendencias.esquecer()
+        self.addCleanup(tendencias.esquecer)
+        self.a = self.criar_profissional('dra_ana', 5001)
+        self.b = self.criar_profissional('dr_bruno', 5002)
+        self.c = self.criar_profissional('dra_carla', 5003)
+
+    def atividade(self, profissional, horas_atras, avaliacoes=0, agendamentos=0):
+        AtividadeRecente.objects.create(
+            profissional=profissional, balde=tendencias.balde(time.time() - horas_atras * 3600),
+            avaliacoes=avaliacoes, agendamentos=agendamentos,
+        )
+
+    def test_avaliacao_e_agendamento_contam_depois_do_commit_e_somam_entre_descargas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            servico = Servico.objects.create(
+                profissional=self.a, cliente=self.cliente, data_agendamento=timezone.now(), status='REALIZADO',
+            )
+            Avaliacao.objects.create(profissional=self.a, cliente=self.cliente, servico=servico, nota=5)
+            Servico.objects.create(
+                profissional=self.a, cliente=self.cliente, data_agendamento=timezone.now(), status='AGENDADO',
+            )
+        tendencias.descarregar()
+        tendencias.registrar(self.a.pk, 'avaliacao')
+        self.assertEqual(tendencias.descarregar(), 1)
+        self.assertEqual(tendencias.descarregar(), 0)
+        linha = AtividadeRecente.objects.get(profissional=self.a)
+        self.assertEqual((linha.balde, linha.avaliacoes, linha.agendamentos), (tendencias.balde(), 2, 1))
+
+    def test_top_k_com_decaimento_e_poda_da_janela(self):
+        self.atividade(self.a, 72, avaliacoes=50)  # fora da janela de 48 baldes
+        self.atividade(self.a, 40, avaliacoes=4)  # 4 * 0.5^(40/24) ≈ 1,26
+        self.atividade(self.b, 0, avaliacoes=1, agendamentos=1)  # 2
+        self.atividade(self.c, 1, avaliacoes=1)  # ≈ 0,97
+        self.assertEqual(tendencias.recalcular(), 2)
+        self.assertEqual(
+            list(ProfissionalEmAlta.objects.order_by('posicao').values_list('profissional_id', 'avaliacoes')),
+            [(self.b.pk, 1), (self.a.pk, 4)],
+        )
+        self.assertEqual(AtividadeRecente.objects.filter(profissional=self.a).count(), 1)
+
+    def test_index_serve_o_top_k_da_memoria(self):
+        self.atividade(self.c, 0, agendamentos=3)
+        tendencias.registrar(self.b.pk, 'avaliacao')
+        self.addCleanup(tendencias.descarregar)
+        referencia.dados()
+        # A leitura não descarrega nem recalcula: só a tarefa de fundo (manter) grava
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(tendencias.em_alta(), [])
+        self.assertTrue(all(q['sql'].startswith('SELECT') for q in consultas.captured_queries))
+        tendencias.manter()
+        tendencias.esquecer()
+        self.assertEqual([item['nome'] for item in tendencias.em_alta()], ['dra_carla', 'dr_bruno'])
+        with self.assertNumQueries(2):
+            resposta = self.client.get(reverse('index'))
+        self.assertContains(resposta, 'id="em-alta"')
+        self.assertContains(resposta, '3 agendamentos')
+        self.assertNotContains(self.client.get(reverse('index'), {'nome': 'dr_bruno'}), 'id="em-alta"')
+
+    def test_um_recalculo_por_intervalo_entre_processos(self):
+        with mock.patch.object(tendencias, 'recalcular') as recalcular:
+            tendencias.manter()
+            tendencias.manter()  # outro worker, dentro do mesmo intervalo
+        self.assertEqual(recalcular.call_count, 1)
+
+
+POOLS_TESTE = {
+    'leitura': {'concorrencia': 4, 'fila': 0},
+    'escrita': {'concorrencia': 1, 'fila': 0, 'orcamento': 5},
+    'exportacao': {'concorrencia': 1, 'fila': 0},
+    'admin': {'concorrencia': 1, 'fila': 0},
+}
+
+
+@override_settings(CARGA_ATIVA=True, CARGA_POOLS=POOLS_TESTE)
+class ControleCargaTests(DadosBaseMixin, TestCase):
+    def setUp(self):
+        admissao.reiniciar()
+        self.addCleanup(admissao.reiniciar)
+        self.profissional = self.criar_profissional('dra_carga', 6001)
+        servico = Servico.objects.create(
+            profissional=self.profissional, cliente=self.cliente, data_agendamento=timezone.now(), status='REALIZADO',
+        )
+        self.avaliacao = Avaliacao.objects.create(
+            profissional=self.profissional, cliente=self.cliente, servico=servico, nota=5,
+        )
+        self.client.force_login(self.cliente)
+
+    def test_pool_fila_fifo_com_recusa_por_fila_cheia_e_por_espera(self):
+        pool = admissao.Pool('teste', concorrencia=1, fila=1, espera=5)
+        self.assertTrue(pool.entrar(0))
+        resultado = []
+        thread = threading.Thread(target=lambda: resultado.append(pool.entrar(5)))
+        thread.start()
+        while pool.metricas()['fila'] == 0:
+            time.sleep(0.001)
+        self.assertFalse(pool.entrar(0))  # fila cheia
+        pool.sair(0.5)  # a vaga passa direto para quem esperava
+        thread.join()
+        self.assertEqual(resultado, [True])
+        self.assertFalse(asyncio.run(pool.aentrar(0.01)))  # esperou e desistiu
+        metricas = pool.metricas()
+        self.assertEqual((metricas['ativos'], metricas['aceitas'], metricas['maior_fila']), (1, 2, 1))
+        self.assertEqual(metricas['recusadas'], {'fila_cheia': 1, 'espera': 1, 'orcamento': 0})
+        self.assertEqual(pool.retry_after(), 1)
+
+    @override_settings(CARGA_POOLS={**POOLS_TESTE, 'escrita': {'concorrencia': 0, 'fila': 0}})
+    def test_escritas_lotadas_recebem_503_e_leituras_seguem(self):
+        url = reverse('adicionar_comentario', args=[self.avaliacao.pk])
+        resposta = self.client.post(url, {'texto': 'Obrigado'})
+        self.assertEqual(resposta.status_code, 503)
+        self.assertEqual((resposta['Retry-After'], resposta['X-Carga-Pool']), ('1', 'escrita'))
+        self.assertFalse(Comentario.objects.exists())
+        resposta = self.client.get(reverse('carregar_cidades'), {'estado': self.estado.pk})
+        self.assertEqual(resposta.status_code, 200)
+
+        metricas = self.client.get(reverse('metricas_carga')).json()['pools']
+        self.assertEqual(metricas['escrita']['recusadas']['fila_cheia'], 1)
+        self.assertEqual(metricas['leitura']['aceitas'], 1)
+        self.assertNotIn('metricas_carga', metricas)
+
+    @override_settings(CARGA_ROTAS={'adicionar_comentario': {'pool': 'escrita', 'orcamento': 1e-9}})
+    def test_orcamento_esgotado_vira_503_sem_gravar(self):
+        url = reverse('adicionar_comentario', args=[self.avaliacao.pk])
+        resposta = self.client.post(url, {'texto': 'Obrigado'})
+        self.assertEqual(resposta.status_code, 503)
+        self.assertFalse(Comentario.objects.exists())
+        self.assertEqual(admissao.pool('escrita').metricas()['recusadas']['orcamento'], 1)
+        self.assertEqual(admissao.pool('escrita').metricas()['ativos'], 0)
+        resposta = self.client.get(reverse('respostas_avaliacao', args=[self.avaliacao.pk]))
+        self.assertEqual(resposta.status_code, 200)
+
+    @override_settings(CARGA_ROTAS={'adicionar_comentario': {'pool': 'escrita', 'orcamento': 0.2}})
+    def test_prazo_nao_vale_na_volta_dos_middlewares(self):
+        original = SessionMiddleware.process_response
+
+        def gravar_sessao_devagar(middleware, request, response):
+            time.sleep(0.3)  # a view já respondeu: o prazo acabou aqui
+            Usuario.objects.count()
+            return original(middleware, request, response)
+
+        url = reverse('adicionar_comentario', args=[self.avaliacao.pk])
+        with mock.patch.object(SessionMiddleware, 'process_response', gravar_sessao_devagar):
+            resposta = self.client.post(url, {'texto': 'Obrigado'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(Comentario.objects.exists())
+        self.assertEqual(admissao.pool('escrita').metricas()['recusadas']['orcamento'], 0)
+
+    @override_settings(CARGA_ROTAS={'exportar_dados': {'pool': 'exportacao'}})
+    def test_streaming_segura_a_vaga_ate_o_fim_do_corpo(self):
+        staff = Usuario.objects.create_user(username='staff_carga', password='senha', is_staff=True)
+        self.client.force_login(staff)
+        url = reverse('exportar_dados', args=['avaliacoes'])
+        primeira = self.client.get(url)
+        self.assertEqual(primeira.status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 503)
+        b''.join(primeira.streaming_content)
+        primeira.close()
+        self.assertEqual(self.client.get(url).status_code, 200)
@@ -10,13 +10,22 @@ from .views import (
     UserLoginView,
     UserLogoutView,
     UserRegisterView,
+    buscar_cep,
     carregar_cidades,
     tipo_usuario,
     adicionar_comentario,
+    respostas_avaliacao,
     adicionar_avaliacao,
     enviar_email_agendamento,
     excluir_comentario,
     excluir_avaliacao,
+    proximos_horarios,
+    agendar_horario,
+    cancelar_agendamento,
+    eventos_profissional,
+    exportar_dados,
+    resumo_avaliacoes,
+    metricas_carga,
 )
 
 urlpatterns = [
@@ -30,10 +39,20 @@ urlpatterns = [
     path('perfil/editar/', ProfileEditView.as_view(), name='profile_edit'),
     path('perfil/excluir/', ProfileDeleteView.as_view(), name='profile_delete'),
     path('carregar-cidades/', carregar_cidades, name='carregar_cidades'),
+    path('cep/<str:cep>/', buscar_cep, name='buscar_cep'),
     path('profissional/detalhes/<int:pk>/', ProfissionalDetalhesView.as_view(), name='profissional_detalhes'),
     path('avaliacao/<int:avaliacao_id>/comentar/', adicionar_comentario, name='adicionar_comentario'),
+    path('avaliacao/<int:avaliacao_id>/respostas/', respostas_avaliacao, name='respostas_avaliacao'),
     path('profissional/<int:profissional_id>/avaliar/', adicionar_avaliacao, name='adicionar_avaliacao'),
     path('profissional/<int:profissional_id>/agendar/', enviar_email_agendamento, name='enviar_email_agendamento'),
     path('comentario/<int:comentario_id>/excluir/', excluir_comentario, name='excluir_comentario'),
     path('avaliacao/<int:avaliacao_id>/excluir/', excluir_avaliacao, name='excluir_avaliacao'),
+    path('profissional/<int:pk>/eventos/', eventos_profissional, name='eventos_profissional'),
+    path('horarios/proximos/', proximos_horarios, name='proximos_horarios'),
+    path('profissional/<int:profissional_id>/agendar/horario/', agendar_horario, name='agendar_horario'),
+    path('profissional/<int:profissional_id>/resumo-avaliacoes/', resumo_avaliacoes, name='resumo_avaliacoes'),
+    path('profissional/<int:profissional_id>/exportar/<str:tipo>/', exportar_dados, name='exportar_profissional'),
+    path('exportar/<str:tipo>/', exportar_dados, name='exportar_dados'),
+    path('agendamento/<int:servico_id>/cancelar/', cancelar_agendamento, name='cancelar_agendamento'),
+    path('carga/metricas/', metricas_carga, name='metricas_carga'),
 ]
\ No newline at end of file
@@ -1,17 +1,37 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.paginator import Paginator
-from django.http import Http404, HttpResponseRedirect, JsonResponse
-from django.shortcuts import get_object_or_404, redirect, render
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
 from django.urls import reverse_lazy
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views.generic import CreateView, DeleteView, TemplateView, UpdateView
-from django.views.decorators.http import require_POST
-from datetime import datetime  # Adicionar este import
-from django.core.mail import send_mail
+from django.views.decorators.http import require_GET, require_POST
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.conf import settings
 
+from . import (
+    admissao, arquivo, ceps, disponibilidade, eventos, exportacao, notificacoes, referencia, respostas, resumos,
+    tendencias,
+)
+
 from .forms import CadastroProfissionalForm, UsuarioCreationForm, UsuarioUpdateForm
-from .models import Cidade, Especialidade, Profissional, Usuario, Avaliacao, Comentario, Servico  # Adicionando o import do Servico
+from .idempotencia import idempotente
+from .models import Profissional, ProfissionalCard, ProfissionalSimilar, Usuario, Avaliacao, Comentario, ComentarioArquivado, Servico  # Adicionando o import do Servico
+
+
+ORDENACOES = {
+    'nome': ('nome', 'profissional_id'),
+    'avaliacao': ('-ranking', 'profissional_id'),
+}
 
 
 class IndexView(TemplateView):
@@ -27,11 +47,13 @@ class IndexView(TemplateView):
         # Novo: ordenação
         ordem = self.request.GET.get('ordem', 'nome')
         
-        profissionais = Profissional.objects.all()
+        # Lê só do read model: uma tabela, sem joins nem agregações por card.
+        # Cada ordenação tem índice próprio (card_nome / card_ranking, e as variantes por especialidade)
+        profissionais = ProfissionalCard.objects.order_by(*ORDENACOES.get(ordem, ORDENACOES['nome']))
         
         # Aplicar filtros
         if nome:
-            profissionais = profissionais.filter(usuario__username__icontains=nome)
+            profissionais = profissionais.filter(busca__icontains=nome)
         if especialidade:
             profissionais = profissionais.filter(especialidade_id=especialidade)
         
@@ -45,12 +67,18 @@ class IndexView(TemplateView):
         except Exception:
             raise Http404("Página não encontrada")
         
+        # Só a janela de ±2 páginas em volta da atual; iterar page_range inteiro no template
+        # custa milhares de avaliações de {% if %} com muitos profissionais
+        paginas = range(max(1, page_obj.number - 2), min(paginator.num_pages, page_obj.number + 2) + 1)
+
         context.update({
             "page_obj": page_obj,
+            "paginas": paginas,
             "profissionais": page_obj.object_list,
-            "especialidades": Especialidade.objects.all(),
+            "especialidades": referencia.dados().especialidades,
             "is_paginated": page_obj.has_other_pages(),
-            
+            # Top-K em memória (usuarios/tendencias.py); só na vitrine, sem filtros
+            "em_alta": [] if nome or especialidade else tendencias.em_alta(),
         })
         return context
 
@@ -97,6 +125,17 @@ class ProfileView(LoginRequiredMixin, TemplateView):
     template_name = 'usuarios/profile.html'
     login_url = 'login'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        profissional = getattr(self.request.user, 'profissional', None)
+        if profissional is not None:
+            # Só lê os rollups: o custo não depende de quantas avaliações o profissional tem
+            context['painel'] = resumos.painel(profissional.id)
+        context['minhas_avaliacoes'] = respostas.previas(
+            self.request.user.avaliacao_set.select_related('profissional__usuario')
+        )
+        return context
+
 class ProfileEditView(LoginRequiredMixin, UpdateView):
     model = Usuario
     form_class = UsuarioUpdateForm
@@ -135,34 +174,108 @@ def tipo_usuario(request):
     return render(request, 'usuarios/selecao_usuario.html')
 
 
-def carregar_cidades(request):
-    estado_id = request.GET.get('estado')
-    cidades = Cidade.objects.filter(estado_id=estado_id).values('id', 'nome')
-    return JsonResponse(list(cidades), safe=False)
+async def carregar_cidades(request):
+    try:
+        estado_id = int(request.GET.get('estado'))
+    except (TypeError, ValueError):
+        return JsonResponse([], safe=False)
+    dados = await referencia.adados()
+    return JsonResponse(dados.cidades_por_estado.get(estado_id, []), safe=False)
+
+
+async def buscar_cep(request, cep):
+    # Só o índice mapeado em memória (usuarios/ceps.py): nenhuma consulta ao banco
+    try:
+        endereco = ceps.buscar(cep)
+    except ceps.IndiceCepInvalido:
+        # Arquivo vazio ou corrompido: ceps.indice() já registrou o erro uma vez
+        return JsonResponse({'status': 'error', 'message': 'Consulta de CEP indisponível'}, status=503)
+    if endereco is None:
+        return JsonResponse({'status': 'error', 'message': 'CEP não encontrado'}, status=404)
+    resposta = JsonResponse(endereco)
+    patch_cache_control(resposta, public=True, max_age=86400)
+    return resposta
 
 class ProfissionalDetalhesView(LoginRequiredMixin, TemplateView):
     template_name = 'usuarios/profissional_detalhes.html'
     login_url = 'login'
 
+    def get_validadores(self):
+        # Uma consulta leve à linha do profissional, sem tocar avaliações nem renderizar nada
+        dados = Profissional.objects.filter(pk=self.kwargs.get('pk')).values('versao', 'atualizado_em').first()
+        if dados is None:
+            raise Http404("Profissional não encontrado")
+        # A página também depende de quem está vendo (botões de excluir, cabeçalho, token CSRF)
+        csrf = hashlib.sha256(self.request.META.get('CSRF_COOKIE', '').encode()).hexdigest()[:8]
+        etag = f'"{self.kwargs.get("pk")}-{dados["versao"]}-{self.request.user.pk}-{csrf}"'
+        last_modified = dados['atualizado_em']
+        if self.request.user.last_login and self.request.user.last_login > last_modified:
+            last_modified = self.request.user.last_login
+        return etag, last_modified
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validadores()
+        resposta = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+        if resposta is None:
+            resposta = super().get(request, *args, **kwargs)
+        resposta['ETag'] = etag
+        resposta['Last-Modified'] = http_date(int(last_modified.timestamp()))
+        # O navegador guarda a página mas sempre revalida (barato: 304 sem renderizar)
+        patch_cache_control(resposta, private=True, no_cache=True)
+        return resposta
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Busca o profissional pelo ID fornecido na URL
         profissional_id = self.kwargs.get('pk')  # Assumindo que o ID é passado como parte da URL
         context['profissional'] = get_object_or_404(Profissional, pk=profissional_id)
+        # Só as primeiras respostas de cada avaliação (usuarios/respostas.py); o resto vem sob demanda
+        context['avaliacoes'] = respostas.previas(context['profissional'].avaliacoes.select_related('cliente'))
+        # Pré-calculado por `calcular_similares`: uma busca pelo índice (profissional, posicao)
+        context['similares'] = ProfissionalSimilar.objects.filter(
+            profissional_id=profissional_id,
+        ).select_related('similar').order_by('posicao')
         return context
 
+# As views JSON de escrita são assíncronas: sob ASGI (core/asgi.py) a espera pelo
+# SQLite não prende uma thread do servidor. As partes que precisam de transação
+# ficam em funções síncronas chamadas via sync_to_async.
+def _criar_comentario(avaliacao, autor, texto):
+    with transaction.atomic():
+        comentario = Comentario.objects.create(
+            avaliacao=avaliacao,
+            autor=autor,
+            texto=texto
+        )
+        notificacoes.notificar_resposta(comentario)
+    return comentario
+
+@login_required(login_url='login')
+@require_GET
+def respostas_avaliacao(request, avaliacao_id):
+    # Continuação de uma thread a partir do cursor da última resposta mostrada
+    if not Avaliacao.objects.filter(id=avaliacao_id).exists():
+        return JsonResponse({'status': 'error', 'message': 'Avaliação não encontrada'}, status=404)
+    try:
+        quantidade = min(max(int(request.GET.get('quantidade', 20)), 1), 100)
+        lista, proximo = respostas.pagina(avaliacao_id, request.GET.get('apos'), quantidade)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Parâmetros inválidos'}, status=400)
+    return JsonResponse({
+        'status': 'success',
+        'respostas': [eventos.dados_comentario(comentario) for comentario in lista],
+        'proximo': proximo,
+    })
+
 @require_POST
-def adicionar_comentario(request, avaliacao_id):
+async def adicionar_comentario(request, avaliacao_id):
     try:
-        avaliacao = Avaliacao.objects.get(id=avaliacao_id)
+        user = await request.auser()
+        avaliacao = await Avaliacao.objects.select_related('cliente').aget(id=avaliacao_id)
         texto = request.POST.get('texto')
         
         if texto:
-            comentario = Comentario.objects.create(
-                avaliacao=avaliacao,
-                autor=request.user,
-                texto=texto
-            )
+            comentario = await sync_to_async(_criar_comentario)(avaliacao, user, texto)
             
             return JsonResponse({
                 'status': 'success',
@@ -173,39 +286,57 @@ def adicionar_comentario(request, avaliacao_id):
                 }
             })
     except Exception as e:
+        if admissao.esgotou(e):
+            raise  # o ControleCargaMiddleware responde 503
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
+def _criar_avaliacao(profissional, cliente, dados):
+    # Serviço, avaliação, agregados (sinais de Avaliacao) e notificação numa transação só: ou entra
+    # tudo ou nada. Devolve None se o cliente já avaliou este profissional.
+    try:
+        with transaction.atomic():
+            if Avaliacao.objects.filter(profissional=profissional, cliente=cliente).exists():
+                return None
+            # Criar serviço automaticamente
+            servico = Servico.objects.create(
+                profissional=profissional,
+                cliente=cliente,
+                data_agendamento=timezone.now(),
+                data_realizacao=timezone.now(),
+                status='REALIZADO'
+            )
+
+            # Criar avaliação
+            avaliacao = Avaliacao.objects.create(
+                profissional=profissional,
+                cliente=cliente,
+                servico=servico,  # Associando o serviço criado
+                nota=dados.get('nota'),
+                titulo=dados.get('titulo', ''),
+                comentario=dados.get('comentario', ''),
+                recomenda=dados.get('recomenda', 'true') == 'true'
+            )
+            notificacoes.notificar_avaliacao(avaliacao)
+    except IntegrityError:
+        # Corrida com outro envio do mesmo cliente: a restrição única barrou e o serviço foi desfeito
+        if Avaliacao.objects.filter(profissional=profissional, cliente=cliente).exists():
+            return None
+        raise
+    return avaliacao
+
 @require_POST
-def adicionar_avaliacao(request, profissional_id):
+@idempotente
+async def adicionar_avaliacao(request, profissional_id):
     try:
-        profissional = get_object_or_404(Profissional, id=profissional_id)
-        
-        # Verificar se o usuário já avaliou este profissional
-        if Avaliacao.objects.filter(profissional=profissional, cliente=request.user).exists():
+        user = await request.auser()
+        profissional = await aget_object_or_404(Profissional.objects.select_related('usuario'), id=profissional_id)
+
+        avaliacao = await sync_to_async(_criar_avaliacao)(profissional, user, request.POST)
+        if avaliacao is None:
             return JsonResponse({
                 'status': 'error',
                 'message': 'Você já avaliou este profissional'
             }, status=400)
-
-        # Criar serviço automaticamente
-        servico = Servico.objects.create(
-            profissional=profissional,
-            cliente=request.user,
-            data_agendamento=datetime.now(),
-            data_realizacao=datetime.now(),
-            status='REALIZADO'
-        )
-
-        # Criar avaliação
-        avaliacao = Avaliacao.objects.create(
-            profissional=profissional,
-            cliente=request.user,
-            servico=servico,  # Associando o serviço criado
-            nota=request.POST.get('nota'),
-            titulo=request.POST.get('titulo', ''),
-            comentario=request.POST.get('comentario', ''),
-            recomenda=request.POST.get('recomenda', 'true') == 'true'
-        )
         
         return JsonResponse({
             'status': 'success',
@@ -220,6 +351,8 @@ def adicionar_avaliacao(request, profissional_id):
             }
         })
     except Exception as e:
+        if admissao.esgotou(e):
+            raise  # o ControleCargaMiddleware responde 503
         print(f"Erro ao adicionar avaliação: {str(e)}")  # Para debug
         return JsonResponse({
             'status': 'error',
@@ -227,11 +360,18 @@ def adicionar_avaliacao(request, profissional_id):
         }, status=400)
 
 @require_POST
-def excluir_comentario(request, comentario_id):
+async def excluir_comentario(request, comentario_id):
     try:
-        comentario = get_object_or_404(Comentario, id=comentario_id)
-        if request.user == comentario.autor:
-            comentario.delete()
+        user = await request.auser()
+        # A resposta pode já ter ido para a tabela fria (arquivo.arquivar_comentarios)
+        comentario = (
+            await Comentario.objects.filter(id=comentario_id).afirst()
+            or await ComentarioArquivado.objects.filter(id=comentario_id).afirst()
+        )
+        if comentario is None:
+            raise Http404("Comentário não encontrado")
+        if user.pk == comentario.autor_id:
+            await comentario.adelete()
             return JsonResponse({'status': 'success', 'message': 'Comentário excluído com sucesso!'})
         return JsonResponse({
             'status': 'error',
@@ -243,17 +383,21 @@ def excluir_comentario(request, comentario_id):
             'message': str(e)
         }, status=400)
 
+def _excluir_avaliacao(avaliacao):
+    with transaction.atomic():
+        # Exclui o serviço associado também (pode já estar arquivado)
+        arquivo.excluir_servico(avaliacao.servico_id)
+        avaliacao.delete()
+
 @require_POST
-def excluir_avaliacao(request, avaliacao_id):
+async def excluir_avaliacao(request, avaliacao_id):
     try:
-        avaliacao = get_object_or_404(Avaliacao, id=avaliacao_id)
+        user = await request.auser()
+        avaliacao = await aget_object_or_404(Avaliacao, id=avaliacao_id)
         
         # Verifica se o usuário é o dono da avaliação
-        if request.user == avaliacao.cliente:
-            # Exclui o serviço associado também
-            if avaliacao.servico:
-                avaliacao.servico.delete()
-            avaliacao.delete()
+        if user.pk == avaliacao.cliente_id:
+            await sync_to_async(_excluir_avaliacao)(avaliacao)
             return JsonResponse({
                 'status': 'success',
                 'message': 'Avaliação excluída com sucesso!'
@@ -270,7 +414,144 @@ def excluir_avaliacao(request, avaliacao_id):
             'message': 'Erro ao excluir avaliação'
         }, status=400)
 
+async def eventos_profissional(request, pk):
+    # Stream SSE com avaliações e respostas novas/excluídas; só faz sentido sob ASGI,
+    # onde cada conexão ociosa custa uma corrotina em vez de uma thread.
+    if not isinstance(request, ASGIRequest):
+        # 204 faz o EventSource parar de tentar reconectar
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=403)
+    if not await Profissional.objects.filter(pk=pk).aexists():
+        raise Http404("Profissional não encontrado")
+
+    canal = eventos.canal_profissional(pk)
+    assinatura = eventos.central.assinar(canal)
+    resposta = StreamingHttpResponse(eventos.stream(canal, assinatura), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
+
 def enviar_email_agendamento(request, profissional_id):
     profissional = get_object_or_404(Profissional, id=profissional_id)
     gmail_link = f"https://mail.google.com/mail/?view=cm&fs=1&to={profissional.usuario.email}&su=Solicitação de Agendamento&body=Olá Dr(a). {profissional.usuario.get_full_name()}, gostaria de agendar uma consulta."
-    return JsonResponse({'status': 'success', 'gmail_link': gmail_link})
\ No newline at end of file
+    return JsonResponse({'status': 'success', 'gmail_link': gmail_link})
+
+@require_GET
+def proximos_horarios(request):
+    try:
+        especialidade_id = int(request.GET.get('especialidade'))
+        cidade_id = int(request.GET['cidade']) if request.GET.get('cidade') else None
+        quantidade = min(max(int(request.GET.get('quantidade', 10)), 1), 50)
+    except (TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'Parâmetros inválidos'}, status=400)
+
+    horarios = disponibilidade.proximos_horarios(especialidade_id, cidade_id, quantidade)
+    nomes = dict(
+        (p.id, p.usuario.get_full_name())
+        for p in Profissional.objects.filter(id__in={p for _, p in horarios}).select_related('usuario')
+    )
+    return JsonResponse({
+        'status': 'success',
+        'horarios': [
+            {
+                'profissional_id': profissional_id,
+                'profissional': nomes.get(profissional_id, ''),
+                'horario': timezone.localtime(horario).isoformat(),
+            }
+            for horario, profissional_id in horarios
+        ],
+    })
+
+@login_required(login_url='login')
+@require_GET
+def resumo_avaliacoes(request, profissional_id):
+    profissional = get_object_or_404(Profissional, id=profissional_id)
+    if profissional.usuario_id != request.user.id and not request.user.is_staff:
+        return JsonResponse({'status': 'error', 'message': 'Sem permissão'}, status=403)
+    try:
+        meses = min(max(int(request.GET.get('meses', 12)), 1), 60)
+        dias = min(max(int(request.GET.get('dias', 30)), 1), resumos.dias_diarios())
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Parâmetros inválidos'}, status=400)
+    return JsonResponse({'status': 'success', **resumos.painel(profissional.id, meses=meses, dias=dias)})
+
+@login_required(login_url='login')
+@require_GET
+def exportar_dados(request, tipo, profissional_id=None):
+    # Sem profissional_id exporta a tabela inteira (só staff)
+    if profissional_id is None:
+        if not request.user.is_staff:
+            return JsonResponse({'status': 'error', 'message': 'Sem permissão'}, status=403)
+    else:
+        profissional = get_object_or_404(Profissional, id=profissional_id)
+        if profissional.usuario_id != request.user.id and not request.user.is_staff:
+            return JsonResponse({'status': 'error', 'message': 'Sem permissão'}, status=403)
+    formato = request.GET.get('formato', 'csv')
+    if tipo not in exportacao.TIPOS or formato not in exportacao.FORMATOS:
+        return JsonResponse({'status': 'error', 'message': 'Parâmetros inválidos'}, status=400)
+    comprimir = request.GET.get('gzip') == '1'
+
+    conteudo = exportacao.blocos(tipo, formato, profissional_id, comprimir)
+    if isinstance(request, ASGIRequest):
+        conteudo = exportacao.blocos_assincronos(conteudo)
+    tipo_conteudo = 'application/gzip' if comprimir else f'{exportacao.FORMATOS[formato]}; charset=utf-8'
+    resposta = StreamingHttpResponse(conteudo, content_type=tipo_conteudo)
+    resposta['Content-Disposition'] = f'attachment; filename="{exportacao.nome_arquivo(tipo, formato, comprimir)}"'
+    patch_cache_control(resposta, private=True, no_cache=True)
+    return resposta
+
+@login_required(login_url='login')
+@require_POST
+def agendar_horario(request, profissional_id):
+    profissional = get_object_or_404(Profissional, id=profissional_id)
+    horario = parse_datetime(request.POST.get('horario', ''))
+    if horario is None:
+        return JsonResponse({'status': 'error', 'message': 'Horário inválido'}, status=400)
+    if timezone.is_naive(horario):
+        horario = timezone.make_aware(horario)
+
+    with transaction.atomic():
+        servico = Servico.objects.create(
+            profissional=profissional,
+            cliente=request.user,
+            data_agendamento=horario,
+            status='AGENDADO',
+        )
+        # O sinal de Servico reserva o bit com um UPDATE condicional; se outro cliente já levou
+        # o horário, desfaz o serviço criado
+        if not servico.horario_reservado:
+            transaction.set_rollback(True)
+            return JsonResponse({'status': 'error', 'message': 'Horário indisponível'}, status=409)
+        notificacoes.notificar_agendamento(servico)
+
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Consulta agendada com sucesso!',
+        'servico_id': servico.id,
+    })
+
+@login_required(login_url='login')
+@require_POST
+def cancelar_agendamento(request, servico_id):
+    servico = get_object_or_404(Servico.objects.select_related('profissional'), id=servico_id)
+    if request.user.id not in (servico.cliente_id, servico.profissional.usuario_id):
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Você não tem permissão para cancelar este agendamento'
+        }, status=403)
+    if servico.status != 'AGENDADO':
+        return JsonResponse({'status': 'error', 'message': 'Este agendamento não pode ser cancelado'}, status=400)
+
+    servico.status = 'CANCELADO'
+    servico.save(update_fields=['status'])
+    return JsonResponse({'status': 'success', 'message': 'Agendamento cancelado com sucesso!'})
+
+
+@require_GET
+def metricas_carga(request):
+    # Métricas do worker que atendeu (cada processo tem os próprios pools)
+    if request.META.get('REMOTE_ADDR') not in settings.CARGA_METRICAS_IPS and not request.user.is_staff:
+        return JsonResponse({'status': 'error', 'message': 'Sem permissão'}, status=403)
+    return JsonResponse(admissao.metricas())